@@ -0,0 +1,229 @@
+"""
+Read COPA3 values straight from a fillable PDF's AcroForm fields.
+
+When a seller fills in the form in a PDF editor, every value is stored in the
+form's field dictionary. Reading those values skips layout extraction and the
+text regexes in process_data, and keeps the exact amounts, including 0.00
+amounts that the text path misses.
+
+Field names differ between versions of the form. Each name is reduced to its
+last path component, lowercased, and stripped of everything except letters and
+digits ("form1[0].page1[0].Total_#_of_units[0]" becomes "totalofunits"). It is
+then matched against the patterns in COPA3_FIELDS. Names that match nothing are
+ignored. If too few fields are recognised, the caller falls back to reading the
+page text.
+
+Plenty of fillable PDFs that aren't COPA3 forms have an address and an asking
+price, such as offering memos and LOIs. Field values are only used when the
+page text has the COPA3 markers, or when a field name or value names the form
+itself (see COPA3_MARKER_RE).
+
+A form whose fields hold every value in COMPLETE_COPA3_FIELDS, and whose markers
+turn up in the field names or the raw content streams, is parsed from the
+fields alone, with no layout extraction. For a partly filled form the caller
+merges the field values over the values read from the page text, which
+supplies what the fields don't map.
+"""
+import re
+from typing import NamedTuple, Optional
+from PyPDF2 import PdfReader
+from extract_text import as_binary_stream
+from prescreen import has_form_fields, shows_markers
+from process_data import extract_address
+
+# (output field, kind, pattern over the normalized field name); the first matching pattern wins
+COPA3_FIELDS = [
+    ('property_address', 'text', r'^(property)?address$|^propertyaddress'),
+    ('street', 'text', r'^(property)?street(address)?$'),
+    ('city', 'text', r'^(property)?city$'),
+    ('zip_code', 'text', r'^(property)?zip(code)?$'),
+    ('seller_name', 'text', r'^seller(name)?$'),
+
+    ('total_units', 'int', r'^total(numberof|noof|of)?units$'),
+    ('residential_units', 'int', r'^(numberof|noof|of)?residential(units)?$'),
+    ('vacant_residential', 'int', r'^(currently)?vacantresidential|^residential(units)?(currently)?vacant'),
+    ('commercial_units', 'int', r'^(numberof|noof|of)?commercial(officeretail)?(units)?$'),
+    ('vacant_commercial', 'int', r'^(currently)?vacantcommercial|^commercial(officeretail)?(units)?(currently)?vacant'),
+    ('sqft', 'int', r'^(building)?(sqft|squarefe+t|squarefootage)$'),
+    ('parking_spaces', 'int', r'^(numberof|noof|of)?parking(spaces)?$'),
+    ('is_vacant_lot', 'check', r'vacantlot'),
+    ('soft_story_yes', 'check', r'^softstory\w*yes$'),
+    ('soft_story_no', 'check', r'^softstory\w*no$'),
+    ('soft_story_required', 'yesno', r'^softstory'),
+
+    ('asking_price', 'number', r'^askingprice'),
+    ('total_rents', 'number', r'^totalrents'),
+    ('other_income', 'number', r'^otherincome'),
+    ('total_monthly_income', 'number', r'^totalmonthlyincome'),
+    ('total_annual_income', 'number', r'^totalannualincome'),
+    ('annual_expenses', 'number', r'^annualexpenses'),
+    ('management_amount', 'number', r'^management(amount|fee)?$'),
+    ('insurance', 'number', r'^insurance(amount)?$'),
+    ('utilities', 'number', r'^utilities(amount)?$'),
+    ('maintenance', 'number', r'^maintenance(amount)?$'),
+    ('other_expenses', 'number', r'^otherexpenses'),
+]
+
+COPA3_FIELD_PATTERNS = [(field, kind, re.compile(pattern)) for field, kind, pattern in COPA3_FIELDS]
+
+PROPERTY_FIELDS = ('total_units', 'residential_units', 'vacant_residential', 'commercial_units',
+                   'vacant_commercial', 'sqft', 'parking_spaces')
+FINANCIAL_FIELDS = ('asking_price', 'total_rents', 'other_income', 'total_monthly_income', 'total_annual_income',
+                    'annual_expenses', 'management_amount', 'insurance', 'utilities', 'maintenance', 'other_expenses')
+
+# Values besides the address needed before the fields are trusted over the page text
+MIN_COPA3_FIELDS = 2
+# Values besides the address a form needs to be parsed from its fields alone, without the page text
+COMPLETE_COPA3_FIELDS = ('total_units', 'residential_units', 'commercial_units', 'asking_price')
+
+# A field name or value naming the form itself, once lowercased and stripped to letters and digits
+COPA3_MARKER_RE = re.compile(r'copa3|noticeofintenttosell')
+
+INDEX_SUFFIX_RE = re.compile(r'\[\d+\]$')
+NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+AMOUNT_RE = re.compile(r'-?[\d,]*\.?\d+')
+UNCHECKED = {'', '/Off', 'Off'}
+
+class Copa3Fields(NamedTuple):
+    address: dict
+    property_info: dict
+    seller_info: dict
+    financial_info: dict
+    # Whether the field set (or, for a complete form, the raw page text) identifies the PDF as a COPA3 form
+    marked: bool
+    # Whether the fields hold every value in COMPLETE_COPA3_FIELDS
+    complete: bool
+
+def normalize_field_name(name):
+    """Last path component of a field name, lowercased, letters and digits only."""
+    last = name.rsplit('.', 1)[-1]
+    return NON_ALNUM_RE.sub('', INDEX_SUFFIX_RE.sub('', last).lower())
+
+def _number(value):
+    match = AMOUNT_RE.search(value.replace('$', ''))
+    return float(match.group().replace(',', '')) if match else None
+
+def _convert(kind, value):
+    """Convert a raw field value to the output type, or None if it's blank or unreadable."""
+    value = str(value).strip()
+    if kind == 'check':
+        return value not in UNCHECKED
+    if kind == 'yesno':
+        value = value.lstrip('/').lower()
+        return True if value in ('yes', 'y', 'true') else False if value in ('no', 'n', 'false') else None
+    if not value:
+        return None
+    if kind == 'text':
+        return value
+    number = _number(value)
+    if number is None:
+        return None
+    return int(number) if kind == 'int' else number
+
+def read_fields(pdf_source):
+    """
+    Return {normalized field name: value} for every filled field in the PDF's
+    AcroForm, or {} if it has none. pdf_source may be a path, bytes or a binary file-like object.
+    """
+    return field_values(PdfReader(as_binary_stream(pdf_source), strict=False).get_fields() or {})
+
+def field_values(fields):
+    """{normalized field name: value} for the filled fields in PdfReader.get_fields() output."""
+    values = {}
+    for name, field in fields.items():
+        value = field.get('/V')
+        if value is not None and not isinstance(value, (list, dict)):
+            values.setdefault(normalize_field_name(name), value)
+    return values
+
+def map_copa3_fields(values):
+    """Map normalized field names to COPA3 output fields, keeping the first usable value for each."""
+    mapped = {}
+    for name, raw in values.items():
+        for field, kind, pattern in COPA3_FIELD_PATTERNS:
+            if pattern.search(name):
+                value = _convert(kind, raw)
+                if value is not None and field not in mapped:
+                    mapped[field] = value
+                break
+    return mapped
+
+def has_copa3_marker(fields):
+    """True if a field's full name (any path component) or text value names the COPA3 form."""
+    return any(COPA3_MARKER_RE.search(NON_ALNUM_RE.sub('', name.lower())) or
+               COPA3_MARKER_RE.search(NON_ALNUM_RE.sub('', str(field.get('/V', '')).lower()))
+               for name, field in fields.items())
+
+def _address_text(mapped):
+    """Address fields rejoined in the 'Property Address: ...' form extract_address reads."""
+    if 'property_address' in mapped:
+        address = mapped['property_address']
+        # A bare street line; add the city and zip from their own fields if there are any
+        if not re.search(r'\d{5}\s*$', address):
+            address = ', '.join(part for part in (address, mapped.get('city'), mapped.get('zip_code')) if part)
+    else:
+        address = ', '.join(part for part in (mapped.get('street'), mapped.get('city'), mapped.get('zip_code')) if part)
+    if address and not re.search(r',\s*[A-Z]{2}\s*\d{5}', address) and mapped.get('zip_code'):
+        address = re.sub(r',\s*(\d{5}(?:-\d{4})?)$', r', CA \1', address)
+    return f"Property Address: {address}" if address else ''
+
+def read_copa3_fields(pdf_source, page_markers=None) -> Optional[Copa3Fields]:
+    """
+    Read a fillable COPA3 form's values from its AcroForm fields.
+    Returns Copa3Fields, with the four value dicts shaped like the process_data
+    extract_* results and holding only the values the fields set. Returns None
+    when the PDF has no AcroForm or too few of its fields map to COPA3 values;
+    a PDF without one costs only the read of its catalog.
+    The fields alone don't prove the PDF is a COPA3 form; see the module docstring.
+    For a complete form whose fields don't name it, the pages' raw content
+    streams are checked for page_markers ({form_type: [marker, ...]}, as for
+    prescreen.screen_pdf), so it can be trusted without layout extraction.
+    """
+    try:
+        reader = PdfReader(as_binary_stream(pdf_source), strict=False)
+        if not has_form_fields(reader):
+            return None
+        fields = reader.get_fields() or {}
+    except Exception:
+        # Unreadable here means unreadable for the text path too; let it report the error
+        return None
+    values = field_values(fields)
+    if not values:
+        return None
+
+    mapped = map_copa3_fields(values)
+    address = extract_address(_address_text(mapped))
+    recognised = [field for field in PROPERTY_FIELDS + FINANCIAL_FIELDS if field in mapped]
+    if not address or len(recognised) < MIN_COPA3_FIELDS:
+        return None
+
+    property_info = {field: mapped[field] for field in PROPERTY_FIELDS if field in mapped}
+    if 'is_vacant_lot' in mapped:
+        property_info['is_vacant_lot'] = mapped['is_vacant_lot']
+    if mapped.get('soft_story_yes'):
+        property_info['soft_story_required'] = True
+    elif mapped.get('soft_story_no'):
+        property_info['soft_story_required'] = False
+    elif 'soft_story_required' in mapped:
+        property_info['soft_story_required'] = mapped['soft_story_required']
+
+    seller_info = {'seller_name': mapped['seller_name']} if 'seller_name' in mapped else {}
+    financial_info = {field: float(mapped[field]) for field in FINANCIAL_FIELDS if field in mapped}
+    complete = all(field in mapped for field in COMPLETE_COPA3_FIELDS)
+    marked = has_copa3_marker(fields) or bool(complete and page_markers and shows_markers(reader, page_markers))
+    return Copa3Fields(address, property_info, seller_info, financial_info, marked, complete)
+
+def merge_copa3_values(text_values, fields):
+    """
+    Overlay the form field values on the (address, property_info, seller_info,
+    financial_info) read from the page text, which may be None. Returns the merged four.
+    """
+    if text_values is None:
+        return fields.address, fields.property_info, fields.seller_info, fields.financial_info
+    address, property_info, seller_info, financial_info = text_values
+    return (
+        fields.address or address,
+        {**property_info, **fields.property_info},
+        {**seller_info, **fields.seller_info},
+        {**financial_info, **fields.financial_info},
+    )
@@ -0,0 +1,200 @@
+"""
+Response schema for Gemini email parsing, and validation of its replies.
+
+The schema is built from the "# Output Format" block of prompt.txt, so the
+prompt remains the one place the output shape is defined. Each "key": value
+line becomes a property typed from its description:
+  "string or null"        -> nullable string
+  number ... / -1         -> number (-1 when not found)
+  boolean ...             -> boolean, nullable if the description allows null
+  "a", "b", or "c"        -> string enum
+  { ... }                 -> nested object
+  []                      -> array; rent_roll items use RENT_ROLL_ITEM_SCHEMA
+
+validate_listing() checks a decoded reply against the schema and normalizes it
+in a single walk. It fills the documented defaults, coerces numbers written
+as strings, and drops fields the prompt didn't ask for. It returns the
+ParsedListing dict, or raises SchemaError with every problem it found.
+"""
+import re
+from typing import List, Optional, TypedDict
+
+class ListingAddress(TypedDict):
+    full_address: Optional[str]
+    street_address: Optional[str]
+    secondary_address: Optional[str]
+    zip_code: Optional[str]
+
+class RentRollUnit(TypedDict):
+    unit_number: Optional[str]
+    rent: float
+    passthroughs: float
+    bedrooms: float
+    bathrooms: float
+    move_in_date: Optional[str]
+    written_agreement: Optional[bool]
+    unit_type: Optional[str]
+    square_feet: float
+
+class ListingDetails(TypedDict):
+    sender_phone_number: Optional[str]
+    soft_story_required: Optional[bool]
+    sqft: float
+    parking_spaces: float
+    financial_data: dict
+    rent_roll: List[RentRollUnit]
+
+class ParsedListing(TypedDict):
+    classification: str
+    confidence: str
+    address: ListingAddress
+    asking_price: float
+    total_units: float
+    residential_units: float
+    vacant_residential: float
+    commercial_units: float
+    vacant_commercial: float
+    is_vacant_lot: bool
+    details: ListingDetails
+
+class SchemaError(ValueError):
+    """A reply that doesn't fit the response schema. `problems` lists each one."""
+
+    def __init__(self, problems):
+        super().__init__('; '.join(problems))
+        self.problems = problems
+
+# Numbers the prompt asks for as -1 when not found
+NOT_FOUND = -1
+
+RENT_ROLL_ITEM_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'unit_number': {'type': 'string', 'nullable': True},
+        'rent': {'type': 'number'},
+        'passthroughs': {'type': 'number'},
+        'bedrooms': {'type': 'number'},
+        'bathrooms': {'type': 'number'},
+        'move_in_date': {'type': 'string', 'nullable': True},
+        'written_agreement': {'type': 'boolean', 'nullable': True},
+        'unit_type': {'type': 'string', 'nullable': True},
+        'square_feet': {'type': 'number'},
+    },
+}
+
+ARRAY_ITEM_SCHEMAS = {'rent_roll': RENT_ROLL_ITEM_SCHEMA}
+
+OUTPUT_FORMAT_RE = re.compile(r'^# Output Format\s*$(.*?)^# ', re.MULTILINE | re.DOTALL)
+PROPERTY_LINE_RE = re.compile(r'^\W*"(\w+)"\s*:\s*(.*?)\s*,?\s*$')
+QUOTED_RE = re.compile(r'"([^"]*)"')
+AMOUNT_RE = re.compile(r'-?\d[\d,]*\.?\d*|-?\.\d+')
+
+def _property_schema(description):
+    if description.startswith('{'):
+        return {'type': 'object', 'properties': {}}
+    if description.startswith('['):
+        return {'type': 'array', 'items': {'type': 'string'}}
+    if description.startswith('"string'):
+        return {'type': 'string', 'nullable': True}
+    if description.startswith('number'):
+        return {'type': 'number'}
+    if description.startswith('boolean'):
+        return {'type': 'boolean', 'nullable': 'null' in description}
+    options = QUOTED_RE.findall(description)
+    if options:
+        return {'type': 'string', 'enum': options}
+    return {'type': 'string', 'nullable': True}
+
+def schema_from_prompt(prompt):
+    """Build the response schema from the pseudo-JSON in the prompt's Output Format section."""
+    block = OUTPUT_FORMAT_RE.search(prompt)
+    if not block:
+        raise ValueError('prompt has no "# Output Format" section')
+
+    root = {'type': 'object', 'properties': {}}
+    stack = [root]
+    for line in block.group(1).splitlines():
+        match = PROPERTY_LINE_RE.match(line)
+        if match:
+            key, description = match.groups()
+            schema = _property_schema(description)
+            if schema['type'] == 'array':
+                schema['items'] = ARRAY_ITEM_SCHEMAS.get(key, schema['items'])
+            stack[-1]['properties'][key] = schema
+            if schema['type'] == 'object':
+                stack.append(schema)
+        elif line.strip().startswith('}') and len(stack) > 1:
+            stack.pop()
+    root['required'] = ['classification', 'confidence']
+    return root
+
+def _number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise TypeError
+    if not isinstance(value, str):
+        return value
+    match = AMOUNT_RE.search(value.replace('$', ''))
+    if not match:
+        # "n/a", "unknown" and the like
+        return NOT_FOUND
+    number = float(match.group().replace(',', ''))
+    return int(number) if number.is_integer() else number
+
+def _coerce(schema, value, path, problems):
+    kind = schema['type']
+    if kind == 'object':
+        if value is None:
+            value = {}
+        if not isinstance(value, dict):
+            problems.append(f"{path or 'reply'}: expected an object, got {type(value).__name__}")
+            value = {}
+        for key in schema.get('required', []):
+            if value.get(key) is None:
+                problems.append(f"{path}{key}: missing")
+        return {key: _coerce(sub, value.get(key), f"{path}{key}.", problems)
+                for key, sub in schema['properties'].items()}
+
+    path = path.rstrip('.')
+    if kind == 'array':
+        if value is None:
+            return []
+        if not isinstance(value, list):
+            problems.append(f"{path}: expected an array, got {type(value).__name__}")
+            return []
+        return [_coerce(schema['items'], item, f"{path}[{i}].", problems) for i, item in enumerate(value)]
+
+    if value is None:
+        if kind == 'number':
+            return NOT_FOUND
+        if kind == 'boolean' and not schema.get('nullable'):
+            return False
+        return None
+
+    if kind == 'number':
+        try:
+            return _number(value)
+        except TypeError:
+            problems.append(f"{path}: expected a number, got {value!r}")
+            return NOT_FOUND
+    if kind == 'boolean':
+        if isinstance(value, bool):
+            return value
+        if str(value).lower() in ('true', 'yes'):
+            return True
+        if str(value).lower() in ('false', 'no'):
+            return False
+        problems.append(f"{path}: expected true or false, got {value!r}")
+        return None
+    if 'enum' in schema:
+        if str(value).lower() not in schema['enum']:
+            problems.append(f"{path}: expected one of {', '.join(schema['enum'])}, got {value!r}")
+        return str(value).lower()
+    return str(value)
+
+def validate_listing(data, schema) -> ParsedListing:
+    """Normalize a decoded reply against the schema. Raises SchemaError listing every problem."""
+    problems = []
+    listing = _coerce(schema, data, '', problems)
+    if problems:
+        raise SchemaError(problems)
+    return listing
@@ -0,0 +1,122 @@
+"""
+Local cache of attachment analysis results, keyed by SHA-256 of the file bytes.
+
+The same COPA PDF is often forwarded in several emails, so each distinct file
+is downloaded and parsed once. Storage paths are also mapped to their content
+hash, letting a reprocessed email skip the download entirely.
+
+Stored per file: the detected form type, the parsed form data, and the text of
+every page that was extracted while analyzing it.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+ATTACHMENT_CACHE_PATH = os.getenv('ATTACHMENT_CACHE_PATH', str(BASE_DIR / '.cache' / 'attachments.sqlite3'))
+
+# Bump whenever form detection or field extraction changes, so stale results are re-parsed
+CACHE_VERSION = 3
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+def sha256_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class AttachmentCache:
+    """SQLite store of per-file analysis results. Safe to share between threads."""
+
+    def __init__(self, path=ATTACHMENT_CACHE_PATH):
+        if path != ':memory:':
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.executescript("""
+                create table if not exists attachment_results (
+                    content_hash text primary key,
+                    version integer not null,
+                    form_type text,
+                    form_data text not null,
+                    page_texts text not null,
+                    cached_at real not null
+                );
+                create table if not exists attachment_paths (
+                    storage_path text primary key,
+                    content_hash text not null
+                );
+            """)
+            self._conn.commit()
+
+    def get(self, content_hash):
+        """
+        Return the cached result for a content hash as a dict with
+        'form_type', 'form_data' and 'page_texts', or None on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'select version, form_type, form_data, page_texts from attachment_results where content_hash = ?',
+                (content_hash,)
+            ).fetchone()
+        if row is None or row[0] != CACHE_VERSION:
+            return None
+        return {
+            'form_type': row[1],
+            'form_data': json.loads(row[2]),
+            # JSON object keys are strings; page numbers go back to ints
+            'page_texts': {int(k): v for k, v in json.loads(row[3]).items()},
+        }
+
+    def get_by_path(self, storage_path):
+        """Return (content_hash, result) for a storage path seen before, or (None, None)."""
+        with self._lock:
+            row = self._conn.execute(
+                'select content_hash from attachment_paths where storage_path = ?', (storage_path,)
+            ).fetchone()
+        if row is None:
+            return None, None
+        result = self.get(row[0])
+        return (row[0], result) if result is not None else (None, None)
+
+    def put(self, content_hash, form_type, form_data, page_texts, storage_path=None):
+        """Store the analysis of a file, optionally recording which storage path it came from."""
+        with self._lock:
+            self._conn.execute(
+                'insert or replace into attachment_results values (?, ?, ?, ?, ?, ?)',
+                (content_hash, CACHE_VERSION, form_type, json.dumps(form_data),
+                 json.dumps(page_texts), time.time())
+            )
+            if storage_path:
+                self._conn.execute(
+                    'insert or replace into attachment_paths values (?, ?)', (storage_path, content_hash)
+                )
+            self._conn.commit()
+
+    def link_path(self, storage_path, content_hash):
+        """Record that a storage path holds content already in the cache."""
+        with self._lock:
+            self._conn.execute(
+                'insert or replace into attachment_paths values (?, ?)', (storage_path, content_hash)
+            )
+            self._conn.commit()
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Return the process-wide attachment cache, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AttachmentCache()
+        return _cache
@@ -0,0 +1,68 @@
+"""
+Backfill copa_listings_new.normalized_address for existing listings.
+
+check_duplicate_listing looks listings up by this column, so it needs to be
+populated before the dedupe check can find older rows. The column and its
+index come from migrations/001_copa_listings_normalized_address.sql; apply it first.
+
+Safe to re-run: only rows whose stored key differs from the computed one are updated.
+
+Usage: python backfill_normalized_addresses.py [--dry-run]
+"""
+import sys
+from supabase import create_client
+import config
+from process_data import normalize_address
+
+PAGE_SIZE = 1000
+
+supabase = create_client(config.SUPABASE_URL, config.SUPABASE_KEY)
+
+def backfill_normalized_addresses(dry_run=False):
+    """Compute normalized_address for every listing and store it where missing or stale."""
+    scanned = 0
+    updated = 0
+    failed = 0
+    offset = 0
+
+    while True:
+        response = supabase.table('copa_listings_new')\
+            .select('id, address, normalized_address')\
+            .order('id')\
+            .range(offset, offset + PAGE_SIZE - 1)\
+            .execute()
+
+        rows = response.data
+        if not rows:
+            break
+
+        for listing in rows:
+            scanned += 1
+            full_address = (listing.get('address') or {}).get('full_address', '')
+            normalized = normalize_address(full_address)
+
+            if listing.get('normalized_address') == normalized:
+                continue
+
+            if dry_run:
+                print(f"  Would set {listing['id']}: '{normalized}'")
+                updated += 1
+                continue
+
+            try:
+                supabase.table('copa_listings_new')\
+                    .update({'normalized_address': normalized})\
+                    .eq('id', listing['id'])\
+                    .execute()
+                updated += 1
+            except Exception as e:
+                failed += 1
+                print(f"  ✗ Failed to update {listing['id']}: {e}")
+
+        offset += PAGE_SIZE
+
+    print(f"✓ Scanned {scanned} listings, {'would update' if dry_run else 'updated'} {updated}, failed {failed}")
+    return updated
+
+if __name__ == "__main__":
+    backfill_normalized_addresses(dry_run='--dry-run' in sys.argv[1:])
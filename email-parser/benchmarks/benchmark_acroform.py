@@ -0,0 +1,146 @@
+"""
+Compare parsing a fillable COPA3 form with parsing the same form flattened.
+
+Builds one-page PDFs printing the golden COPA3 form: one carrying every value
+in AcroForm fields, one with the asking price left out of the fields, and one
+with no fields. The complete form is read from its fields alone; the partly
+filled one has its fields merged over the page text; the flattened one is read
+from the page text. All three must give the same form data. The script checks
+that they do and times each through parse_copa_form_local.
+
+Usage:
+    python benchmarks/benchmark_acroform.py [--iterations N]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The pipeline modules read these at import; nothing here talks to the real services
+for name in ('SUPABASE_URL', 'SUPABASE_KEY', 'GEMINI_API_KEY', 'VISION_CREDENTIALS_PATH'):
+    os.environ.setdefault(name, 'http://localhost' if name == 'SUPABASE_URL' else 'benchmark')
+
+from process_emails import parse_copa_form_local
+
+FORM_TEXT = (Path(__file__).resolve().parent / 'golden' / 'copa3_standard.txt').read_text()
+
+# Field names as a form designer might export them, with the values printed in FORM_TEXT
+FORM_FIELDS = [
+    ('form1[0].page1[0].Property_Address[0]', '1125 Webster Street, San Francisco, CA 94115'),
+    ('form1[0].page1[0].Seller[0]', 'The Edwin M. Campbell Trust'),
+    ('form1[0].page1[0].Asking_price[0]', '$1,295,000'),
+    ('form1[0].page1[0].Total_#_of_units[0]', '4'),
+    ('form1[0].page1[0].#_of_residential_units[0]', '3'),
+    ('form1[0].page1[0].Currently_vacant_residential[0]', '1'),
+    ('form1[0].page1[0].#_of_commercial_(office/retail)_units[0]', '1'),
+    ('form1[0].page1[0].Currently_vacant_commercial[0]', '0'),
+    ('form1[0].page1[0].Check_if_a_vacant_lot[0]', '/Off'),
+    ('form1[0].page1[0].Soft_Story_Yes[0]', '/Yes'),
+    ('form1[0].page1[0].Soft_Story_No[0]', '/Off'),
+    ('form1[0].page1[0].Total_rents[0]', '9,500.00'),
+    ('form1[0].page1[0].Other_income[0]', '500.00'),
+    ('form1[0].page1[0].Total_monthly_income[0]', '10,000.00'),
+    ('form1[0].page1[0].Total_annual_income[0]', '120,000.00'),
+    ('form1[0].page1[0].Annual_expenses[0]', '40,000.00'),
+    ('form1[0].page1[0].Management_amount[0]', '6,000.00'),
+    ('form1[0].page1[0].Insurance[0]', '2,400.00'),
+    ('form1[0].page1[0].Utilities[0]', '3,600.00'),
+    ('form1[0].page1[0].Maintenance[0]', '5,000.00'),
+    ('form1[0].page1[0].Other_expenses[0]', '1,000.00'),
+]
+
+def pdf_string(value):
+    return '(' + value.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') + ')'
+
+HELVETICA = '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>'
+
+def make_fillable_pdf(text, fields, font=HELVETICA):
+    """
+    Build a one-page PDF printing `text` in `font`, with an AcroForm holding
+    `fields` (none if empty). With font=None the page has no text layer, like a scan.
+    """
+    words = text.split() if font else []
+    lines = [' '.join(words[i:i + 12]) for i in range(0, len(words), 12)]
+    stream = 'BT /F1 9 Tf 11 TL 36 756 Td\n' + ''.join(f'{pdf_string(line)} Tj T*\n' for line in lines) + 'ET'
+    resources = '/Resources << /Font << /F1 5 0 R >> >>' if font else '/Resources << >>'
+
+    first_field = 6
+    field_refs = ' '.join(f'{first_field + n} 0 R' for n in range(len(fields)))
+    acroform = f' /AcroForm << /Fields [{field_refs}] >>' if fields else ''
+    objects = [
+        f'<< /Type /Catalog /Pages 2 0 R{acroform} >>',
+        '<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R '
+        f'{resources} /Annots [{field_refs}] >>',
+        f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream',
+        font or '<< >>',
+    ]
+    for n, (name, value) in enumerate(fields):
+        kind, shown = ('/Btn', value) if value.startswith('/') else ('/Tx', pdf_string(value))
+        objects.append(f'<< /Type /Annot /Subtype /Widget /FT {kind} /T {pdf_string(name)} /V {shown} '
+                       f'/Rect [36 {700 - 12 * n} 300 {710 - 12 * n}] /P 3 0 R >>')
+
+    out = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n{body}\nendobj\n'.encode('latin-1')
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets).encode()
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return out
+
+def parse_pdf(data):
+    return parse_copa_form_local(data)[0]
+
+def time_per_form(parse, data, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        parse(data)
+    return (time.perf_counter() - start) / iterations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    forms = [
+        ('Fillable', make_fillable_pdf(FORM_TEXT, FORM_FIELDS)),
+        ('Partly filled', make_fillable_pdf(FORM_TEXT, [(name, value) for name, value in FORM_FIELDS
+                                                         if 'Asking_price' not in name])),
+        ('Flattened', make_fillable_pdf(FORM_TEXT, [])),
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [(label, parse_pdf(data), time_per_form(parse_pdf, data, args.iterations)) for label, data in forms]
+
+    _, from_text, text_seconds = results[-1]
+    failed = False
+    for label, form_data, seconds in results[:-1]:
+        if not form_data:
+            print(f"✗ The {label.lower()} form was not recognised as a COPA3 form")
+            failed = True
+            continue
+        differences = {key for key in from_text if form_data.get(key) != from_text[key]}
+        differences |= {f'details.{key}' for key in from_text['details']
+                        if form_data['details'].get(key) != from_text['details'][key]}
+        differences.discard('details')
+        if differences:
+            print(f"✗ {label} and flattened results differ: {', '.join(sorted(differences))}")
+            print(json.dumps({'fields': form_data, 'text': from_text}, indent=2))
+            failed = True
+        else:
+            print(f"✓ {label} and flattened results match")
+
+    for label, _, seconds in results:
+        print(f"{label + ':':15}{seconds * 1000:7.2f} ms per form ({text_seconds / seconds:.1f}x flattened speed)")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
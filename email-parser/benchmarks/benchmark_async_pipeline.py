@@ -0,0 +1,252 @@
+"""
+Compare wall time of the sync and asyncio email pipelines against fake services.
+
+Supabase (REST + storage) and Nominatim are replaced with in-process fakes
+that sleep for a fixed latency per call, so no network is used. Each email
+has --attachments small generated PDFs, the last of which is a COPA3 form.
+Every file is unique so the attachment cache never hits, and PDF parsing is real.
+Set PRESCREEN_MODE=off to compare against parsing every attachment in full.
+
+Usage:
+    python benchmarks/benchmark_async_pipeline.py [--emails N] [--attachments N] [--concurrency N]
+        [--db-latency S] [--storage-latency S] [--geocode-latency S]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The pipeline modules read these at import; nothing here talks to the real services
+for name in ('SUPABASE_URL', 'SUPABASE_KEY', 'GEMINI_API_KEY', 'VISION_CREDENTIALS_PATH'):
+    os.environ.setdefault(name, 'http://localhost' if name == 'SUPABASE_URL' else 'benchmark')
+
+import attachment_cache
+import geocoding
+import process_emails
+import process_emails_async
+from attachment_cache import AttachmentCache
+from neighborhoods import NeighborhoodIndex
+
+DEFAULT_ATTACHMENT_WORKERS = process_emails.ATTACHMENT_WORKERS
+
+FORM_TEXT = (Path(__file__).resolve().parent / 'golden' / 'copa3_standard.txt').read_text()
+
+def make_pdf(lines):
+    """Build a one-page PDF showing `lines` in Helvetica, with a valid xref table."""
+    def escape(line):
+        return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    stream = 'BT /F1 9 Tf 11 TL 36 756 Td\n' + ''.join(f'({escape(line)}) Tj T*\n' for line in lines) + 'ET'
+    objects = [
+        '<< /Type /Catalog /Pages 2 0 R >>',
+        '<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R '
+        '/Resources << /Font << /F1 5 0 R >> >> >>',
+        f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream',
+        '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    out = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n{body}\nendobj\n'.encode('latin-1')
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets).encode()
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return out
+
+def make_dataset(count, attachments_per_email=1):
+    words = FORM_TEXT.split()
+    lines = [' '.join(words[i:i + 12]) for i in range(0, len(words), 12)]
+    filler = [f"Offering memorandum line {n}: rent roll, disclosures and terms." for n in range(60)]
+    emails, attachments, files = [], {}, {}
+    for i in range(count):
+        emails.append({'id': i, 'subject': f"Listing {i}", 'from_address': 'broker@example.com',
+                       'received_date': '2025-01-01T00:00:00Z', 'raw_text': ''})
+        attachments[i] = []
+        for n in range(attachments_per_email):
+            is_form = n == attachments_per_email - 1
+            path = f"email-{i}/{'copa3' if is_form else f'memo-{n}'}.pdf"
+            attachments[i].append({'id': f"{i}-{n}", 'filename': os.path.basename(path),
+                                   'content_type': 'application/pdf', 'is_inline': False, 'storage_path': path})
+            files[path] = make_pdf((lines if is_form else filler) + [f"Ref {i}-{n}"])
+    return emails, attachments, files
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+class FakeBackend:
+    """Shared state and simulated latencies behind both fake clients."""
+
+    def __init__(self, attachments, files, db_latency, storage_latency):
+        self.attachments = attachments
+        self.files = files
+        self.db_latency = db_latency
+        self.storage_latency = storage_latency
+        self.next_listing_id = 0
+
+    def answer(self, request):
+        if request.rpc_name:
+            self.next_listing_id += 1
+            return FakeResponse(self.next_listing_id)
+        if request.table_name == 'email_attachments':
+            return FakeResponse(self.attachments[request.filters['email_id']])
+        return FakeResponse([])
+
+class FakeRequest:
+    """Chainable stand-in for a postgrest request builder."""
+
+    def __init__(self, backend, table_name=None, rpc_name=None):
+        self.backend = backend
+        self.table_name = table_name
+        self.rpc_name = rpc_name
+        self.filters = {}
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def update(self, *args, **kwargs):
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def limit(self, *args, **kwargs):
+        return self
+
+    def in_(self, *args, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+class SyncRequest(FakeRequest):
+    def execute(self):
+        time.sleep(self.backend.db_latency)
+        return self.backend.answer(self)
+
+class AsyncRequest(FakeRequest):
+    async def execute(self):
+        await asyncio.sleep(self.backend.db_latency)
+        return self.backend.answer(self)
+
+class FakeBucket:
+    def __init__(self, backend, asynchronous):
+        self.backend = backend
+        self.asynchronous = asynchronous
+
+    def download(self, path):
+        if self.asynchronous:
+            return self._download_async(path)
+        time.sleep(self.backend.storage_latency)
+        return self.backend.files[path]
+
+    async def _download_async(self, path):
+        await asyncio.sleep(self.backend.storage_latency)
+        return self.backend.files[path]
+
+class FakeSupabase:
+    def __init__(self, backend, asynchronous=False):
+        self.backend = backend
+        self.request_class = AsyncRequest if asynchronous else SyncRequest
+        self.storage = self
+        self.asynchronous = asynchronous
+
+    def table(self, name):
+        return self.request_class(self.backend, table_name=name)
+
+    def rpc(self, name, params):
+        return self.request_class(self.backend, rpc_name=name)
+
+    def from_(self, bucket):
+        return FakeBucket(self.backend, self.asynchronous)
+
+class FakeGeocoder:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def geocode(self, addr_string):
+        time.sleep(self.latency)
+        return {'lat': 37.77, 'lng': -122.42}
+
+class FakeAsyncGeocoder(FakeGeocoder):
+    async def geocode(self, addr_string):
+        await asyncio.sleep(self.latency)
+        return {'lat': 37.77, 'lng': -122.42}
+
+def run_sync(emails, backend, geocode_latency, workers, attachment_workers=None):
+    process_emails.supabase = FakeSupabase(backend)
+    process_emails.ATTACHMENT_WORKERS = attachment_workers or DEFAULT_ATTACHMENT_WORKERS
+    geocoding._client = FakeGeocoder(geocode_latency)
+    attachment_cache._cache = AttachmentCache(':memory:')
+    neighborhoods = NeighborhoodIndex([])
+    status_buffer = process_emails.EmailStatusBuffer(flush_every=25)
+
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        if workers > 1:
+            outcomes = process_emails.run_emails_concurrently(emails, neighborhoods, workers, status_buffer)
+        else:
+            outcomes = [process_emails.run_email(i, len(emails), email, neighborhoods, status_buffer)
+                        for i, email in enumerate(emails, 1)]
+        status_buffer.flush()
+    return outcomes
+
+def run_async(emails, backend, geocode_latency, concurrency, parse_pool):
+    async def _run():
+        pipeline = process_emails_async.AsyncEmailPipeline(
+            FakeSupabase(backend, asynchronous=True), NeighborhoodIndex([]), FakeAsyncGeocoder(geocode_latency),
+            parse_pool, cache=AttachmentCache(':memory:'), flush_every=25,
+        )
+        outcomes = await pipeline.run(emails, concurrency)
+        await pipeline.status_buffer.flush()
+        return outcomes
+
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        return asyncio.run(_run())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emails', type=int, default=40)
+    parser.add_argument('--attachments', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--db-latency', type=float, default=0.05)
+    parser.add_argument('--storage-latency', type=float, default=0.15)
+    parser.add_argument('--geocode-latency', type=float, default=0.1)
+    args = parser.parse_args()
+
+    emails, attachments, files = make_dataset(args.emails, args.attachments)
+    print(f"{args.emails} emails x {args.attachments} attachments; latency db={args.db_latency}s storage={args.storage_latency}s "
+          f"geocode={args.geocode_latency}s")
+    print(f"{'pipeline':>28} {'seconds':>9} {'emails/s':>9}  outcomes")
+
+    def report(label, run):
+        backend = FakeBackend(attachments, files, args.db_latency, args.storage_latency)
+        start = time.perf_counter()
+        outcomes = run(backend)
+        elapsed = time.perf_counter() - start
+        statuses = {}
+        for outcome in outcomes:
+            statuses[outcome['status']] = statuses.get(outcome['status'], 0) + 1
+        print(f"{label:>28} {elapsed:>9.2f} {len(emails) / elapsed:>9.1f}  {statuses}")
+
+    if args.attachments > 1:
+        report('sync, serial attachments', lambda backend: run_sync(emails, backend, args.geocode_latency, 1, 1))
+    report('sync', lambda backend: run_sync(emails, backend, args.geocode_latency, 1))
+    report(f'sync --workers {args.concurrency}',
+           lambda backend: run_sync(emails, backend, args.geocode_latency, args.concurrency))
+    with ProcessPoolExecutor() as parse_pool:
+        report(f'async --concurrency {args.concurrency}',
+               lambda backend: run_async(emails, backend, args.geocode_latency, args.concurrency, parse_pool))
+
+if __name__ == "__main__":
+    main()
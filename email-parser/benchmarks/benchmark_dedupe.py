@@ -0,0 +1,78 @@
+"""
+Benchmark per-email duplicate-listing lookup cost as copa_listings_new grows.
+
+Models the listings table in an in-memory SQLite database and compares the
+old full-table scan (fetch every address, normalize each in Python) with an
+equality lookup on an indexed normalized_address column.
+
+Usage: python benchmarks/benchmark_dedupe.py [sizes...]
+"""
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from process_data import normalize_address
+
+STREETS = ['Webster Street', 'Fillmore St', 'Mission Street', 'Valencia St', '24th Street',
+           'Geary Boulevard', 'Clement St', 'Irving Street', 'Judah St', 'Noe Street']
+LOOKUPS = 200
+
+def build_table(size):
+    """Create a listings table with `size` rows and an index on normalized_address."""
+    conn = sqlite3.connect(':memory:')
+    conn.execute('create table copa_listings_new (id integer primary key, address text, normalized_address text)')
+    conn.execute('create index copa_listings_new_normalized_address_idx on copa_listings_new (normalized_address)')
+
+    rows = []
+    for i in range(size):
+        full_address = f"{i + 1} {random.choice(STREETS)}, San Francisco, CA 941{random.randint(10, 34)}"
+        rows.append((i, json.dumps({'full_address': full_address}), normalize_address(full_address)))
+    conn.executemany('insert into copa_listings_new values (?, ?, ?)', rows)
+    conn.commit()
+    return conn, [json.loads(r[1])['full_address'] for r in rows]
+
+def scan_lookup(conn, full_address):
+    """Old behaviour: select every listing and compare normalized addresses in Python."""
+    target = normalize_address(full_address)
+    for listing_id, address in conn.execute('select id, address from copa_listings_new'):
+        if normalize_address(json.loads(address).get('full_address', '')) == target:
+            return listing_id
+    return None
+
+def indexed_lookup(conn, full_address):
+    """New behaviour: one equality query against the indexed key."""
+    row = conn.execute(
+        'select id from copa_listings_new where normalized_address = ? limit 1',
+        (normalize_address(full_address),)
+    ).fetchone()
+    return row[0] if row else None
+
+def time_per_lookup(fn, conn, addresses):
+    start = time.perf_counter()
+    for address in addresses:
+        fn(conn, address)
+    return (time.perf_counter() - start) / len(addresses) * 1000
+
+def main():
+    sizes = [int(s) for s in sys.argv[1:]] or [1000, 5000, 20000, 50000]
+    random.seed(0)
+
+    print(f"{'rows':>8} {'scan ms/email':>15} {'indexed ms/email':>18}")
+    for size in sizes:
+        conn, addresses = build_table(size)
+        # Half hits, half misses, like a mix of repeat and new listings
+        probes = random.sample(addresses, min(LOOKUPS // 2, size))
+        probes += [f"{size + i} Nowhere Street, San Francisco, CA 94199" for i in range(LOOKUPS // 2)]
+
+        scan_ms = time_per_lookup(scan_lookup, conn, probes[:20])
+        indexed_ms = time_per_lookup(indexed_lookup, conn, probes)
+        print(f"{size:>8} {scan_ms:>15.3f} {indexed_ms:>18.4f}")
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Check COPA form field extraction against the golden corpus and time it.
+
+benchmarks/golden/<name>.txt holds cleaned form text and <name>.json the
+expected output of extract_address, extract_basic_property_info,
+extract_seller_info and extract_financial_info for it. Any difference is
+reported and the script exits non-zero.
+
+Usage:
+    python benchmarks/benchmark_extraction.py                   # verify + time
+    python benchmarks/benchmark_extraction.py --update-golden   # rewrite expected outputs
+"""
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from process_data import extract_address, extract_basic_property_info, extract_seller_info, extract_financial_info
+
+GOLDEN_DIR = Path(__file__).resolve().parent / 'golden'
+ITERATIONS = 2000
+
+def extract_all(text):
+    return {
+        'address': extract_address(text),
+        'basic_property_info': extract_basic_property_info(text),
+        'seller_info': extract_seller_info(text),
+        'financial_info': extract_financial_info(text),
+    }
+
+def main():
+    update = '--update-golden' in sys.argv[1:]
+    corpus = {path.stem: path.read_text() for path in sorted(GOLDEN_DIR.glob('*.txt'))}
+
+    mismatches = 0
+    for name, text in corpus.items():
+        result = extract_all(text)
+        expected_path = GOLDEN_DIR / f'{name}.json'
+        if update:
+            expected_path.write_text(json.dumps(result, indent=2, ensure_ascii=False) + '\n')
+            continue
+        # Round-trip through JSON so comparison matches what's stored on disk
+        if json.loads(json.dumps(result)) != json.loads(expected_path.read_text()):
+            mismatches += 1
+            print(f"✗ {name}: output differs from golden")
+            print(json.dumps(result, indent=2, ensure_ascii=False))
+
+    if update:
+        print(f"✓ Wrote {len(corpus)} golden outputs")
+        return
+
+    print(f"{'✓' if not mismatches else '✗'} {len(corpus) - mismatches}/{len(corpus)} forms match golden output")
+
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        for text in corpus.values():
+            extract_all(text)
+    per_form_us = (time.perf_counter() - start) / (ITERATIONS * len(corpus)) * 1e6
+    print(f"Extraction time: {per_form_us:.1f} µs per form ({ITERATIONS} iterations x {len(corpus)} forms)")
+
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
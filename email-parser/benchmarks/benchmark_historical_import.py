@@ -0,0 +1,116 @@
+"""
+Run the historical import driver against a local stub of the import function.
+
+The stub serves --pages pages with a fixed latency per call. Every
+--error-every'th call fails with a 503, to exercise backoff. The run imports
+the whole mailbox twice: once paced like the old shell script (a fixed
+--fixed-delay between pages) and once with AdaptivePacer. Resume and pacing
+behaviour is checked in tests/test_import_historical_emails.py, which uses the
+same stub.
+
+Usage:
+    python benchmarks/benchmark_historical_import.py [--pages N] [--latency S] [--fixed-delay S]
+        [--error-every N]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The pipeline modules read these at import; nothing here talks to the real services
+for name in ('SUPABASE_URL', 'SUPABASE_KEY', 'GEMINI_API_KEY', 'VISION_CREDENTIALS_PATH'):
+    os.environ.setdefault(name, 'http://localhost' if name == 'SUPABASE_URL' else 'benchmark')
+
+from import_historical_emails import AdaptivePacer, run_import
+
+EMAILS_PER_PAGE = 50
+
+class StubImportFunction:
+    """In-process HTTP stub of import-historical-emails. Page tokens are page numbers."""
+
+    def __init__(self, pages, latency, error_every=0, fail_after=None):
+        self.pages = pages
+        self.latency = latency
+        self.error_every = error_every
+        self.fail_after = fail_after
+        self.calls = 0
+        self.served = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])) or b'{}')
+                status, reply = stub.handle(body.get('pageToken'))
+                data = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/functions/v1/import-historical-emails"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def handle(self, token):
+        time.sleep(self.latency)
+        page = int(token or 0)
+        with self._lock:
+            self.calls += 1
+            if self.fail_after is not None and len(self.served) >= self.fail_after:
+                return 503, {'error': 'unavailable'}
+            if self.error_every and self.calls % self.error_every == 0:
+                return 503, {'error': 'overloaded'}
+            self.served.append(page)
+        has_more = page + 1 < self.pages
+        return 200, {'new_emails': EMAILS_PER_PAGE, 'skipped': 0, 'errors': 0, 'has_more': has_more,
+                     'next_page_token': str(page + 1) if has_more else None}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def timed_import(stub, pacer, state_path):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        totals = run_import(stub.url, 'benchmark', state_path, pacer)
+    return totals, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--fixed-delay', type=float, default=0.5,
+                        help="Delay between pages for the fixed pacing run (the shell script used 5s)")
+    parser.add_argument('--error-every', type=int, default=7)
+    args = parser.parse_args()
+
+    state_path = os.path.join(tempfile.mkdtemp(), 'import_state.json')
+    fixed_delay = args.fixed_delay
+
+    runs = [
+        ('Fixed', AdaptivePacer(delay=fixed_delay, min_delay=fixed_delay, max_delay=fixed_delay, step=0)),
+        ('Adaptive', AdaptivePacer(delay=fixed_delay, step=fixed_delay / 5, max_delay=fixed_delay * 8)),
+    ]
+    for label, pacer in runs:
+        stub = StubImportFunction(args.pages, args.latency, args.error_every)
+        totals, seconds = timed_import(stub, pacer, state_path)
+        stub.close()
+        complete = totals['complete'] and sorted(set(stub.served)) == list(range(args.pages))
+        print(f"{label + ':':10}{seconds:6.2f}s for {args.pages} pages ({stub.calls} calls)"
+              f"{'' if complete else ', incomplete'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Report peak RSS of OCR'ing a PDF with eager vs streaming page rasterization.
+
+Each mode runs in its own subprocess (peak RSS only ever grows within a
+process) against a fake Vision client, so no API calls are made.
+
+Usage: python benchmarks/benchmark_ocr_memory.py path/to/scanned.pdf
+"""
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class FakeVisionClient:
+    """Returns an empty annotation for every image, like a blank page."""
+
+    def batch_annotate_images(self, requests):
+        from google.cloud import vision
+        return vision.BatchAnnotateImagesResponse(
+            responses=[vision.AnnotateImageResponse() for _ in requests]
+        )
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run_mode(mode, pdf_path):
+    import extract_text
+    from pdf2image import convert_from_path
+
+    client = FakeVisionClient()
+    start = time.perf_counter()
+    if mode == 'eager':
+        # Previous behaviour: render every page up front at pdf2image's defaults
+        images = convert_from_path(pdf_path)
+        pages = len(images)
+        extract_text.ocr_images(images, client=client)
+    else:
+        # Count the pages the rasterizer yields; OCR text has newlines of its own
+        yielded = []
+        rasterize = extract_text.iter_pdf_page_pngs
+
+        def counted_pages(*args, **kwargs):
+            for png in rasterize(*args, **kwargs):
+                yielded.append(len(png))
+                yield png
+
+        extract_text.iter_pdf_page_pngs = counted_pages
+        extract_text.ocr_pdf(pdf_path, client=client)
+        pages = len(yielded)
+    elapsed = time.perf_counter() - start
+    print(f"{mode:>10} {pages:>6} {elapsed:>9.2f} {peak_rss_mb():>14.1f}")
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--mode':
+        run_mode(sys.argv[2], sys.argv[3])
+        return
+
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+
+    print(f"{'mode':>10} {'pages':>6} {'seconds':>9} {'peak RSS (MB)':>14}")
+    for mode in ('eager', 'streaming'):
+        subprocess.run([sys.executable, __file__, '--mode', mode, sys.argv[1]], check=True)
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,327 @@
-from datetime import datetime, timedelta
+"""
+Delete emails past the retention window along with their attachment files.
+
+Expired emails are paged through by id. Each page's attachment paths are
+fetched with a few email_id=in.(...) queries, not one query per email. The
+files are then removed from storage in batches of REMOVE_BATCH_SIZE paths,
+with up to REMOVE_CONCURRENCY batches in flight. Once the files are gone, the
+delete_old_emails SQL function deletes the rows received before the sweep's
+cutoff (migrations/002_delete_old_emails_cutoff.sql).
+
+Sweeps are resumable. The state file (RETENTION_STATE_PATH) holds the sweep's
+cutoff and a watermark: the highest email id whose files are all gone. It is
+rewritten after every page that is fully removed, along with the running
+file and byte totals. A sweep that dies, or stops at --max-emails, continues
+after the watermark on the next run with the same cutoff, so no storage
+deletes are repeated. delete_old_emails runs once the sweep reaches
+the end, and then the state is cleared. Removing a file that is already gone
+is not an error, so re-running a page is harmless.
+
+--reconcile walks the bucket afterwards. Any file older than ORPHAN_GRACE_HOURS
+that no email_attachments row points to is removed. Such files are left behind
+when rows are deleted without their files, for example by a delete_old_emails
+call made outside this script. Paths are checked
+against the table PATH_CHUNK_SIZE at a time.
+
+--dry-run deletes nothing and leaves the state alone. It reports what would be
+removed and how many bytes that would reclaim, read from the storage listing
+of each attachment folder.
+
+Usage: python delete_old_files.py [--dry-run] [--max-emails N] [--reconcile] [--state PATH]
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 from supabase import create_client
 import config
 
+# Also the default cutoff of the delete_old_emails SQL function
+RETENTION_DAYS = 90
+BUCKET = 'email-attachments'
+PAGE_SIZE = 1000
+# Email ids per in.(...) filter, keeping the request URL well under server limits
+ID_CHUNK_SIZE = 200
+REMOVE_BATCH_SIZE = 100
+REMOVE_CONCURRENCY = 4
+# Storage paths per in.(...) filter when reconciling; paths are much longer than ids
+PATH_CHUNK_SIZE = 50
+LIST_PAGE_SIZE = 1000
+# Newer files may belong to an email that is still being imported
+ORPHAN_GRACE_HOURS = 24
+
+BASE_DIR = Path(__file__).resolve().parent
+RETENTION_STATE_PATH = os.getenv('RETENTION_STATE_PATH', str(BASE_DIR / '.cache' / 'retention_state.json'))
+
 supabase = create_client(config.SUPABASE_URL, config.SUPABASE_KEY)
 
-# Get old emails
-ninety_days_ago = datetime.now() - timedelta(days=90)
-old_emails = supabase.table('emails')\
-    .select('id')\
-    .lt('received_date', ninety_days_ago.isoformat())\
-    .execute()
-
-# Get their attachments
-for email in old_emails.data:
-    attachments = supabase.table('email_attachments')\
-        .select('storage_path')\
-        .eq('email_id', email['id'])\
-        .execute()
-    
-    # Delete files from storage
-    for att in attachments.data:
-        if att['storage_path']:
-            try:
-                supabase.storage.from_('email-attachments').remove([att['storage_path']])
-            except Exception as e:
-                print(f"Failed to delete {att['storage_path']}: {e}")
-
-# Then run the SQL delete
-supabase.rpc('delete_old_emails').execute()
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def load_state(path=RETENTION_STATE_PATH):
+    """The unfinished sweep's state, or None if there isn't one."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        print(f"⚠ Ignoring unreadable retention state {path}")
+        return None
+
+def save_state(state, path=RETENTION_STATE_PATH):
+    """Write the state to a temp file and rename it over the old one, so a crash leaves one or the other."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def clear_state(path=RETENTION_STATE_PATH):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def new_state():
+    # Aware, so the database reads the same instant back from the state file
+    cutoff = datetime.now(timezone.utc) - timedelta(days=RETENTION_DAYS)
+    return {'cutoff': cutoff.isoformat(), 'last_email_id': None, 'emails': 0, 'files': 0, 'bytes': 0}
+
+def expired_email_ids(cutoff, last_id=None, limit=None):
+    """Yield pages of ids of emails received before cutoff with ids above last_id, in id order, up to limit ids."""
+    while limit is None or limit > 0:
+        page_size = PAGE_SIZE if limit is None else min(PAGE_SIZE, limit)
+        query = supabase.table('emails')\
+            .select('id')\
+            .lt('received_date', cutoff)\
+            .order('id')\
+            .limit(page_size)
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        rows = query.execute().data
+        if not rows:
+            return
+        yield [row['id'] for row in rows]
+        last_id = rows[-1]['id']
+        if limit is not None:
+            limit -= len(rows)
+
+def attachment_paths(email_ids):
+    """Storage paths of every stored attachment of the given emails."""
+    paths = []
+    for ids in chunked(email_ids, ID_CHUNK_SIZE):
+        offset = 0
+        while True:
+            rows = supabase.table('email_attachments')\
+                .select('storage_path')\
+                .in_('email_id', ids)\
+                .not_.is_('storage_path', 'null')\
+                .order('storage_path')\
+                .range(offset, offset + PAGE_SIZE - 1)\
+                .execute().data
+            paths.extend(row['storage_path'] for row in rows if row['storage_path'])
+            if len(rows) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+    return paths
+
+def object_size(obj):
+    return int((obj.get('metadata') or {}).get('size') or 0)
+
+def remove_batch(paths):
+    """Remove one batch of files. Returns (files removed, bytes reclaimed, failed paths)."""
+    try:
+        # The response lists the objects that were actually deleted
+        removed = supabase.storage.from_(BUCKET).remove(paths) or []
+    except Exception as e:
+        print(f"  ✗ Failed to delete {len(paths)} files starting at {paths[0]}: {e}")
+        return 0, 0, paths
+    return len(removed), sum(object_size(obj) for obj in removed), []
+
+def measure_batch(paths):
+    """Dry-run stand-in for remove_batch: size up the files that exist, deleting nothing."""
+    found, size = 0, 0
+    by_folder = {}
+    for path in paths:
+        folder, name = os.path.split(path)
+        by_folder.setdefault(folder, set()).add(name)
+    for folder, names in by_folder.items():
+        try:
+            objects = supabase.storage.from_(BUCKET).list(folder, {'limit': 1000})
+        except Exception as e:
+            print(f"  ✗ Failed to list {folder}: {e}")
+            continue
+        for obj in objects:
+            if obj.get('name') in names:
+                found += 1
+                size += object_size(obj)
+    return found, size, []
+
+def delete_old_files(dry_run=False, max_emails=None, state_path=RETENTION_STATE_PATH):
+    """
+    Remove the attachment files of expired emails, resuming any unfinished sweep,
+    then delete the email rows once the sweep is complete. Processes at most
+    max_emails emails this run. Returns True when the sweep finished.
+    """
+    state = load_state(state_path)
+    if state:
+        print(f"Resuming the sweep of emails before {state['cutoff']} after email {state['last_email_id']} "
+              f"({state['emails']} emails done)")
+    else:
+        state = new_state()
+    start_emails, start_files, start_bytes = state['emails'], state['files'], state['bytes']
+    failed = []
+    finished = True
+
+    with ThreadPoolExecutor(max_workers=REMOVE_CONCURRENCY) as pool:
+        pages = expired_email_ids(state['cutoff'], state['last_email_id'], max_emails)
+        for email_ids in pages:
+            paths = attachment_paths(email_ids)
+            batches = list(chunked(paths, REMOVE_BATCH_SIZE))
+            page_files, page_bytes = 0, 0
+            for removed, size, failed_paths in pool.map(measure_batch if dry_run else remove_batch, batches):
+                page_files += removed
+                page_bytes += size
+                failed.extend(failed_paths)
+            if failed:
+                # Leave the state at the previous page, so the next run retries this one with the same
+                # cutoff without counting a file twice
+                finished = False
+                break
+
+            state['emails'] += len(email_ids)
+            state['files'] += page_files
+            state['bytes'] += page_bytes
+            state['last_email_id'] = email_ids[-1]
+            if not dry_run:
+                save_state(state, state_path)
+            print(f"  {state['emails']} expired emails, {state['files']} files, "
+                  f"{state['bytes'] / 1024 / 1024:.1f} MB so far")
+
+        if max_emails is not None and state['emails'] - start_emails >= max_emails:
+            # The limit may have landed exactly on the last page; one more run will find nothing left
+            finished = False
+
+    verb = 'would delete' if dry_run else 'deleted'
+    print(f"✓ {state['emails'] - start_emails} emails older than {RETENTION_DAYS} days: "
+          f"{verb} {state['files'] - start_files} files, "
+          f"{(state['bytes'] - start_bytes) / 1024 / 1024:.1f} MB reclaimed, {len(failed)} failed")
+
+    if dry_run:
+        return finished
+    if failed:
+        print("⚠ Some files could not be removed; run again to retry from the last completed page")
+        return False
+    if not finished:
+        print(f"Stopped after {max_emails} emails; run again to continue the sweep")
+        return False
+
+    # The sweep's own cutoff: mail that expired since it started has not had its files removed
+    supabase.rpc('delete_old_emails', {'cutoff': state['cutoff']}).execute()
+    clear_state(state_path)
+    print(f"✓ Sweep complete: {state['emails']} emails, {state['files']} files, "
+          f"{state['bytes'] / 1024 / 1024:.1f} MB; deleted old email rows")
+    return True
+
+def bucket_objects(folder=''):
+    """
+    Yield (path, object) for every file in the bucket under folder, walking subfolders.
+    Each folder is listed to the end before any of its files are yielded, so the
+    caller can delete them without shifting the offsets of pages still to come.
+    """
+    folders = [folder]
+    while folders:
+        current = folders.pop()
+        files = []
+        offset = 0
+        while True:
+            items = supabase.storage.from_(BUCKET).list(current, {'limit': LIST_PAGE_SIZE, 'offset': offset})
+            for item in items:
+                path = f"{current}/{item['name']}" if current else item['name']
+                # Folders are listed without an id
+                if item.get('id') is None:
+                    folders.append(path)
+                else:
+                    files.append((path, item))
+            if len(items) < LIST_PAGE_SIZE:
+                break
+            offset += LIST_PAGE_SIZE
+        yield from files
+
+def created_before(obj, limit):
+    created = obj.get('created_at')
+    if not created:
+        return False
+    return datetime.fromisoformat(created.replace('Z', '+00:00')) < limit
+
+def unreferenced(paths):
+    """The paths no email_attachments row points to."""
+    known = set()
+    for chunk in chunked(paths, PATH_CHUNK_SIZE):
+        rows = supabase.table('email_attachments')\
+            .select('storage_path')\
+            .in_('storage_path', chunk)\
+            .execute().data
+        known.update(row['storage_path'] for row in rows)
+    return [path for path in paths if path not in known]
+
+def reconcile_orphans(dry_run=False):
+    """Remove stored files that no email_attachments row points to. Returns the number removed."""
+    grace_limit = datetime.now(timezone.utc) - timedelta(hours=ORPHAN_GRACE_HOURS)
+    scanned = 0
+    orphans = 0
+    reclaimed = 0
+    failed = 0
+
+    def flush(candidates):
+        nonlocal orphans, reclaimed, failed
+        orphan_paths = unreferenced(list(candidates))
+        orphans += len(orphan_paths)
+        if dry_run:
+            reclaimed += sum(object_size(candidates[path]) for path in orphan_paths)
+            for path in orphan_paths:
+                print(f"  Would remove orphan {path}")
+            return
+        for batch in chunked(orphan_paths, REMOVE_BATCH_SIZE):
+            _, size, failed_paths = remove_batch(batch)
+            reclaimed += size
+            failed += len(failed_paths)
+
+    candidates = {}
+    for path, obj in bucket_objects():
+        scanned += 1
+        if created_before(obj, grace_limit):
+            candidates[path] = obj
+        if len(candidates) >= REMOVE_BATCH_SIZE:
+            flush(candidates)
+            candidates = {}
+    if candidates:
+        flush(candidates)
+
+    verb = 'would remove' if dry_run else 'removed'
+    print(f"✓ Reconciled {scanned} stored files: {verb} {orphans} orphans, "
+          f"{reclaimed / 1024 / 1024:.1f} MB reclaimed, {failed} failed")
+    return orphans
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Delete emails past the retention window and their attachment files")
+    parser.add_argument('--dry-run', action='store_true', help="Report what would be deleted without deleting it")
+    parser.add_argument('--max-emails', type=int, default=None,
+                        help="Stop after this many emails; the next run continues the sweep")
+    parser.add_argument('--reconcile', action='store_true',
+                        help="Also remove stored files that no attachment row points to")
+    parser.add_argument('--state', default=RETENTION_STATE_PATH,
+                        help="Sweep state file (default: RETENTION_STATE_PATH)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    delete_old_files(dry_run=args.dry_run, max_emails=args.max_emails, state_path=args.state)
+    if args.reconcile:
+        reconcile_orphans(dry_run=args.dry_run)
@@ -1,23 +1,84 @@
 import os
 import io
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
 from google.cloud import vision
 from PyPDF2 import PdfReader
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
 import config
 
-# Initialize Vision API client
 os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = config.VISION_CREDENTIALS_PATH
-vision_client = vision.ImageAnnotatorClient()
+
+_vision_client = None
+_vision_client_lock = threading.Lock()
+
+def get_vision_client():
+    """Return the shared Vision API client, creating it on first OCR rather than at import."""
+    global _vision_client
+    with _vision_client_lock:
+        if _vision_client is None:
+            _vision_client = vision.ImageAnnotatorClient()
+        return _vision_client
+
+# Pages OCR'd per batch_annotate_images request, and batch requests in flight at once.
+# Batches are kept small so a request of rendered pages stays under Vision's payload limit.
+OCR_BATCH_SIZE = int(os.getenv('OCR_BATCH_SIZE', '4'))
+OCR_CONCURRENCY = int(os.getenv('OCR_CONCURRENCY', '4'))
+
+# Rasterization settings: 200 dpi grayscale is plenty for Vision text detection
+# and a fraction of the memory of a full-colour render
+OCR_DPI = int(os.getenv('OCR_DPI', '200'))
+OCR_GRAYSCALE = os.getenv('OCR_GRAYSCALE', 'true').lower() != 'false'
+
+def as_binary_stream(source):
+    """
+    Return something the PDF/image libraries can open from `source`, which may be
+    a path, the file's bytes, or a binary file-like object. Bytes are wrapped in
+    BytesIO, so downloaded attachments are parsed without touching disk.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return source
+
+@contextmanager
+def spill_to_disk(source, suffix=''):
+    """
+    Yield a filesystem path holding `source`, for tools that only read files
+    (poppler). Paths are passed through; bytes and file-like objects are
+    written to a uniquely named temp file that is removed afterwards.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        yield source
+        return
+
+    fd, temp_path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                f.write(source)
+            else:
+                source.seek(0)
+                while chunk := source.read(1 << 20):
+                    f.write(chunk)
+        yield temp_path
+    finally:
+        os.remove(temp_path)
 
 def extract_text_from_pdf(file_path):
     """
     Try to extract text from PDF. If text extraction fails (non-searchable PDF),
-    fall back to OCR.
+    fall back to OCR. Accepts a path, bytes or a binary file-like object.
     """
     try:
         # Try direct text extraction first
-        reader = PdfReader(file_path)
+        reader = PdfReader(as_binary_stream(file_path))
         text = ""
         for page in reader.pages:
             page_text = page.extract_text()
@@ -37,19 +98,23 @@ def extract_text_from_pdf(file_path):
         print(f"  ⚠ Error extracting text from PDF: {e}, trying OCR...")
         return ocr_pdf(file_path)
 
-def ocr_pdf(file_path):
+def ocr_pdf(file_path, client=None, concurrency=OCR_CONCURRENCY, dpi=OCR_DPI, grayscale=OCR_GRAYSCALE):
     """
     Convert PDF pages to images and OCR them using Google Vision API.
+    Pages are rasterized one at a time and PNG-encoded straight away, so only
+    one full-size page image is held in memory regardless of document length.
+    Pages are sent in batches, with up to `concurrency` batches in flight;
+    the returned text keeps page order.
+    In-memory PDFs are spilled to a unique temp file, since poppler reads from disk.
     """
     try:
-        # Convert PDF to images
-        images = convert_from_path(file_path)
-        
-        all_text = ""
-        for i, image in enumerate(images):
-            print(f"    OCR page {i+1}/{len(images)}...")
-            page_text = ocr_image(image)
-            all_text += page_text + "\n"
+        with spill_to_disk(file_path, suffix='.pdf') as pdf_path:
+            page_count = pdfinfo_from_path(pdf_path)['Pages']
+            
+            print(f"    OCR {page_count} pages at {dpi} dpi (batches of {OCR_BATCH_SIZE}, concurrency {concurrency})...")
+            pages = iter_pdf_page_pngs(pdf_path, page_count, dpi=dpi, grayscale=grayscale)
+            page_texts = ocr_png_stream(pages, client=client, concurrency=concurrency)
+        all_text = "".join(page_text + "\n" for page_text in page_texts)
         
         print(f"  ✓ OCR completed ({len(all_text)} chars)")
         return all_text
@@ -58,19 +123,105 @@ def ocr_pdf(file_path):
         print(f"  ✗ Error during OCR: {e}")
         return ""
 
-def ocr_image(image):
+def iter_pdf_page_pngs(file_path, page_count, dpi=OCR_DPI, grayscale=OCR_GRAYSCALE):
+    """Rasterize a PDF one page at a time, yielding each page as PNG bytes."""
+    for page_number in range(1, page_count + 1):
+        images = convert_from_path(
+            file_path,
+            dpi=dpi,
+            first_page=page_number,
+            last_page=page_number,
+            grayscale=grayscale
+        )
+        for image in images:
+            yield image_to_png_bytes(image)
+            image.close()
+
+def ocr_images(images, client=None, concurrency=OCR_CONCURRENCY, batch_size=OCR_BATCH_SIZE):
+    """
+    OCR a list of PIL Images concurrently, batch_size images per Vision request.
+    Returns one text string per image, in the same order.
+    """
+    return ocr_png_stream((image_to_png_bytes(image) for image in images),
+                          client=client, concurrency=concurrency, batch_size=batch_size)
+
+def ocr_png_stream(pages, client=None, concurrency=OCR_CONCURRENCY, batch_size=OCR_BATCH_SIZE):
+    """
+    OCR an iterable of PNG-encoded pages, batch_size pages per Vision request.
+    At most `concurrency` batches are in flight. The next batch is read from
+    the iterable while they run, before a slot frees up, so with a lazy page
+    generator at most concurrency + 1 batches of PNGs are held at once.
+    Returns one text string per page, in order.
+    """
+    texts = []
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for batch in batched(pages, batch_size):
+            if len(in_flight) >= max(1, concurrency):
+                texts.extend(in_flight.popleft().result())
+            in_flight.append(executor.submit(ocr_png_batch, batch, client))
+        while in_flight:
+            texts.extend(in_flight.popleft().result())
+    return texts
+
+def batched(iterable, size):
+    """Yield lists of up to `size` items from an iterable."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def ocr_png_batch(pages, client=None):
+    """
+    OCR several PNG-encoded pages with one batch_annotate_images call.
+    Falls back to one request per page if the batch call itself fails.
+    """
+    client = client or get_vision_client()
+    requests = [
+        vision.AnnotateImageRequest(
+            image=vision.Image(content=content),
+            features=[vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)]
+        )
+        for content in pages
+    ]
+    
+    try:
+        response = client.batch_annotate_images(requests=requests)
+    except Exception as e:
+        print(f"    ⚠ Batch OCR failed ({e}), retrying pages one at a time")
+        return [ocr_png(content, client) for content in pages]
+    
+    texts = []
+    for page_response in response.responses:
+        if page_response.error.message:
+            print(f"    ✗ OCR error: {page_response.error.message}")
+            texts.append("")
+        elif page_response.text_annotations:
+            texts.append(page_response.text_annotations[0].description)
+        else:
+            texts.append("")
+    return texts
+
+def image_to_png_bytes(image):
+    """Encode a PIL image as PNG bytes for the Vision API."""
+    img_byte_arr = io.BytesIO()
+    image.save(img_byte_arr, format='PNG')
+    return img_byte_arr.getvalue()
+
+def ocr_image(image, client=None):
     """
     OCR a PIL Image using Google Vision API.
     """
+    return ocr_png(image_to_png_bytes(image), client)
+
+def ocr_png(content, client=None):
+    """
+    OCR PNG-encoded image bytes using Google Vision API.
+    """
+    client = client or get_vision_client()
     try:
-        # Convert PIL image to bytes
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='PNG')
-        img_byte_arr = img_byte_arr.getvalue()
-        
         # Call Vision API
-        vision_image = vision.Image(content=img_byte_arr)
-        response = vision_client.text_detection(image=vision_image)
+        vision_image = vision.Image(content=content)
+        response = client.text_detection(image=vision_image)
         
         if response.error.message:
             raise Exception(response.error.message)
@@ -88,9 +239,10 @@ def ocr_image(image):
 def extract_text_from_image(file_path):
     """
     Extract text from an image file using OCR.
+    Accepts a path, bytes or a binary file-like object.
     """
     try:
-        image = Image.open(file_path)
+        image = Image.open(as_binary_stream(file_path))
         text = ocr_image(image)
         print(f"  ✓ OCR completed ({len(text)} chars)")
         return text
@@ -98,11 +250,15 @@ def extract_text_from_image(file_path):
         print(f"  ✗ Error extracting text from image: {e}")
         return ""
 
-def extract_text_from_file(file_path, content_type):
+def extract_text_from_file(file_path, content_type, filename=None):
     """
     Main function to extract text from a file based on its content type.
+    file_path may also be the file's bytes or a binary file-like object;
+    pass filename to label it in the log.
     """
-    print(f"  Processing {os.path.basename(file_path)} ({content_type})...")
+    if filename is None:
+        filename = os.path.basename(file_path) if isinstance(file_path, (str, os.PathLike)) else 'in-memory file'
+    print(f"  Processing {filename} ({content_type})...")
     
     if content_type == 'application/pdf':
         return extract_text_from_pdf(file_path)
@@ -0,0 +1,273 @@
+"""
+Address geocoding through Nominatim with a persistent on-disk cache.
+
+Results are cached in SQLite keyed by the normalized address string, including
+misses (negative results) so unknown addresses aren't retried on every run.
+Cache misses go through one shared requests.Session (or httpx.AsyncClient for
+the asyncio pipeline) and a token-bucket limiter that keeps us within
+Nominatim's 1 request/second usage policy, even when emails are processed
+concurrently.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+import httpx
+import requests
+from process_data import normalize_address
+
+BASE_DIR = Path(__file__).resolve().parent
+
+NOMINATIM_URL = os.getenv('NOMINATIM_URL', 'https://nominatim.openstreetmap.org/search')
+USER_AGENT = 'SF-Address-Geocoder/1.0'
+REQUEST_TIMEOUT = 10
+
+GEOCODE_CACHE_PATH = os.getenv('GEOCODE_CACHE_PATH', str(BASE_DIR / '.cache' / 'geocode.sqlite3'))
+# Found coordinates rarely change; misses are retried sooner in case the address was a typo upstream
+CACHE_TTL_SECONDS = 180 * 24 * 3600
+NEGATIVE_CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+class TokenBucket:
+    """Thread-safe token bucket: allows `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate=1.0, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _try_take(self):
+        """Take a token if one is available. Returns 0, or the seconds to wait before retrying."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while wait := self._try_take():
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Wait without blocking the event loop until a token is available, then take it."""
+        while wait := self._try_take():
+            await asyncio.sleep(wait)
+
+class GeocodeCache:
+    """SQLite-backed cache of geocoding results, including negative results."""
+
+    def __init__(self, path=GEOCODE_CACHE_PATH, ttl=CACHE_TTL_SECONDS, negative_ttl=NEGATIVE_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        if path != ':memory:':
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("""
+                create table if not exists geocode_cache (
+                    key text primary key,
+                    lat real,
+                    lng real,
+                    cached_at real not null
+                )
+            """)
+            self._conn.commit()
+
+    def get(self, key):
+        """
+        Look up a cached result.
+        Returns (hit, result) where result is None for a cached miss.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'select lat, lng, cached_at from geocode_cache where key = ?', (key,)
+            ).fetchone()
+        if row is None:
+            return False, None
+
+        lat, lng, cached_at = row
+        found = lat is not None
+        age = time.time() - cached_at
+        if age > (self.ttl if found else self.negative_ttl):
+            return False, None
+        return True, ({'lat': lat, 'lng': lng} if found else None)
+
+    def set(self, key, result):
+        """Store a result; pass None to record that the address could not be geocoded."""
+        lat = result['lat'] if result else None
+        lng = result['lng'] if result else None
+        with self._lock:
+            self._conn.execute(
+                'insert or replace into geocode_cache (key, lat, lng, cached_at) values (?, ?, ?, ?)',
+                (key, lat, lng, time.time())
+            )
+            self._conn.commit()
+
+class NominatimClient:
+    """Cached, rate-limited Nominatim search client. Safe to share between threads."""
+
+    def __init__(self, url=NOMINATIM_URL, cache=None, limiter=None, session=None):
+        self.url = url
+        self.cache = cache if cache is not None else GeocodeCache()
+        self.limiter = limiter if limiter is not None else TokenBucket(rate=1.0)
+        self.session = session if session is not None else requests.Session()
+        self.session.headers.update({'User-Agent': USER_AGENT})
+
+    def geocode(self, addr_string: str) -> Optional[Dict[str, float]]:
+        """Geocode a single address string, consulting the cache first."""
+        key = normalize_address(addr_string)
+        hit, result = self.cache.get(key)
+        if hit:
+            return result
+
+        try:
+            self.limiter.acquire()
+            response = self.session.get(self.url, params=search_params(addr_string), timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError):
+            # Transient failure - don't cache, so the next run retries
+            return None
+
+        result = parse_search_result(data)
+        self.cache.set(key, result)
+        return result
+
+class AsyncNominatimClient:
+    """
+    asyncio counterpart of NominatimClient, sharing its cache format and rate limit.
+    Requests go through one pooled httpx.AsyncClient; close it with aclose().
+    """
+
+    def __init__(self, url=NOMINATIM_URL, cache=None, limiter=None, http=None):
+        self.url = url
+        self.cache = cache if cache is not None else GeocodeCache()
+        self.limiter = limiter if limiter is not None else TokenBucket(rate=1.0)
+        self.http = http if http is not None else httpx.AsyncClient(timeout=REQUEST_TIMEOUT)
+        self.http.headers['User-Agent'] = USER_AGENT
+
+    async def geocode(self, addr_string: str) -> Optional[Dict[str, float]]:
+        """Geocode a single address string, consulting the cache first."""
+        key = normalize_address(addr_string)
+        # SQLite calls block, so they run in a worker thread rather than on the event loop
+        hit, result = await asyncio.to_thread(self.cache.get, key)
+        if hit:
+            return result
+
+        try:
+            await self.limiter.acquire_async()
+            response = await self.http.get(self.url, params=search_params(addr_string))
+            response.raise_for_status()
+            data = response.json()
+        except (httpx.HTTPError, ValueError):
+            # Transient failure - don't cache, so the next run retries
+            return None
+
+        result = parse_search_result(data)
+        await asyncio.to_thread(self.cache.set, key, result)
+        return result
+
+    async def aclose(self):
+        await self.http.aclose()
+
+def search_params(addr_string):
+    return {
+        'q': addr_string,
+        'format': 'json',
+        'limit': 1,
+        'countrycodes': 'us'
+    }
+
+def parse_search_result(data):
+    """Coordinates of the first Nominatim search hit, or None if there isn't a usable one."""
+    try:
+        if data:
+            return {
+                'lat': float(data[0]['lat']),
+                'lng': float(data[0]['lon'])
+            }
+    except (KeyError, ValueError, IndexError, TypeError):
+        pass
+    return None
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Return the process-wide Nominatim client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = NominatimClient()
+        return _client
+
+def get_location_from_address(address: Dict[str, str], client: Optional[NominatimClient] = None) -> Optional[Dict[str, float]]:
+    """
+    Convert a San Francisco address object to latitude and longitude coordinates.
+    For corner buildings, tries both street addresses to get the best result.
+
+    Args:
+        address (Dict): Address object containing:
+            - street_address: Primary street address
+            - secondary_address: Alternate street address (for corner buildings)
+            - zip_code: ZIP code
+            - property_type: Type of property (not used in geocoding)
+        client: Geocoding client to use (defaults to the shared cached client)
+
+    Returns:
+        Dict with 'lat' and 'lng' keys, or {} if geocoding fails
+    """
+    client = client or get_client()
+
+    # Try geocoding each address until we get a result
+    for addr_string in address_queries(address):
+        result = client.geocode(addr_string)
+        if result:
+            print(f"Geocoding result for {addr_string}: {result}")
+            return result
+
+    print(f"No results found for any address variants")
+    return {}
+
+async def get_location_from_address_async(address: Dict[str, str], client: AsyncNominatimClient) -> Optional[Dict[str, float]]:
+    """asyncio version of get_location_from_address."""
+    for addr_string in address_queries(address):
+        result = await client.geocode(addr_string)
+        if result:
+            print(f"Geocoding result for {addr_string}: {result}")
+            return result
+
+    print(f"No results found for any address variants")
+    return {}
+
+def address_queries(address):
+    """
+    Search strings to try for an address, in order: the primary street address,
+    then the alternate street for corner buildings.
+    """
+    addresses_to_try = []
+
+    # Try primary street address first
+    if address.get('street_address'):
+        addr_parts = [address['street_address'], 'San Francisco', 'CA']
+        if address.get('zip_code'):
+            addr_parts.append(address['zip_code'])
+        addresses_to_try.append(', '.join(addr_parts))
+
+    # Try secondary address (alternate street for corner buildings)
+    if address.get('secondary_address'):
+        addr_parts = [address['secondary_address'], 'San Francisco', 'CA']
+        if address.get('zip_code'):
+            addr_parts.append(address['zip_code'])
+        addresses_to_try.append(', '.join(addr_parts))
+
+    return addresses_to_try
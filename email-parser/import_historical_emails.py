@@ -0,0 +1,331 @@
+"""
+Import historical emails through the import-historical-emails edge function
+and parse them as they arrive.
+
+Each call imports one page of the mailbox and returns the token for the next
+page. Calls are paced by AdaptivePacer:
+  - after a healthy call, the delay shrinks by a fixed step (down to none);
+  - after an error, a 429/5xx, or a call slower than IMPORT_SLOW_SECONDS, the
+    delay doubles (up to MAX_DELAY) and the same page is retried.
+The import gives up after MAX_CONSECUTIVE_ERRORS failed calls in a row.
+
+The next page token and running totals are saved to IMPORT_STATE_PATH after
+every page, so an interrupted import picks up where it stopped. The state is
+cleared once the last page is in. --restart ignores any saved token.
+
+Imported emails are handed to the parsing pipeline while the import goes on. A
+background thread is woken after each page that brought in new mail, and runs
+the oldest unprocessed emails through process_emails in batches until none are
+left. Emails left unprocessed (a failure, or one that already had a listing)
+are not picked up again in this run. A batch that raises is logged, its
+emails are left unprocessed, and the error is listed in the final summary;
+the feeder carries on with the next batch. --workers N processes N emails at
+once, and process_emails.listing_lock keeps concurrent copies of one listing
+from being inserted twice.
+--no-process only imports.
+
+Usage:
+    python import_historical_emails.py [--restart] [--no-process] [--workers N] [--url URL]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+import requests
+import config
+from process_emails import (
+    OUTCOME_FAILED, OUTCOME_SKIPPED, EmailStatusBuffer, load_sf_neighborhoods, print_summary, run_emails_concurrently, supabase,
+)
+
+FUNCTION_URL = f"{config.SUPABASE_URL.rstrip('/')}/functions/v1/import-historical-emails"
+BASE_DIR = Path(__file__).resolve().parent
+IMPORT_STATE_PATH = os.getenv('IMPORT_STATE_PATH', str(BASE_DIR / '.cache' / 'historical_import_state.json'))
+
+# The shell script this replaces waited a fixed 5 seconds between pages
+INITIAL_DELAY = 5.0
+MIN_DELAY = 0.0
+MAX_DELAY = 120.0
+DELAY_STEP = 1.0
+# A page slower than this counts as the function struggling
+IMPORT_SLOW_SECONDS = float(os.getenv('IMPORT_SLOW_SECONDS', '60'))
+REQUEST_TIMEOUT = 300
+MAX_CONSECUTIVE_ERRORS = 5
+PROCESS_BATCH_SIZE = 25
+
+class AdaptivePacer:
+    """
+    Delay between calls, adjusted additively-increase/multiplicatively-decrease
+    on the call rate: each healthy call takes `step` seconds off the delay, each
+    failed or slow call doubles it.
+    """
+
+    def __init__(self, delay=INITIAL_DELAY, min_delay=MIN_DELAY, max_delay=MAX_DELAY, step=DELAY_STEP,
+                 slow_seconds=IMPORT_SLOW_SECONDS):
+        self.delay = delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.step = step
+        self.slow_seconds = slow_seconds
+
+    def record(self, latency, ok=True, retry_after=None):
+        if ok and latency < self.slow_seconds:
+            self.delay = max(self.min_delay, self.delay - self.step)
+        else:
+            self.delay = min(self.max_delay, max(self.delay * 2, self.step))
+        if retry_after:
+            self.delay = min(self.max_delay, max(self.delay, retry_after))
+
+    def wait(self):
+        if self.delay > 0:
+            time.sleep(self.delay)
+
+def retry_after_seconds(response):
+    try:
+        return float(response.headers.get('Retry-After', ''))
+    except ValueError:
+        return None
+
+def load_state(path=IMPORT_STATE_PATH):
+    """The interrupted import's state, or None to start from the first page."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        print(f"⚠ Ignoring unreadable import state {path}")
+        return None
+
+def save_state(state, path=IMPORT_STATE_PATH):
+    """Write the state to a temp file and rename it over the old one, so a crash leaves one or the other."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def clear_state(path=IMPORT_STATE_PATH):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def call_import_function(session, url, key, page_token):
+    """
+    Import one page. Returns (result, retry_after): the decoded response on
+    success, otherwise None and the server's Retry-After in seconds if it sent one.
+    """
+    body = {'pageToken': page_token} if page_token else {}
+    try:
+        response = session.post(url, json=body, timeout=REQUEST_TIMEOUT, headers={
+            'Authorization': f"Bearer {key}",
+            'apikey': key,
+        })
+    except requests.RequestException as e:
+        print(f"  ✗ Request failed: {e}")
+        return None, None
+
+    if response.status_code != 200:
+        print(f"  ✗ HTTP {response.status_code}: {response.text[:200]}")
+        return None, retry_after_seconds(response)
+    try:
+        result = response.json()
+    except ValueError:
+        print(f"  ✗ Invalid JSON response: {response.text[:200]}")
+        return None, None
+    if not isinstance(result, dict) or result.get('new_emails') is None:
+        print(f"  ✗ Function returned an error: {str(result)[:200]}")
+        return None, None
+    return result, None
+
+def run_import(url=FUNCTION_URL, key=config.SUPABASE_KEY, state_path=IMPORT_STATE_PATH, pacer=None,
+               on_page=None, restart=False, session=None):
+    """
+    Call the import function page by page until the mailbox is exhausted,
+    saving the next page token after each page. on_page(result) is called after
+    each page. Returns the totals, with 'complete' False if the import gave up.
+    """
+    pacer = pacer or AdaptivePacer()
+    session = session or requests.Session()
+    state = None if restart else load_state(state_path)
+    if state:
+        print(f"Resuming the import at page {state['batches'] + 1} ({state['imported']} emails imported so far)")
+    else:
+        state = {'next_page_token': None, 'batches': 0, 'imported': 0, 'skipped': 0, 'errors': 0}
+    state['complete'] = False
+
+    consecutive_errors = 0
+    first_call = True
+    while True:
+        if not first_call:
+            pacer.wait()
+        first_call = False
+
+        print(f"\nRunning batch {state['batches'] + 1}...")
+        start = time.perf_counter()
+        result, retry_after = call_import_function(session, url, key, state['next_page_token'])
+        latency = time.perf_counter() - start
+        pacer.record(latency, ok=result is not None, retry_after=retry_after)
+
+        if result is None:
+            consecutive_errors += 1
+            if consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
+                print(f"✗ Giving up after {consecutive_errors} failed calls in a row; run again to resume")
+                break
+            print(f"  Retrying the same page in {pacer.delay:.1f}s")
+            continue
+        consecutive_errors = 0
+
+        state['batches'] += 1
+        state['imported'] += result.get('new_emails') or 0
+        state['skipped'] += result.get('skipped') or 0
+        state['errors'] += result.get('errors') or 0
+        next_page_token = result.get('next_page_token')
+        print(f"  New: {result.get('new_emails')}, skipped: {result.get('skipped')}, "
+              f"errors: {result.get('errors')} in {latency:.1f}s; next call in {pacer.delay:.1f}s")
+        if on_page:
+            on_page(result)
+
+        if not result.get('has_more') or not next_page_token:
+            state['complete'] = True
+            clear_state(state_path)
+            break
+        state['next_page_token'] = next_page_token
+        save_state({key: value for key, value in state.items() if key != 'complete'}, state_path)
+
+    return state
+
+class PipelineFeeder(threading.Thread):
+    """
+    Background thread running unprocessed emails through process_emails while
+    the import continues. notify() after a page brings in new mail; finish()
+    once the import is over, which drains what is left and stops the thread.
+    Batches that raised are recorded in `errors` as (email ids, message).
+    """
+
+    def __init__(self, workers=1, batch_size=PROCESS_BATCH_SIZE):
+        super().__init__(name='pipeline-feeder', daemon=True)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.outcomes = []
+        self.errors = []
+        self.status_buffer = EmailStatusBuffer()
+        # Loaded here so a missing snapshot fails the import before it starts
+        self.neighborhoods = load_sf_neighborhoods()
+        self._failed_ids = set()
+        self._wake = threading.Event()
+        self._done = False
+
+    def notify(self):
+        self._wake.set()
+
+    def finish(self):
+        self._done = True
+        self._wake.set()
+
+    def next_emails(self):
+        """The oldest unprocessed emails, leaving out the ones that already failed this run."""
+        emails = supabase.table('emails')\
+            .select('*')\
+            .eq('processed', False)\
+            .order('received_date', desc=False)\
+            .limit(self.batch_size + len(self._failed_ids))\
+            .execute().data
+        return [email for email in emails if email['id'] not in self._failed_ids][:self.batch_size]
+
+    def drain(self, neighborhoods):
+        while True:
+            try:
+                emails = self.next_emails()
+            except Exception as e:
+                print(f"✗ Error querying unprocessed emails: {e}")
+                return
+            if not emails:
+                return
+            try:
+                outcomes = run_emails_concurrently(emails, neighborhoods, self.workers, self.status_buffer)
+                # Mark them processed before asking for the next batch, or it would return them again
+                self.status_buffer.flush()
+            except Exception as e:
+                print(f"✗ Error processing {len(emails)} emails, leaving them unprocessed: {e}")
+                self.errors.append(([email['id'] for email in emails], f"{type(e).__name__}: {e}"))
+                self._failed_ids.update(email['id'] for email in emails)
+                continue
+            for email, outcome in zip(emails, outcomes):
+                # These stay unprocessed; don't pick them up again
+                left_unprocessed = outcome['status'] == OUTCOME_FAILED or \
+                    outcome['status'] == OUTCOME_SKIPPED and outcome['listing_id']
+                if left_unprocessed or email['id'] in self.status_buffer.failed_ids:
+                    self._failed_ids.add(email['id'])
+            self.outcomes.extend(outcomes)
+
+    def run(self):
+        try:
+            while True:
+                self._wake.wait()
+                self._wake.clear()
+                # Read before draining, so the drain after finish() is the last one
+                done = self._done
+                self.drain(self.neighborhoods)
+                if done:
+                    return
+        finally:
+            self.status_buffer.flush()
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Import historical emails and parse them as they arrive.")
+    parser.add_argument('--restart', action='store_true', help="Start from the first page, ignoring a saved page token")
+    parser.add_argument('--no-process', action='store_true', help="Only import; leave parsing to process_emails")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of emails to process concurrently (default: 1)")
+    parser.add_argument('--url', default=FUNCTION_URL, help="Import function URL (default: the project's function)")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    return args
+
+def main():
+    args = parse_args(sys.argv[1:])
+
+    print("="*40)
+    print("Starting Batch Email Import")
+    print(f"Started at: {datetime.now()}")
+    print("="*40)
+
+    feeder = None
+    on_page = None
+    if not args.no_process:
+        feeder = PipelineFeeder(workers=args.workers)
+        feeder.start()
+        on_page = lambda result: result.get('new_emails') and feeder.notify()
+
+    try:
+        totals = run_import(args.url, on_page=on_page, restart=args.restart)
+    finally:
+        if feeder:
+            print("\nImport finished; waiting for the pipeline to catch up...")
+            feeder.finish()
+            feeder.join()
+
+    print("\n" + "="*40)
+    print("✓ ALL EMAILS IMPORTED!" if totals['complete'] else "✗ IMPORT STOPPED EARLY")
+    print("="*40)
+    print(f"Total batches run: {totals['batches']}")
+    print(f"Total emails imported: {totals['imported']}")
+    print(f"Total emails skipped: {totals['skipped']}")
+    print(f"Total errors: {totals['errors']}")
+    print("="*40)
+    if feeder:
+        print_summary(feeder.outcomes, feeder.status_buffer.failed_ids)
+        for email_ids, error in feeder.errors:
+            print(f"  ✗ Batch of {len(email_ids)} emails failed ({error}): {email_ids}")
+    sys.exit(0 if totals['complete'] and not (feeder and feeder.errors) else 1)
+
+if __name__ == "__main__":
+    main()
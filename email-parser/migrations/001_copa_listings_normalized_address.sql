@@ -0,0 +1,16 @@
+-- Dedupe key for copa_listings_new.
+--
+-- check_duplicate_listing (process_emails.py, process_emails_async.py) looks
+-- listings up by normalized_address with one equality query, and refuses to
+-- run if the column is missing. New listings carry the key in listing_data;
+-- insert_listing_with_encryption populates the row from listing_data, so the
+-- key is stored as soon as the column exists. Rows written before this
+-- migration are filled in by backfill_normalized_addresses.py.
+--
+-- Apply before deploying the pipeline, then run:
+--     python backfill_normalized_addresses.py
+
+alter table copa_listings_new add column if not exists normalized_address text;
+
+create index if not exists copa_listings_new_normalized_address_idx
+    on copa_listings_new (normalized_address);
@@ -0,0 +1,23 @@
+-- Retention cutoff for delete_old_emails.
+--
+-- delete_old_files.py removes the attachment files of emails received before
+-- the cutoff it froze when the sweep started, which may be several runs ago.
+-- It then passes that cutoff here, so only emails whose files are gone are
+-- deleted. Mail that expired after the cutoff waits for the next sweep instead
+-- of losing its rows while its files stay in storage.
+--
+-- Called without arguments it keeps the old 90-day window
+-- (RETENTION_DAYS in delete_old_files.py).
+
+drop function if exists delete_old_emails();
+
+create or replace function delete_old_emails(cutoff timestamptz default now() - interval '90 days')
+returns void
+language sql
+as $$
+    delete from email_attachments
+    where email_id in (select id from emails where received_date < cutoff);
+
+    delete from emails
+    where received_date < cutoff;
+$$;
@@ -0,0 +1,220 @@
+"""
+San Francisco neighborhood boundaries and point-in-polygon lookups.
+
+Polygons are held in a shapely STRtree so a lookup only runs the exact
+containment test against the few polygons whose bounding boxes contain the
+point, and whole batches of points can be assigned in one vectorized query.
+
+Boundaries are read from a local GeoJSON snapshot (data/sf_neighborhoods.geojson)
+so startup never waits on data.sfgov.org. The snapshot is plain JSON, one
+neighborhood per line, so a refresh can be reviewed as a diff and loading it
+never executes anything. Creating it is a required deploy step:
+
+    python neighborhoods.py refresh
+
+and the file is meant to be committed. Without a snapshot, loading raises
+SnapshotMissingError and the pipeline refuses to start, rather than running
+with no neighborhoods and flagging every listing for review.
+"""
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+import shapely
+from shapely import STRtree
+from shapely.geometry import mapping, shape, Point
+from sodapy import Socrata
+
+class SnapshotMissingError(RuntimeError):
+    """No usable neighborhoods snapshot; run `python neighborhoods.py refresh`."""
+
+class NeighborhoodIndex:
+    """
+    Spatial index over neighborhood polygons.
+    Iterates and sizes like the list of {'name', 'geometry'} dicts it was built from.
+    """
+
+    def __init__(self, neighborhoods):
+        self.neighborhoods = list(neighborhoods)
+        self.names = [n['name'] for n in self.neighborhoods]
+        self._tree = STRtree([n['geometry'] for n in self.neighborhoods])
+
+    def __len__(self):
+        return len(self.neighborhoods)
+
+    def __iter__(self):
+        return iter(self.neighborhoods)
+
+    def lookup(self, lat, lng) -> Optional[str]:
+        """Return the name of the neighborhood containing the point, or None."""
+        matches = self._tree.query(Point(lng, lat), predicate='within')
+        if len(matches) == 0:
+            return None
+        # Lowest index wins, matching the old first-match-in-list behaviour
+        return self.names[matches.min()]
+
+    def lookup_many(self, points: Iterable[Tuple[float, float]]) -> List[Optional[str]]:
+        """Return the neighborhood name (or None) for each (lat, lng) pair, in order."""
+        points = list(points)
+        if not points:
+            return []
+
+        lats, lngs = zip(*points)
+        geometries = shapely.points(lngs, lats)
+        point_idx, tree_idx = self._tree.query(geometries, predicate='within')
+
+        results = [None] * len(points)
+        # Walk matches from highest to lowest tree index so the lowest one is kept
+        for p, t in sorted(zip(point_idx.tolist(), tree_idx.tolist()), key=lambda m: -m[1]):
+            results[p] = self.names[t]
+        return results
+
+BASE_DIR = Path(__file__).resolve().parent
+
+SNAPSHOT_PATH = os.getenv('NEIGHBORHOODS_SNAPSHOT_PATH', str(BASE_DIR / 'data' / 'sf_neighborhoods.geojson'))
+SNAPSHOT_VERSION = 2
+# Boundaries change very rarely; after this long we only warn, never refetch at startup
+SNAPSHOT_MAX_AGE_DAYS = 180
+
+DATASET_DOMAIN = "data.sfgov.org"
+DATASET_ID = "gfpk-269f"
+FETCH_TIMEOUT_SECONDS = 30
+
+# Cache neighborhoods data globally to avoid reloading
+_NEIGHBORHOODS_CACHE = None
+
+def fetch_sf_neighborhoods():
+    """Fetch neighborhood polygons from DataSF as a list of {'name', 'geometry'} dicts."""
+    client = Socrata(DATASET_DOMAIN, None, timeout=FETCH_TIMEOUT_SECONDS)
+    neighborhoods = client.get(DATASET_ID, limit=2000)
+
+    processed = []
+    for n in neighborhoods:
+        try:
+            # Convert GeoJSON dict to shapely geometry
+            geometry = shape(n['the_geom'])
+            processed.append({
+                'name': n['name'],
+                'geometry': geometry
+            })
+        except Exception as e:
+            print(f"  ⚠ Error processing {n.get('name', 'Unknown')}: {e}")
+            continue
+    return processed
+
+def save_snapshot(neighborhoods, path=SNAPSHOT_PATH):
+    """
+    Write neighborhoods to a versioned GeoJSON FeatureCollection, one feature
+    per line, replacing any existing file atomically.
+    """
+    header = {
+        'type': 'FeatureCollection',
+        'version': SNAPSHOT_VERSION,
+        'source': f"{DATASET_DOMAIN}/{DATASET_ID}",
+        'fetched_at': datetime.now(timezone.utc).isoformat(),
+    }
+    features = [json.dumps({'type': 'Feature', 'properties': {'name': n['name']}, 'geometry': mapping(n['geometry'])})
+                for n in neighborhoods]
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        # The header's closing brace is reopened to append the features, one per line
+        f.write(json.dumps(header)[:-1] + ', "features": [\n')
+        f.write(',\n'.join(features))
+        f.write('\n]}\n')
+    os.replace(tmp_path, path)
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """
+    Read a snapshot written by save_snapshot.
+    Returns (neighborhoods, fetched_at) or (None, None) if missing or from another format version.
+    """
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return None, None
+
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        print(f"  ⚠ Ignoring neighborhoods snapshot with version {snapshot.get('version')}")
+        return None, None
+
+    neighborhoods = [{'name': feature['properties']['name'], 'geometry': shape(feature['geometry'])}
+                     for feature in snapshot['features']]
+    return neighborhoods, datetime.fromisoformat(snapshot['fetched_at'])
+
+def snapshot_is_stale(fetched_at, max_age_days=SNAPSHOT_MAX_AGE_DAYS):
+    return datetime.now(timezone.utc) - fetched_at > timedelta(days=max_age_days)
+
+def refresh_snapshot(path=SNAPSHOT_PATH):
+    """Fetch the latest boundaries from DataSF and rewrite the local snapshot."""
+    print("Fetching SF neighborhoods from DataSF...")
+    neighborhoods = fetch_sf_neighborhoods()
+    if not neighborhoods:
+        raise RuntimeError("DataSF returned no neighborhoods; keeping existing snapshot")
+    save_snapshot(neighborhoods, path)
+    print(f"✓ Saved {len(neighborhoods)} neighborhoods to {path}")
+    return neighborhoods
+
+def load_sf_neighborhoods():
+    """
+    Load neighborhood polygons as a NeighborhoodIndex from the local snapshot.
+    DataSF is never contacted here. Raises SnapshotMissingError if there is no
+    snapshot in the current format, so a deploy without one fails at startup.
+    """
+    global _NEIGHBORHOODS_CACHE
+
+    # Return cached data if available
+    if _NEIGHBORHOODS_CACHE is not None:
+        return _NEIGHBORHOODS_CACHE
+
+    print("Loading SF neighborhoods data...")
+    neighborhoods, fetched_at = load_snapshot()
+    if not neighborhoods:
+        raise SnapshotMissingError(f"No neighborhoods snapshot at {SNAPSHOT_PATH}. "
+                                   f"Run `python neighborhoods.py refresh` and commit the file")
+    if snapshot_is_stale(fetched_at):
+        print(f"  ⚠ Neighborhoods snapshot is from {fetched_at:%Y-%m-%d}; "
+              f"run `python neighborhoods.py refresh` to update it")
+
+    _NEIGHBORHOODS_CACHE = NeighborhoodIndex(neighborhoods)
+    print(f"✓ Loaded {len(neighborhoods)} neighborhoods")
+    return _NEIGHBORHOODS_CACHE
+
+def _as_index(neighborhoods):
+    if isinstance(neighborhoods, NeighborhoodIndex):
+        return neighborhoods
+    return NeighborhoodIndex(neighborhoods)
+
+def get_neighborhood_from_location(lat, lng, neighborhoods):
+    """Get neighborhood from location"""
+    try:
+        return _as_index(neighborhoods).lookup(lat, lng)
+    except Exception as e:
+        print(f"  ⚠ Error finding neighborhood: {e}")
+        return None
+
+def assign_neighborhoods(points, neighborhoods):
+    """
+    Assign neighborhoods to many (lat, lng) points in one spatial query.
+    Returns a list of names (None where no neighborhood contains the point).
+    """
+    points = list(points)
+    try:
+        return _as_index(neighborhoods).lookup_many(points)
+    except Exception as e:
+        print(f"  ⚠ Error assigning neighborhoods: {e}")
+        return [None] * len(points)
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['refresh']:
+        refresh_snapshot()
+    else:
+        neighborhoods, fetched_at = load_snapshot()
+        if neighborhoods is None:
+            print(f"No snapshot at {SNAPSHOT_PATH}. Run: python neighborhoods.py refresh")
+        else:
+            status = "stale" if snapshot_is_stale(fetched_at) else "fresh"
+            print(f"{len(neighborhoods)} neighborhoods, fetched {fetched_at.isoformat()} ({status})")
@@ -1,95 +1,445 @@
+"""
+Email parsing with Gemini.
+
+One model instance is reused for every call, with prompt.txt sent as its system
+instruction rather than pasted in front of every email. Set
+GEMINI_CONTEXT_CACHE=1 to upload the prompt once as Gemini cached content, so
+its tokens are billed at the cached rate. If the cache can't be created, the
+client falls back to the plain system instruction.
+
+Parsed responses are stored in SQLite keyed by a hash of the prompt version,
+model, subject, body and attachment texts, so reprocessing an email doesn't call
+the API again. Editing prompt.txt changes the prompt version, and old entries
+are then ignored.
+
+Replies use Gemini's JSON response mode with a schema built from prompt.txt's
+Output Format (see ai_schema) and are validated in one pass. A reply that
+doesn't decode or validate gets a repair call, which sends only the broken
+JSON and the problems found, never the email again.
+
+Before the call, the body and attachments are cleaned and trimmed to
+AI_TOKEN_BUDGET tokens by preprocess.prepare_ai_input.
+
+Rate-limit (429) and server (5xx) errors are retried with exponential backoff.
+For backfills, parse_emails_batch runs many emails through a bounded pool of
+concurrent calls. Each result is appended to a JSONL checkpoint, so a rerun
+after an interruption picks up where it stopped:
+
+    python parse_with_ai.py --batch emails.jsonl --checkpoint parsed.jsonl [--concurrency N]
+"""
+import argparse
+import datetime
+import hashlib
 import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 import config
+from ai_schema import SchemaError, schema_from_prompt, validate_listing
+from preprocess import AI_TOKEN_BUDGET, prepare_ai_input
+
+BASE_DIR = Path(__file__).resolve().parent
+
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+GEMINI_CONTEXT_CACHE = os.getenv('GEMINI_CONTEXT_CACHE', '').lower() in ('1', 'true', 'yes')
+CONTEXT_CACHE_TTL = datetime.timedelta(hours=1)
+AI_CACHE_PATH = os.getenv('AI_CACHE_PATH', str(BASE_DIR / '.cache' / 'ai_responses.sqlite3'))
+
+AI_REPAIR_ATTEMPTS = int(os.getenv('AI_REPAIR_ATTEMPTS', '1'))
+AI_MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', '5'))
+AI_BATCH_CONCURRENCY = int(os.getenv('AI_BATCH_CONCURRENCY', '8'))
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 60.0
+
+# 429 and 5xx (including timeouts); anything else won't go away by asking again
+RETRYABLE_ERRORS = (google_exceptions.TooManyRequests, google_exceptions.ServerError)
 
 # Configure Gemini
 genai.configure(api_key=config.GEMINI_API_KEY)
 
-# Load the prompt
-with open('prompt.txt', 'r') as f:
+# Load the prompt (relative to this file, so scripts can run from any directory)
+with open(BASE_DIR / 'prompt.txt', 'r') as f:
     SYSTEM_PROMPT = f.read()
 
-def parse_email_with_ai(email_subject, email_text, attachment_texts):
-    """
-    Send email and attachment text to Gemini API for parsing.
-    Returns parsed JSON data.
-    """
+# Bump when the way replies are requested or validated changes, so cached responses are refreshed
+RESPONSE_FORMAT_VERSION = 2
+PROMPT_VERSION = hashlib.sha256(f"{RESPONSE_FORMAT_VERSION}\n{SYSTEM_PROMPT}".encode()).hexdigest()[:16]
+
+RESPONSE_SCHEMA = schema_from_prompt(SYSTEM_PROMPT)
+GENERATION_CONFIG = {'response_mime_type': 'application/json', 'response_schema': RESPONSE_SCHEMA}
 
-    # Combine email subject and text
+REPAIR_INSTRUCTION = (
+    "You fix JSON documents. Return the given JSON corrected so that it fixes every listed problem "
+    "and matches the response schema. Keep all values that are already valid, and do not add information."
+)
+
+def build_email_content(email_subject, email_text, attachment_texts):
+    """The per-email part of the request: subject, body and each attachment's text."""
     combined_text = f"EMAIL SUBJECT:\n{email_subject}\n\nEMAIL BODY:\n{email_text}\n\n"
-    
+
     if attachment_texts:
         combined_text += "ATTACHMENTS:\n"
         for i, att_text in enumerate(attachment_texts, 1):
             combined_text += f"\n--- ATTACHMENT {i} ---\n{att_text}\n"
-    
-    # Prepare the full prompt
-    full_prompt = f"{SYSTEM_PROMPT}\n\n---\n\nHere is the email data to parse:\n\n{combined_text}"
-    
-    try:
-        # Call Gemini API
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        print("  Calling Gemini API...")
-        response = model.generate_content(full_prompt)
-        
-        # Extract JSON from response
-        response_text = response.text.strip()
-        
-        # Sometimes the model wraps JSON in markdown code blocks
-        if response_text.startswith('```json'):
-            response_text = response_text[7:]  # Remove ```json
-        if response_text.startswith('```'):
-            response_text = response_text[3:]   # Remove ```
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]  # Remove trailing ```
-        
-        response_text = response_text.strip()
-        
-        # Parse JSON
-        parsed_data = json.loads(response_text)
-        
+
+    return f"Here is the email data to parse:\n\n{combined_text}"
+
+def response_cache_key(email_subject, email_text, attachment_texts, model_name=GEMINI_MODEL):
+    payload = json.dumps([PROMPT_VERSION, model_name, email_subject, email_text, list(attachment_texts or [])])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def parse_response_text(response_text):
+    """Strip any Markdown code fence around the model's reply and decode the JSON."""
+    # JSON mode shouldn't produce fences, but a repaired or cached reply might have them
+    response_text = response_text.strip()
+
+    # Sometimes the model wraps JSON in markdown code blocks
+    if response_text.startswith('```json'):
+        response_text = response_text[7:]  # Remove ```json
+    if response_text.startswith('```'):
+        response_text = response_text[3:]   # Remove ```
+    if response_text.endswith('```'):
+        response_text = response_text[:-3]  # Remove trailing ```
+
+    return json.loads(response_text.strip())
+
+def decode_listing(response_text):
+    """Decode and validate a reply. Raises json.JSONDecodeError or SchemaError."""
+    return validate_listing(parse_response_text(response_text), RESPONSE_SCHEMA)
+
+def build_repair_content(response_text, problems):
+    listed = '\n'.join(f"- {problem}" for problem in problems)
+    return f"Problems:\n{listed}\n\nJSON:\n{response_text}"
+
+class GeminiResponseError(ValueError):
+    """The model replied, but not with JSON that fits the schema, even after repair."""
+
+    def __init__(self, message, response_text):
+        super().__init__(message)
+        self.response_text = response_text
+
+def backoff_delay(attempt):
+    """Seconds to wait before retry number `attempt` (0-based): exponential, capped, with jitter."""
+    return min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+class ResponseCache:
+    """SQLite store of parsed Gemini responses. Safe to share between threads."""
+
+    def __init__(self, path=AI_CACHE_PATH):
+        if path != ':memory:':
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("""
+                create table if not exists ai_responses (
+                    key text primary key,
+                    prompt_version text not null,
+                    response text not null,
+                    cached_at real not null
+                )
+            """)
+            self._conn.commit()
+
+    def get(self, key):
+        """Return the cached parsed response, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute('select response from ai_responses where key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, parsed_data):
+        with self._lock:
+            self._conn.execute(
+                'insert or replace into ai_responses values (?, ?, ?, ?)',
+                (key, PROMPT_VERSION, json.dumps(parsed_data), time.time())
+            )
+            self._conn.commit()
+
+class GeminiClient:
+    """
+    Cached Gemini email parser. Safe to share between threads.
+    Pass `model` (anything with generate_content(contents) returning an object
+    with .text) to use a fake in place of the real API; it also serves repairs
+    unless `repair_model` is given.
+    """
+
+    def __init__(self, model=None, cache=None, model_name=GEMINI_MODEL, context_cache=GEMINI_CONTEXT_CACHE,
+                 max_retries=AI_MAX_RETRIES, token_budget=AI_TOKEN_BUDGET, repair_model=None,
+                 repair_attempts=AI_REPAIR_ATTEMPTS):
+        self.model_name = model_name
+        self.repair_attempts = repair_attempts
+        self._repair_model = repair_model or model
+        self.token_budget = token_budget
+        self.cache = cache if cache is not None else ResponseCache()
+        self.max_retries = max_retries
+        self._model = model
+        self._context_cache = context_cache and model is None
+        self._model_expires = None
+        self._lock = threading.Lock()
+
+    def _create_model(self):
+        if self._context_cache:
+            try:
+                cached_content = genai.caching.CachedContent.create(
+                    model=self.model_name, display_name=f'email-parser-prompt-{PROMPT_VERSION}',
+                    system_instruction=SYSTEM_PROMPT, ttl=CONTEXT_CACHE_TTL,
+                )
+                # Renew a little early so a call never lands on an expired cache
+                self._model_expires = time.monotonic() + CONTEXT_CACHE_TTL.total_seconds() - 300
+                return genai.GenerativeModel.from_cached_content(cached_content, generation_config=GENERATION_CONFIG)
+            except Exception as e:
+                print(f"  ⚠ Couldn't create Gemini context cache, sending the prompt as a system instruction: {e}")
+                self._context_cache = False
+        return genai.GenerativeModel(self.model_name, system_instruction=SYSTEM_PROMPT,
+                                     generation_config=GENERATION_CONFIG)
+
+    @property
+    def model(self):
+        """The shared model, created on first use and renewed when its context cache expires."""
+        with self._lock:
+            if self._model is None or (self._model_expires and time.monotonic() > self._model_expires):
+                self._model = self._create_model()
+            return self._model
+
+    @property
+    def repair_model(self):
+        """Model for repair calls: the same schema, but a short instruction instead of the full prompt."""
+        with self._lock:
+            if self._repair_model is None:
+                self._repair_model = genai.GenerativeModel(self.model_name, system_instruction=REPAIR_INSTRUCTION,
+                                                           generation_config=GENERATION_CONFIG)
+            return self._repair_model
+
+    def generate(self, contents, log=print, model=None):
+        """Call the model, retrying rate-limit and server errors with backoff."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return (model or self.model).generate_content(contents)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                log(f"  ⚠ Gemini {type(e).__name__}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+
+    def request(self, email_subject, email_text, attachment_texts, log=print):
+        """
+        Parse an email, or fetch the cached result for identical input.
+        Returns (parsed_data, cached). Raises GeminiResponseError for a reply
+        that can't be repaired, and the API's exception once retries are used up.
+        """
+        email_text, attachment_texts, (tokens_before, tokens_after) = prepare_ai_input(
+            email_text, attachment_texts, self.token_budget
+        )
+        key = response_cache_key(email_subject, email_text, attachment_texts, self.model_name)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached, True
+
+        log(f"  Calling Gemini API ({tokens_before:,} → {tokens_after:,} input tokens after trimming, est.)...")
+        response = self.generate(build_email_content(email_subject, email_text, attachment_texts), log)
+        parsed_data = self.decode_or_repair(response.text, log)
+        self.cache.set(key, parsed_data)
+        return parsed_data, False
+
+    def decode_or_repair(self, response_text, log=print):
+        """Decode and validate a reply, sending it back for repair up to repair_attempts times."""
+        for attempt in range(self.repair_attempts + 1):
+            try:
+                return decode_listing(response_text)
+            except json.JSONDecodeError as e:
+                problems = [f"not valid JSON: {e}"]
+            except SchemaError as e:
+                problems = e.problems
+            if attempt == self.repair_attempts:
+                raise GeminiResponseError('; '.join(problems), response_text)
+            log(f"  ⚠ Gemini reply didn't fit the schema, asking for a repair: {'; '.join(problems)[:200]}")
+            response_text = self.generate(build_repair_content(response_text, problems), log, self.repair_model).text
+
+    def parse_email(self, email_subject, email_text, attachment_texts):
+        """
+        Parse an email with Gemini, or return the cached result for identical input.
+        Returns parsed JSON data, or None if the call or decoding failed.
+        """
+        try:
+            parsed_data, cached = self.request(email_subject, email_text, attachment_texts)
+
+        except GeminiResponseError as e:
+            print(f"  ✗ Invalid JSON response: {e}")
+            print(f"  Response was: {e.response_text[:200]}...")
+            return None
+
+        except Exception as e:
+            print(f"  ✗ Error calling Gemini API: {e}")
+            return None
+
+        if cached:
+            print(f"  ✓ Using cached Gemini response")
+            return parsed_data
+
         print(f"  ✓ Gemini parsed successfully")
         print(f"    Classification: {parsed_data.get('classification')}")
         print(f"    Confidence: {parsed_data.get('confidence')}")
-        print(f"    Address: {parsed_data.get('full_address')}")
-        
+        print(f"    Address: {parsed_data['address']['full_address']}")
         return parsed_data
-    
-    except json.JSONDecodeError as e:
-        print(f"  ✗ Failed to parse JSON response: {e}")
-        print(f"  Response was: {response_text[:200]}...")
-        return None
-    
-    except Exception as e:
-        print(f"  ✗ Error calling Gemini API: {e}")
-        return None
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Return the process-wide Gemini client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GeminiClient()
+        return _client
+
+def parse_email_with_ai(email_subject, email_text, attachment_texts, client=None):
+    """
+    Send email and attachment text to Gemini API for parsing.
+    Returns parsed JSON data.
+    """
+    return (client or get_client()).parse_email(email_subject, email_text, attachment_texts)
+
+def load_checkpoint(checkpoint_path):
+    """Return {email id: record} for every email already parsed successfully in the checkpoint."""
+    done = {}
+    if not os.path.exists(checkpoint_path):
+        return done
+    with open(checkpoint_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by the interruption
+            if record.get('status') == 'ok':
+                done[str(record['id'])] = record
+    return done
+
+def end_partial_line(checkpoint_path):
+    """Finish a last line cut short by an interruption, so the next record isn't appended onto it."""
+    if not os.path.exists(checkpoint_path):
+        return
+    with open(checkpoint_path, 'rb+') as f:
+        if f.seek(0, os.SEEK_END) == 0:
+            return
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b'\n':
+            f.write(b'\n')
+
+def parse_emails_batch(emails, checkpoint_path, concurrency=AI_BATCH_CONCURRENCY, client=None):
+    """
+    Parse many emails with up to `concurrency` Gemini calls in flight.
+
+    `emails` is an iterable of dicts with 'id', 'subject', 'body' and optionally
+    'attachment_texts'. Each result is appended to checkpoint_path as a JSON line
+    {"id", "status": "ok"|"failed", "result", "error"}. Emails that already have
+    an "ok" line are skipped, and failed ones are tried again.
+    Returns {email id: parsed data} for every email parsed successfully, including earlier runs.
+    """
+    client = client or get_client()
+    done = load_checkpoint(checkpoint_path)
+    results = {email_id: record['result'] for email_id, record in done.items()}
+    if done:
+        print(f"Resuming: {len(done)} emails already parsed in {checkpoint_path}")
+
+    counts = {'ok': 0, 'failed': 0, 'cached': 0}
+
+    def _parse(email):
+        def log(message):
+            print(f"  [{email['id']}] {message.strip()}")
+        try:
+            parsed_data, cached = client.request(email['subject'], email['body'], email.get('attachment_texts') or [], log)
+            return {'id': email['id'], 'status': 'ok', 'result': parsed_data, 'error': None}, cached
+        except Exception as e:
+            return {'id': email['id'], 'status': 'failed', 'result': None, 'error': f"{type(e).__name__}: {e}"}, False
+
+    # Only ever called from this thread, so the checkpoint and counts need no lock
+    def _record(record, cached):
+        checkpoint.write(json.dumps(record) + '\n')
+        checkpoint.flush()
+        counts[record['status']] += 1
+        counts['cached'] += cached
+        if record['status'] == 'ok':
+            results[str(record['id'])] = record['result']
+            print(f"  ✓ {record['id']}{' (cached)' if cached else ''}")
+        else:
+            print(f"  ✗ {record['id']}: {record['error']}")
+
+    start = time.perf_counter()
+    end_partial_line(checkpoint_path)
+    with open(checkpoint_path, 'a') as checkpoint, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Keep a bounded window of calls in flight so a huge backlog isn't queued up front
+        pending = set()
+        for email in emails:
+            if str(email['id']) in done:
+                continue
+            if len(pending) >= concurrency * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    _record(*future.result())
+            pending.add(executor.submit(_parse, email))
+        for future in wait(pending).done:
+            _record(*future.result())
+
+    elapsed = time.perf_counter() - start
+    print(f"Batch done in {elapsed:.1f}s: {counts['ok']} parsed ({counts['cached']} from cache), "
+          f"{counts['failed']} failed, {len(done)} skipped from checkpoint")
+    return results
+
+def read_jsonl(path):
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Parse emails with Gemini')
+    parser.add_argument('--batch', metavar='EMAILS_JSONL',
+                        help='Parse every email in a JSONL file ({"id", "subject", "body", "attachment_texts"} per line)')
+    parser.add_argument('--checkpoint', metavar='PATH',
+                        help='JSONL file results are appended to and resumed from (default: <batch file>.parsed.jsonl)')
+    parser.add_argument('--concurrency', type=int, default=AI_BATCH_CONCURRENCY,
+                        help=f'Gemini calls in flight at once (default: {AI_BATCH_CONCURRENCY})')
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if args.batch:
+        checkpoint_path = args.checkpoint or f"{os.path.splitext(args.batch)[0]}.parsed.jsonl"
+        parse_emails_batch(read_jsonl(args.batch), checkpoint_path, args.concurrency)
+        sys.exit(0)
+
     # Test with your extracted text
     print("Testing Gemini API parsing...")
-    
+
     # Load test data
     test_file = input("Enter path to extracted text file (or press enter to paste text): ")
-    
+
     if test_file:
         with open(test_file, 'r') as f:
             test_text = f.read()
     else:
         print("Paste your text (press Ctrl+D when done):")
-        import sys
         test_text = sys.stdin.read()
-    
+
     # Parse it
-    result = parse_email_with_ai(test_text, [])
-    
+    result = parse_email_with_ai('', test_text, [])
+
     if result:
         print("\n--- PARSED RESULT ---")
         print(json.dumps(result, indent=2))
-        
+
         # Save to file
         with open('test_parse_result.json', 'w') as f:
-            json.dumps(result, f, indent=2)
+            json.dump(result, f, indent=2)
         print("\n✓ Result saved to test_parse_result.json")
     else:
-        print("\n✗ Parsing failed")
\ No newline at end of file
+        print("\n✗ Parsing failed")
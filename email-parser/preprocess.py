@@ -0,0 +1,252 @@
+"""
+Trim an email down to the text worth sending to Gemini.
+
+The body is converted from HTML when the email only had raw_html. Footer
+boilerplate and the signature are then dropped, except for any phone number
+in the signature, since the prompt asks for the sender's phone. Quoted lines
+keep their text without the '>' markers, since a reply often quotes the
+listing it's about, and a forwarded message's header ends the signature
+that came before it. Attachments are cut into windows: PDF pages where the text has page
+breaks, otherwise runs of lines about WINDOW_TOKENS long. The windows are
+ranked by how densely they mention the fields the prompt extracts (address,
+units, rent roll, asking price, income and expenses). The best windows are
+kept, in document order, until AI_TOKEN_BUDGET is used up.
+
+Token counts are estimated at CHARS_PER_TOKEN characters per token, which is
+close enough for budgeting without a call to the API's token counter.
+"""
+import math
+import os
+import re
+from html import unescape
+from html.parser import HTMLParser
+
+# 0 disables trimming; the text is still cleaned
+AI_TOKEN_BUDGET = int(os.getenv('AI_TOKEN_BUDGET', '12000'))
+CHARS_PER_TOKEN = 4
+WINDOW_TOKENS = 500
+# Share of the budget the email body may use before attachments get the rest
+BODY_BUDGET_SHARE = 0.25
+# Offering memoranda and forms put the summary up front
+FIRST_WINDOW_BONUS = 2.0
+
+OMITTED = '[...]'
+
+# What the prompt extracts, with a weight per hit
+FIELD_PATTERNS = [(re.compile(pattern, re.IGNORECASE), weight) for pattern, weight in (
+    (r'property\s*address|\b\d{2,5}\s+[A-Z0-9][\w\s]{1,30}?\b(?:street|st|avenue|ave|boulevard|blvd|road|rd|way|place|pl|drive|dr|terrace|ter)\b', 3),
+    (r'\b941\d{2}\b', 2),
+    (r'asking\s*price|list(?:ing)?\s*price|offered\s*at|price\b', 3),
+    (r'\bunits?\b|unit\s*mix|residential|commercial|vacant|studio|\b\d\s*(?:br|bd|bed(?:room)?s?)\b', 2),
+    (r'rent\s*roll|\brents?\b|lease|tenant|move[-\s]*in', 2),
+    (r'\bcap\s*rate\b|\bgrm\b|net\s*operating\s*income|\bnoi\b|income|expenses?|property\s*tax|insurance|utilities|management', 1),
+    (r'\$\s?\d[\d,]*(?:\.\d+)?', 1),
+    (r'sq\.?\s*f(?:ee)?t|square\s*f(?:ee|oo)t|parking|garage|soft\s*story', 1),
+    (r'\bCOPA\s*[34]?\b|intent\s*to\s*sell', 3),
+)]
+
+HTML_RE = re.compile(r'<(?:html|body|div|p|br|table|span)\b', re.IGNORECASE)
+# The RFC 3676 "-- " line (trailing space often stripped) and an em dash. Underscore
+# rules are left alone: Outlook puts one above every forwarded message
+SIGNATURE_DELIMITER_RE = re.compile(r'^(?:--|—)\s*$')
+# Gmail's, Outlook's and Apple Mail's headers above a forwarded or quoted message
+FORWARD_HEADER_RE = re.compile(
+    r'^-{2,}\s*(?:forwarded|original) message\s*-{2,}$|^begin forwarded message:?$', re.IGNORECASE)
+QUOTE_PREFIX_RE = re.compile(r'^(?:>\s?)+')
+BOILERPLATE_RES = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'^sent from my \w+',
+    r'unsubscribe|update your (?:email )?preferences|manage your subscription',
+    r'view (?:this email )?in (?:your|a) browser',
+    r'^(?:confidentiality|privacy) notice|this (?:e-?mail|message)(?: and any attachments)? (?:is|are|may be) confidential',
+    r'if you (?:are not|have received this)\b.*\b(?:intended recipient|in error)',
+    r'^copyright\b|©\s*\d{4}|all rights reserved',
+)]
+PHONE_RE = re.compile(r'\(?\b\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}\b')
+BLANK_LINES_RE = re.compile(r'\n\s*\n(?:\s*\n)+')
+SPACES_RE = re.compile(r'[ \t\xa0]+')
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+class _TextExtractor(HTMLParser):
+    """Collects the visible text of an HTML document, with line breaks at block elements."""
+
+    BLOCK_TAGS = {'p', 'div', 'br', 'tr', 'li', 'table', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'hr'}
+    HIDDEN_TAGS = {'script', 'style', 'head', 'title'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._hidden = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.HIDDEN_TAGS:
+            self._hidden += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append('\n')
+        elif tag in ('td', 'th'):
+            self.parts.append(' ')
+
+    def handle_endtag(self, tag):
+        if tag in self.HIDDEN_TAGS:
+            self._hidden = max(0, self._hidden - 1)
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self._hidden:
+            self.parts.append(data)
+
+def html_to_text(html):
+    """Visible text of an HTML email."""
+    parser = _TextExtractor()
+    try:
+        parser.feed(html)
+        parser.close()
+        text = ''.join(parser.parts)
+    except Exception:
+        # Badly broken markup; dropping the tags is still better than sending them
+        text = unescape(re.sub(r'<[^>]+>', ' ', html))
+    return normalize_whitespace(text)
+
+def normalize_whitespace(text):
+    lines = (SPACES_RE.sub(' ', line).strip() for line in text.splitlines())
+    return BLANK_LINES_RE.sub('\n\n', '\n'.join(lines)).strip()
+
+def clean_email_body(text):
+    """
+    Drop footer boilerplate and the signature from an email body, keeping any
+    signature line with a phone number on it. Quoted lines are kept without
+    their '>' markers. A forwarded message's header ends the signature above it.
+    """
+    if HTML_RE.search(text):
+        text = html_to_text(text)
+
+    kept = []
+    in_signature = False
+    for line in normalize_whitespace(text).splitlines():
+        line = QUOTE_PREFIX_RE.sub('', line)
+        stripped = line.strip()
+        if FORWARD_HEADER_RE.match(stripped):
+            in_signature = False
+        if SIGNATURE_DELIMITER_RE.match(stripped):
+            in_signature = True
+            continue
+        if in_signature:
+            if PHONE_RE.search(stripped):
+                kept.append(stripped)
+            continue
+        if any(pattern.search(stripped) for pattern in BOILERPLATE_RES):
+            continue
+        kept.append(line)
+    return normalize_whitespace('\n'.join(kept))
+
+def split_long_line(line, limit):
+    """Cut a line longer than limit into pieces of at most limit characters, at spaces where possible."""
+    pieces = []
+    while len(line) > limit:
+        cut = line.rfind(' ', 0, limit)
+        cut = cut if cut > limit // 2 else limit
+        pieces.append(line[:cut])
+        line = line[cut:].lstrip()
+    pieces.append(line)
+    return pieces
+
+def split_windows(text, window_tokens=WINDOW_TOKENS):
+    """
+    Split text into pages at form feeds, or into runs of whole lines about
+    window_tokens long. Lines longer than a window (flattened form text is often
+    one line) are cut by characters.
+    """
+    if '\f' in text:
+        return [page for page in text.split('\f') if page.strip()]
+
+    limit = window_tokens * CHARS_PER_TOKEN
+    windows, current, size = [], [], 0
+    lines = (piece for line in text.splitlines() for piece in split_long_line(line, limit))
+    for line in lines:
+        if current and size + len(line) > limit:
+            windows.append('\n'.join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        windows.append('\n'.join(current))
+    return [window for window in windows if window.strip()]
+
+def field_density(window):
+    """Weighted target-field mentions per estimated token."""
+    hits = sum(weight * len(pattern.findall(window)) for pattern, weight in FIELD_PATTERNS)
+    return hits / max(1, estimate_tokens(window))
+
+def truncate_to_tokens(text, budget):
+    limit = budget * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    # Cut at a line break where there is one close by
+    cut = text.rfind('\n', 0, limit)
+    return text[:cut if cut > limit // 2 else limit].rstrip() + f"\n{OMITTED}"
+
+def select_windows(attachment_texts, budget):
+    """
+    Keep the densest windows across all attachments within `budget` tokens.
+    Returns one string per attachment, its kept windows in their original order
+    with OMITTED marking each gap.
+    """
+    candidates = []
+    windows_by_attachment = []
+    for a, text in enumerate(attachment_texts):
+        windows = split_windows(text or '')
+        windows_by_attachment.append(windows)
+        for w, window in enumerate(windows):
+            score = field_density(window) * (FIRST_WINDOW_BONUS if w == 0 else 1.0)
+            candidates.append((score, a, w))
+
+    kept = set()
+    remaining = budget
+    # Each kept window may be followed by a gap marker
+    marker_tokens = estimate_tokens('\n' + OMITTED)
+    for score, a, w in sorted(candidates, key=lambda candidate: -candidate[0]):
+        if remaining <= marker_tokens:
+            break
+        window = windows_by_attachment[a][w]
+        tokens = estimate_tokens(window) + marker_tokens
+        if tokens > remaining:
+            # A long page; keep as much of it as still fits rather than none of it
+            window = windows_by_attachment[a][w] = truncate_to_tokens(window, max(1, remaining - 2 * marker_tokens))
+            tokens = estimate_tokens(window) + marker_tokens
+        kept.add((a, w))
+        remaining -= tokens
+
+    selected = []
+    for a, windows in enumerate(windows_by_attachment):
+        parts = []
+        for w, window in enumerate(windows):
+            if (a, w) in kept:
+                parts.append(window)
+            elif not parts or not parts[-1].endswith(OMITTED):
+                parts.append(OMITTED)
+        selected.append('\n'.join(parts) if any(part != OMITTED for part in parts) else '')
+    return selected
+
+def prepare_ai_input(email_text, attachment_texts, budget=AI_TOKEN_BUDGET):
+    """
+    Clean the email body and fit the body and attachments into `budget` tokens.
+    Returns (email_text, attachment_texts, (tokens_before, tokens_after)).
+    """
+    attachment_texts = [text or '' for text in attachment_texts or []]
+    tokens_before = estimate_tokens(email_text or '') + sum(estimate_tokens(text) for text in attachment_texts)
+
+    email_text = clean_email_body(email_text or '')
+    # Page breaks survive cleaning; split_windows cuts there
+    attachment_texts = ['\f'.join(normalize_whitespace(page) for page in text.split('\f')) for text in attachment_texts]
+
+    if budget:
+        body_budget = budget if not attachment_texts else max(1, int(budget * BODY_BUDGET_SHARE))
+        email_text = truncate_to_tokens(email_text, body_budget)
+        attachment_budget = budget - estimate_tokens(email_text)
+        if sum(estimate_tokens(text) for text in attachment_texts) > attachment_budget:
+            attachment_texts = select_windows(attachment_texts, attachment_budget)
+
+    tokens_after = estimate_tokens(email_text) + sum(estimate_tokens(text) for text in attachment_texts)
+    return email_text, attachment_texts, (tokens_before, tokens_after)
@@ -0,0 +1,313 @@
+"""
+Cheap checks that rule out attachments which can't be COPA forms, so full
+pdfplumber layout extraction only runs on candidates.
+
+Checks, cheapest first:
+  1. Attachment metadata (before download): a content type and extension that
+     aren't PDF. pdfplumber can't open these anyway.
+  2. File bytes: empty, or no %PDF header.
+  3. PDF structure (PyPDF2, no layout analysis): a PDF whose catalog has an
+     AcroForm with fields always passes, since a fillable COPA3 form may carry
+     its values (and even its markers) only in the fields, over a scanned or
+     blank page. Otherwise, no font anywhere means there is no text layer for
+     form detection to read. Scanned pages land here.
+  4. Keyword scan: the strings shown by the decompressed content streams are
+     joined, whitespace is stripped, and the result is searched for the form
+     markers. The PDF is rejected only if no form type has the two markers
+     detection needs.
+
+The keyword scan can only read raw strings when every font uses a simple
+standard encoding, so that byte codes are ASCII. If any font is composite
+(Type0/CID), Type3, or remaps printable codes, the scan is treated as
+inconclusive and the file is passed through to the full parser. Every check
+fails open: an error while screening makes the file a candidate.
+
+PRESCREEN_MODE controls what happens to rejected files:
+  enforce (default) - skip them
+  audit             - parse them anyway and count any that turn out to be COPA forms
+  off               - don't screen at all
+"""
+import os
+import re
+import threading
+import time
+from collections import Counter
+from PyPDF2 import PdfReader
+from extract_text import as_binary_stream
+
+PRESCREEN_MODE = os.getenv('PRESCREEN_MODE', 'enforce').lower()
+
+# Verdict reasons
+CANDIDATE = 'candidate'
+NOT_PDF = 'not a PDF'
+EMPTY = 'empty file'
+NO_TEXT_LAYER = 'no text layer'
+NO_MARKERS = 'no COPA markers'
+
+PDF_CONTENT_TYPES = {'application/pdf', 'application/x-pdf', 'application/acrobat'}
+# Content types that say nothing about the file; decided from the bytes instead
+GENERIC_CONTENT_TYPES = {'', 'application/octet-stream', 'binary/octet-stream', 'application/force-download'}
+
+SIMPLE_FONT_SUBTYPES = {'/Type1', '/TrueType', '/MMType1'}
+STANDARD_ENCODINGS = {'/WinAnsiEncoding', '/StandardEncoding', '/MacRomanEncoding', '/PDFDocEncoding'}
+
+# Literal strings (allowing one level of nested parentheses) or hex strings
+STRING_RE = re.compile(rb'\(((?:[^()\\]|\\.|\((?:[^()\\]|\\.)*\))*)\)|<([0-9A-Fa-f\s]+)>', re.DOTALL)
+LITERAL_ESCAPE_RE = re.compile(rb'\\([0-7]{1,3}|\r\n|.)', re.DOTALL)
+WHITESPACE_RE = re.compile(rb'\s+')
+
+LITERAL_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+
+def _unescape(match):
+    escaped = match.group(1)
+    if escaped[:1].isdigit():
+        return bytes([int(escaped, 8) & 0xFF])
+    if escaped in (b'\n', b'\r', b'\r\n'):
+        return b''  # line continuation
+    return LITERAL_ESCAPES.get(escaped, escaped)
+
+def shown_text(content):
+    """Whitespace-stripped concatenation of every string in a content stream."""
+    pieces = []
+    for match in STRING_RE.finditer(content):
+        literal, hex_digits = match.group(1), match.group(2)
+        if literal is not None:
+            pieces.append(LITERAL_ESCAPE_RE.sub(_unescape, literal))
+        else:
+            digits = WHITESPACE_RE.sub(b'', hex_digits)
+            pieces.append(bytes.fromhex((digits + b'0' * (len(digits) % 2)).decode()))
+    return WHITESPACE_RE.sub(b'', b''.join(pieces)).decode('latin-1')
+
+def _strip_whitespace(text):
+    return re.sub(r'\s+', '', text)
+
+def _resolve(obj):
+    return obj.get_object() if hasattr(obj, 'get_object') else obj
+
+def _stream_data(contents):
+    """Decoded bytes of a content stream, or of an array of them."""
+    contents = _resolve(contents)
+    if isinstance(contents, list):
+        return b'\n'.join(_resolve(part).get_data() for part in contents)
+    return contents.get_data()
+
+def _font_is_readable(font):
+    """True if the font's byte codes for printable ASCII are the characters themselves."""
+    if font.get('/Subtype') not in SIMPLE_FONT_SUBTYPES:
+        return False
+    encoding = _resolve(font.get('/Encoding'))
+    if encoding is None:
+        return True
+    if not hasattr(encoding, 'get'):
+        return encoding in STANDARD_ENCODINGS
+    if encoding.get('/BaseEncoding', '/StandardEncoding') not in STANDARD_ENCODINGS:
+        return False
+
+    # /Differences is [code name name ... code name ...]; fine if it leaves printable ASCII alone
+    code = None
+    for item in _resolve(encoding.get('/Differences', [])):
+        item = _resolve(item)
+        if isinstance(item, int):
+            code = item
+            continue
+        if code is not None and 32 <= code <= 126:
+            return False
+        code = None if code is None else code + 1
+    return True
+
+class _DocumentScan:
+    """Fonts and shown text collected from pages and the form XObjects they draw."""
+
+    def __init__(self):
+        self.font_count = 0
+        self.readable = True
+        self.text = []
+        self._seen = set()
+
+    def add_resources(self, resources, depth=0):
+        resources = _resolve(resources)
+        if not resources or depth > 8:
+            return
+        for font in _resolve(resources.get('/Font', {})).values():
+            font = _resolve(font)
+            self.font_count += 1
+            self.readable = self.readable and _font_is_readable(font)
+        for xobject in _resolve(resources.get('/XObject', {})).values():
+            key = getattr(xobject, 'idnum', None)
+            xobject = _resolve(xobject)
+            if xobject.get('/Subtype') != '/Form' or (key is not None and key in self._seen):
+                continue
+            if key is not None:
+                self._seen.add(key)
+            self.text.append(shown_text(_stream_data(xobject)))
+            self.add_resources(xobject.get('/Resources'), depth + 1)
+
+def has_form_fields(reader):
+    """True if the PDF's catalog has an AcroForm with at least one field."""
+    acroform = _resolve(reader.trailer['/Root'].get('/AcroForm'))
+    return bool(acroform) and bool(_resolve(acroform.get('/Fields')))
+
+def scan_pages(reader, markers):
+    """
+    Scan the pages' content streams in order for the markers of any form in
+    `markers`, stopping once one form's turn up. Returns (scan, found).
+    """
+    stripped_markers = [[_strip_whitespace(marker) for marker in form_markers] for form_markers in markers.values()]
+    scan = _DocumentScan()
+    for page in reader.pages:
+        scan.add_resources(page.get('/Resources'))
+        contents = page.get('/Contents')
+        if contents is not None:
+            scan.text.append(shown_text(_stream_data(contents)))
+        # They're usually on the first page
+        text = ''.join(scan.text)
+        if any(sum(marker in text for marker in form_markers) >= 2 for form_markers in stripped_markers):
+            return scan, True
+    return scan, False
+
+def shows_markers(reader, markers):
+    """
+    True if the raw content streams show the markers of a form in `markers`.
+    False when they don't, or when an unreadable font or an error hides them.
+    """
+    try:
+        return scan_pages(reader, markers)[1]
+    except Exception:
+        return False
+
+def screen_attachment(attachment):
+    """
+    Metadata check, before download. Returns NOT_PDF if the attachment's content
+    type and filename both say it isn't a PDF, else CANDIDATE.
+    """
+    content_type = (attachment.get('content_type') or '').split(';')[0].strip().lower()
+    filename = (attachment.get('filename') or '').lower()
+    if content_type in PDF_CONTENT_TYPES or content_type in GENERIC_CONTENT_TYPES or filename.endswith('.pdf'):
+        return CANDIDATE
+    return NOT_PDF
+
+def screen_pdf(data, markers):
+    """
+    Decide from a downloaded file whether it could contain one of the forms in
+    `markers` ({form_type: [marker, ...]}, at least two per form must appear).
+    Returns (verdict, page_count); page_count is None when it wasn't read.
+    """
+    if not data:
+        return EMPTY, None
+    if b'%PDF-' not in bytes(data[:1024]):
+        return NOT_PDF, None
+
+    try:
+        reader = PdfReader(as_binary_stream(data), strict=False)
+        page_count = len(reader.pages)
+        if has_form_fields(reader):
+            return CANDIDATE, page_count
+        scan, found = scan_pages(reader, markers)
+        if found:
+            return CANDIDATE, page_count
+    except Exception:
+        return CANDIDATE, None
+
+    if scan.font_count == 0:
+        return NO_TEXT_LAYER, page_count
+    if not scan.readable:
+        return CANDIDATE, page_count
+    return NO_MARKERS, page_count
+
+class PrescreenStats:
+    """Counts and timings for a run's prescreening. Safe to share between threads."""
+
+    def __init__(self):
+        self.verdicts = Counter()
+        self.screen_seconds = 0.0
+        self.parsed_pages = 0
+        self.parse_seconds = 0.0
+        self.skipped_pages = 0
+        self.audit_parse_seconds = 0.0
+        self.false_rejects = 0
+        self._lock = threading.Lock()
+
+    def record_screen(self, verdict, seconds=0.0, page_count=None):
+        with self._lock:
+            self.verdicts[verdict] += 1
+            self.screen_seconds += seconds
+            if verdict != CANDIDATE:
+                self.skipped_pages += page_count or 0
+
+    def record_parse(self, verdict, seconds, page_count=None, found_form=False):
+        """Record a full parse. In audit mode this includes files the prescreen rejected."""
+        with self._lock:
+            if verdict == CANDIDATE:
+                self.parse_seconds += seconds
+                self.parsed_pages += page_count or 0
+            else:
+                self.audit_parse_seconds += seconds
+                self.false_rejects += found_form
+
+    def print_summary(self):
+        with self._lock:
+            screened = sum(self.verdicts.values())
+            if not screened:
+                return
+            skipped = screened - self.verdicts[CANDIDATE]
+            print(f"Prescreen ({PRESCREEN_MODE}): {skipped}/{screened} attachments ruled out "
+                  f"in {self.screen_seconds:.2f}s")
+            for verdict, count in sorted(self.verdicts.items()):
+                if verdict != CANDIDATE:
+                    print(f"  ⊘ {verdict}: {count}")
+
+            if PRESCREEN_MODE == 'audit':
+                print(f"  Parsing rejected attachments took {self.audit_parse_seconds:.2f}s; "
+                      f"{self.false_rejects} turned out to be COPA forms")
+            elif self.parsed_pages:
+                per_page = self.parse_seconds / self.parsed_pages
+                saved = self.skipped_pages * per_page
+                print(f"  Est. parse time saved: {saved:.2f}s "
+                      f"({self.skipped_pages} pages at {per_page * 1000:.0f} ms/page), "
+                      f"net of screening {saved - self.screen_seconds:.2f}s")
+
+_stats = PrescreenStats()
+
+def get_stats():
+    """Return the process-wide prescreen stats."""
+    return _stats
+
+def skip_attachment(attachment):
+    """
+    Metadata prescreen, before download. Records the verdict.
+    Returns (skip, verdict); skip is only True in enforce mode.
+    """
+    if PRESCREEN_MODE == 'off':
+        return False, CANDIDATE
+    verdict = screen_attachment(attachment)
+    _stats.record_screen(verdict)
+    return _decide(verdict), verdict
+
+def skip_pdf(data, markers):
+    """
+    Prescreen downloaded bytes against the form markers. Records the verdict and time taken.
+    Returns (skip, verdict, page_count); skip is only True in enforce mode.
+    """
+    if PRESCREEN_MODE == 'off':
+        return False, CANDIDATE, None
+    start = time.perf_counter()
+    verdict, page_count = screen_pdf(data, markers)
+    _stats.record_screen(verdict, time.perf_counter() - start, page_count)
+    return _decide(verdict), verdict, page_count
+
+def _decide(verdict):
+    if verdict == CANDIDATE:
+        return False
+    if PRESCREEN_MODE == 'audit':
+        print(f"  Prescreen: {verdict} (audit mode, parsing anyway)")
+        return False
+    print(f"  ⊘ Prescreen: {verdict}, skipping full parse")
+    return True
+
+def record_parse(verdict, seconds, page_count=None, form_type=None):
+    """Record a full parse and its outcome, flagging any COPA form the prescreen would have skipped."""
+    if PRESCREEN_MODE == 'off':
+        return
+    if verdict != CANDIDATE and form_type:
+        print(f"  ⚠ Prescreen rejected this attachment ({verdict}) but it holds a {form_type.upper()} form")
+    _stats.record_parse(verdict, seconds, page_count, found_form=bool(form_type))
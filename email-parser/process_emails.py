@@ -1,185 +1,35 @@
+import argparse
+import contextvars
+import io
 import json
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
 from supabase import create_client
 from dotenv import load_dotenv
 from datetime import datetime
 import config
-from extract_text import extract_text_from_file
+from extract_text import extract_text_from_file, as_binary_stream
 from parse_with_ai import parse_email_with_ai
-import tempfile
 import os
 import requests
 from typing import Dict, Optional
-from sodapy import Socrata
-from shapely.geometry import shape, Point
 import pdfplumber
 import re
-from process_data import parse_copa3_form, extract_address, extract_basic_property_info, extract_seller_info, extract_financial_info
+import prescreen
+from acroform import merge_copa3_values, read_copa3_fields
+from attachment_cache import get_cache as get_attachment_cache, sha256_bytes
+from geocoding import get_location_from_address
+from neighborhoods import load_sf_neighborhoods, get_neighborhood_from_location
+from process_data import parse_copa3_form, extract_address, extract_basic_property_info, extract_seller_info, extract_financial_info, normalize_address
 
 load_dotenv()
 
 # Initialize Supabase client
 supabase = create_client(config.SUPABASE_URL, config.SUPABASE_KEY)
 
-# Cache neighborhoods data globally to avoid reloading
-_NEIGHBORHOODS_CACHE = None
-
-def load_sf_neighborhoods():
-    """Load and return processed neighborhood data."""
-    global _NEIGHBORHOODS_CACHE
-    
-    # Return cached data if available
-    if _NEIGHBORHOODS_CACHE is not None:
-        return _NEIGHBORHOODS_CACHE
-    
-    print("Loading SF neighborhoods data...")
-    try:
-        client = Socrata("data.sfgov.org", None)
-        neighborhoods = client.get("gfpk-269f", limit=2000)
-        
-        processed = []
-        for n in neighborhoods:
-            try:
-                # Convert GeoJSON dict to shapely geometry
-                geometry = shape(n['the_geom'])
-                processed.append({
-                    'name': n['name'],
-                    'geometry': geometry
-                })
-            except Exception as e:
-                print(f"  ⚠ Error processing {n.get('name', 'Unknown')}: {e}")
-                continue
-        
-        _NEIGHBORHOODS_CACHE = processed
-        print(f"✓ Loaded {len(processed)} neighborhoods")
-        return processed
-    except Exception as e:
-        print(f"✗ Error loading neighborhoods: {e}")
-        return []
-
-def get_neighborhood_from_location(lat, lng, neighborhoods):
-    """Get neighborhood from location"""
-    try:
-        point = Point(lng, lat)
-        for neighborhood in neighborhoods:
-            if neighborhood['geometry'].contains(point):
-                return neighborhood['name']
-        return None
-    except Exception as e:
-        print(f"  ⚠ Error finding neighborhood: {e}")
-        return None
-
-def get_location_from_address(address: Dict[str, str]) -> Optional[Dict[str, float]]:
-    """
-    Convert a San Francisco address object to latitude and longitude coordinates.
-    For corner buildings, tries both street addresses to get the best result.
-    
-    Args:
-        address (Dict): Address object containing:
-            - street_address: Primary street address
-            - secondary_address: Alternate street address (for corner buildings)
-            - zip_code: ZIP code
-            - property_type: Type of property (not used in geocoding)
-    
-    Returns:
-        Dict with 'lat' and 'lng' keys, or None if geocoding fails
-    """
-    
-    def _geocode_address_string(addr_string: str) -> Optional[Dict[str, float]]:
-        """Helper function to geocode a single address string."""
-        try:
-            url = 'https://nominatim.openstreetmap.org/search'
-            params = {
-                'q': addr_string,
-                'format': 'json',
-                'limit': 1,
-                'countrycodes': 'us'
-            }
-            
-            headers = {
-                'User-Agent': 'SF-Address-Geocoder/1.0'
-            }
-            
-            response = requests.get(url, params=params, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            if data and len(data) > 0:
-                result = data[0]
-                result = {
-                    'lat': float(result['lat']),
-                    'lng': float(result['lon'])
-                }
-                return result
-            return None
-            
-        except (requests.RequestException, KeyError, ValueError, IndexError):
-            return None
-    
-    # Build address strings to try
-    addresses_to_try = []
-    
-    # Try primary street address first
-    if address.get('street_address'):
-        addr_parts = [address['street_address'], 'San Francisco', 'CA']
-        if address.get('zip_code'):
-            addr_parts.append(address['zip_code'])
-        addresses_to_try.append(', '.join(addr_parts))
-    
-    # Try secondary address (alternate street for corner buildings)
-    if address.get('secondary_address'):
-        addr_parts = [address['secondary_address'], 'San Francisco', 'CA']
-        if address.get('zip_code'):
-            addr_parts.append(address['zip_code'])
-        addresses_to_try.append(', '.join(addr_parts))
-    
-    # Try geocoding each address until we get a result
-    for addr_string in addresses_to_try:
-        result = _geocode_address_string(addr_string)
-        if result:
-            print(f"Geocoding result for {addr_string}: {result}")
-            return result
-    
-    print(f"No results found for any address variants")
-    return {}
-
-def normalize_address(address):
-    """
-    Normalize address string for better matching.
-    Handles common variations like 'St' vs 'Street', etc.
-    """
-    if not address:
-        return ""
-    
-    # Convert to lowercase and strip
-    normalized = address.lower().strip()
-    
-    # Remove extra whitespace
-    normalized = ' '.join(normalized.split())
-    
-    # Common abbreviation replacements for better matching
-    replacements = {
-        ' street': ' st',
-        ' avenue': ' ave',
-        ' road': ' rd',
-        ' boulevard': ' blvd',
-        ' drive': ' dr',
-        ' lane': ' ln',
-        ' court': ' ct',
-        ' place': ' pl',
-        'saint ': 'st ',
-        'san francisco': 'sf',
-    }
-    
-    for full, abbrev in replacements.items():
-        normalized = normalized.replace(full, abbrev)
-    
-    # Remove common suffixes
-    normalized = normalized.replace(', sf', '').replace(', ca', '')
-    
-    return normalized
-
 def should_skip_email(subject):
     """
     Check if email should be skipped based on subject line.
@@ -203,11 +53,30 @@ def should_skip_email(subject):
     
     return False
 
-# Update the check_duplicate_listing function:
+# PostgreSQL's undefined_column error
+UNDEFINED_COLUMN = '42703'
+
+def dedupe_error(e):
+    """
+    The exception to raise when the duplicate lookup fails. Guessing "no duplicate"
+    would insert a second listing, so the email fails and is retried on a later run.
+    """
+    if getattr(e, 'code', None) == UNDEFINED_COLUMN or 'normalized_address' in str(e):
+        return RuntimeError(
+            "copa_listings_new.normalized_address is missing; apply "
+            "migrations/001_copa_listings_normalized_address.sql and run backfill_normalized_addresses.py"
+        )
+    return RuntimeError(f"duplicate listing check failed: {e}")
+
 def check_duplicate_listing(address_obj):
     """
     Check if a listing already exists for this address.
     address_obj is a dict with full_address, street_address, secondary_address, zip_code
+
+    Looks up the indexed normalized_address column with a single equality
+    query instead of scanning every listing. Rows written before the column
+    existed are filled in by backfill_normalized_addresses.py. Raises
+    RuntimeError when the lookup fails, including when the column is missing.
     """
     if not address_obj or not address_obj.get('full_address'):
         return None
@@ -216,156 +85,175 @@ def check_duplicate_listing(address_obj):
         normalized_address = normalize_address(address_obj['full_address'])
         
         response = supabase.table('copa_listings_new')\
-            .select('id, address, time_sent_tz')\
+            .select('id, address')\
+            .eq('normalized_address', normalized_address)\
+            .limit(1)\
             .execute()
         
-        for listing in response.data:
-            # address is now JSONB, so extract full_address
-            existing_full_address = listing.get('address', {}).get('full_address', '')
-            existing_normalized = normalize_address(existing_full_address)
-            
-            if existing_normalized == normalized_address:
-                print(f"    Match found: '{existing_full_address}' ≈ '{address_obj['full_address']}'")
-                return listing['id']
+        if response.data:
+            listing = response.data[0]
+            existing_full_address = (listing.get('address') or {}).get('full_address', '')
+            print(f"    Match found: '{existing_full_address}' ≈ '{address_obj['full_address']}'")
+            return listing['id']
         
         return None
         
     except Exception as e:
-        print(f"    ⚠ Error checking for duplicates: {e}")
-        return None
+        print(f"    ✗ Error checking for duplicates: {e}")
+        raise dedupe_error(e) from e
+
+
+# Text markers for each form type; a page with at least two of them is that form
+COPA_FORM_MARKERS = {
+    'copa3': [
+        "[COPA3]",
+        "Property Address:",
+        "Total # of units",
+        "# of residential units"
+    ],
+    'copa4': [
+        "[COPA4]",
+        "Property Address",
+        "INTENT TO SELL",
+        "SAN FRANCISCO ASSOCIATION"
+    ],
+}
+
+class PdfFormAnalyzer:
+    """
+    Opens a PDF once and extracts each page's text at most once.
+    Every page read is scored against all form types in the same pass,
+    so looking for a COPA4 form after a COPA3 miss costs nothing extra,
+    and the field extractors reuse the cached page text.
+    """
+
+    def __init__(self, pdf_source):
+        # A path, the PDF's bytes, or a binary file-like object
+        self.pdf = pdfplumber.open(as_binary_stream(pdf_source))
+        self._page_texts = {}
+        self._form_pages = {}
+        self._pages_scanned = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
+    def close(self):
+        self.pdf.close()
 
-def find_copa3_form(pdf_path):
+    @property
+    def page_texts(self):
+        """Text of every page extracted so far, keyed by page number."""
+        return dict(self._page_texts)
+
+    def page_text(self, page_num):
+        """Return the text of a page, extracting it on first access."""
+        if page_num not in self._page_texts:
+            self._page_texts[page_num] = self.pdf.pages[page_num].extract_text() or ''
+        return self._page_texts[page_num]
+
+    def find_form(self, form_type):
+        """Return the index of the first page containing form_type, or None."""
+        while form_type not in self._form_pages and self._pages_scanned < len(self.pdf.pages):
+            page_num = self._pages_scanned
+            text = self.page_text(page_num)
+            for other_type, markers in COPA_FORM_MARKERS.items():
+                if other_type not in self._form_pages and sum(marker in text for marker in markers) >= 2:
+                    self._form_pages[other_type] = page_num
+            self._pages_scanned += 1
+        return self._form_pages.get(form_type)
+
+def clean_form_text(text):
+    """Strip underscores/asterisks and collapse whitespace in extracted form text"""
+    cleaned_text = re.sub(r'[_*]+', '', text)
+    return re.sub(r'\s+', ' ', cleaned_text)
+
+def find_copa3_form(pdf_source):
     """Check if PDF contains a COPA3 form on any page"""
     try:
-        markers = [
-            "[COPA3]",
-            "Property Address:",
-            "Total # of units",
-            "# of residential units"
-        ]
-        
-        with pdfplumber.open(pdf_path) as pdf:
-            for i, page in enumerate(pdf.pages):
-                text = page.extract_text()
-                if text and sum(marker in text for marker in markers) >= 2:
-                    return i
-        return None
+        with PdfFormAnalyzer(pdf_source) as analyzer:
+            return analyzer.find_form('copa3')
     except Exception as e:
         print(f"  ✗ Error finding COPA3 page: {e}")
         return None
 
-def find_copa4_form(pdf_path):
-    """Check if PDF contains a COPA3 form on any page"""
+def find_copa4_form(pdf_source):
+    """Check if PDF contains a COPA4 form on any page"""
     try:
-        markers = [
-            "[COPA4]",
-            "Property Address",
-            "INTENT TO SELL",
-            "SAN FRANCISCO ASSOCIATION"
-        ]
-        
-        with pdfplumber.open(pdf_path) as pdf:
-            for i, page in enumerate(pdf.pages):
-                text = page.extract_text()
-                if text and sum(marker in text for marker in markers) >= 2:
-                    return i
-        return None
+        with PdfFormAnalyzer(pdf_source) as analyzer:
+            return analyzer.find_form('copa4')
     except Exception as e:
         print(f"  ✗ Error finding COPA4 page: {e}")
         return None
+
+def parse_copa_form_local(pdf_source):
+    """
+    Detect and parse a COPA3 form, falling back to COPA4, opening the PDF once.
+    pdf_source may be a path, the PDF's bytes, or a binary file-like object.
+    Returns (form_data, form_type, page_texts) where form_type is 'copa3', 'copa4'
+    or None, and page_texts maps page number to the text extracted along the way.
+    """
+    analyzer = None
+    try:
+        with PdfFormAnalyzer(pdf_source) as analyzer:
+            copa_form_result = parse_copa3_form_local(pdf_source, analyzer)
+            if copa_form_result:
+                return copa_form_result, 'copa3', analyzer.page_texts
+            
+            print(f"  COPA3 not detected or failed to parse, trying COPA4")
+            copa_form_result = parse_copa4_form_local(pdf_source, analyzer)
+            if copa_form_result:
+                return copa_form_result, 'copa4', analyzer.page_texts
             
-def parse_copa3_form_local(pdf_path):
-    """Parse COPA3 form from multi-page PDF"""
+            print(f"  COPA4 not detected or failed to parse")
+    except Exception as e:
+        print(f"  ✗ Error opening PDF: {e}")
+    return {}, None, analyzer.page_texts if analyzer else {}
+
+def parse_copa3_form_local(pdf_source, analyzer=None):
+    """
+    Parse COPA3 form from multi-page PDF.
+    Pass an open PdfFormAnalyzer to reuse its page text instead of reopening the file.
+    A completely filled form marked as COPA3 is read from its fields alone,
+    without extracting any page text. Otherwise a fillable form's field values
+    take precedence over the page text, which fills in what the fields don't
+    cover. The fields are only trusted when the page text or the field set
+    identifies the PDF as a COPA3 form.
+    """
     try:
-        copa3_page_num = find_copa3_form(pdf_path)
-        if copa3_page_num is None:
-            return {}
+        fields = read_copa3_fields(pdf_source, {'copa3': COPA_FORM_MARKERS['copa3']})
+        if fields and fields.complete and fields.marked:
+            print(f"  ✓ Read COPA3 values from form fields")
+            return copa3_form_data(*merge_copa3_values(None, fields))
         
-        # Extract text from the COPA3 page
-        with pdfplumber.open(pdf_path) as pdf:
-            text = pdf.pages[copa3_page_num].extract_text()
-            cleaned_text = re.sub(r'[_*]+', '', text)
-            cleaned_text = re.sub(r'\s+', ' ', cleaned_text)
+        with nullcontext(analyzer) if analyzer else PdfFormAnalyzer(pdf_source) as analyzer:
+            copa3_page_num = analyzer.find_form('copa3')
+            if copa3_page_num is None and not (fields and fields.marked):
+                return {}
+            
+            text_values = None
+            if copa3_page_num is not None:
+                # Text of the COPA3 page, already extracted during detection
+                cleaned_text = clean_form_text(analyzer.page_text(copa3_page_num))
+                
+                # Use your existing extraction functions
+                text_values = (
+                    extract_address(cleaned_text),
+                    extract_basic_property_info(cleaned_text),
+                    extract_seller_info(cleaned_text),
+                    extract_financial_info(cleaned_text),
+                )
         
-        # Use your existing extraction functions
-        address = extract_address(cleaned_text)
-        property_info = extract_basic_property_info(cleaned_text)
-        seller_info = extract_seller_info(cleaned_text)
-        financial_info = extract_financial_info(cleaned_text)
+        if fields:
+            print(f"  ✓ Read COPA3 values from form fields")
+            text_values = merge_copa3_values(text_values, fields)
         
-        if not address:
+        if not text_values or not text_values[0]:
             return {}
         
-        # Helper function to safely get numeric values
-        def safe_numeric(value, default=None):
-            """Return value if it's not -1, otherwise return default (None)"""
-            if value is None or value == -1:
-                return default
-            return value
-        
-        # Helper function to safely get boolean values
-        def safe_bool(value, default=None):
-            """Return value if it's a boolean, otherwise return default (None)"""
-            if isinstance(value, bool):
-                return value
-            return default
-        
-        # Return in format matching database schema with flattened details
-        return {
-            'classification': 'listing',
-            'confidence': 'high',
-            'address': {
-                'full_address': address.get('full_address'),
-                'street_address': address.get('street_address'),
-                'secondary_address': address.get('secondary_address'),
-                'zip_code': address.get('zip_code')
-            },
-            'asking_price': safe_numeric(financial_info.get('asking_price')),
-            'total_units': safe_numeric(property_info.get('total_units')),
-            'residential_units': safe_numeric(property_info.get('residential_units')),
-            'vacant_residential': safe_numeric(property_info.get('vacant_residential')),
-            'commercial_units': safe_numeric(property_info.get('commercial_units')),
-            'vacant_commercial': safe_numeric(property_info.get('vacant_commercial')),
-            'is_vacant_lot': safe_bool(property_info.get('is_vacant_lot'), False),
-            'unit_mix': property_info.get('unit_mix'),
-            'details': {
-                # Property details
-                'soft_story_required': safe_bool(property_info.get('soft_story_required')),
-                'sqft': safe_numeric(property_info.get('sqft')),
-                'parking_spaces': safe_numeric(property_info.get('parking_spaces')),
-                
-                # Financial details - income
-                'total_annual_income': safe_numeric(financial_info.get('total_annual_income')),
-                'total_rents': safe_numeric(financial_info.get('total_rents')),
-                'other_income': safe_numeric(financial_info.get('other_income')),
-                'total_monthly_income': safe_numeric(financial_info.get('total_monthly_income')),
-                'average_rent': safe_numeric(financial_info.get('average_rent')),
-                
-                # Financial details - expenses
-                'annual_expenses': safe_numeric(financial_info.get('annual_expenses')),
-                'management_amount': safe_numeric(financial_info.get('management_amount')),
-                'insurance': safe_numeric(financial_info.get('insurance')),
-                'utilities': safe_numeric(financial_info.get('utilities')),
-                'maintenance': safe_numeric(financial_info.get('maintenance')),
-                'other_expenses': safe_numeric(financial_info.get('other_expenses')),
-                
-                # Financial metrics
-                'cap_rate': safe_numeric(financial_info.get('cap_rate')),
-                'grm': safe_numeric(financial_info.get('grm')),
-                
-                # Rent roll (keep as array)
-                'rent_roll': financial_info.get('rent_roll', []),
-                
-                # Seller info
-                'seller_name': seller_info.get('seller_name'),
-                'seller_phone': seller_info.get('seller_phone'),
-                'seller_email': seller_info.get('seller_email'),
-                
-                # Source will be added later in process_email
-                'sender_phone_number': None,
-            }
-        }
+        return copa3_form_data(*text_values)
         
     except Exception as e:
         print(f"  ✗ Error parsing COPA3 form: {e}")
@@ -373,18 +261,91 @@ def parse_copa3_form_local(pdf_path):
         traceback.print_exc()
         return {}
 
-def parse_copa4_form_local(pdf_path):
-    """Parse COPA4 form from multi-page PDF"""
+def copa3_form_data(address, property_info, seller_info, financial_info):
+    """Build the COPA3 form data returned to process_email from the extracted fields."""
+    # Helper function to safely get numeric values
+    def safe_numeric(value, default=None):
+        """Return value if it's not -1, otherwise return default (None)"""
+        if value is None or value == -1:
+            return default
+        return value
+    
+    # Helper function to safely get boolean values
+    def safe_bool(value, default=None):
+        """Return value if it's a boolean, otherwise return default (None)"""
+        if isinstance(value, bool):
+            return value
+        return default
+    
+    # Return in format matching database schema with flattened details
+    return {
+        'classification': 'listing',
+        'confidence': 'high',
+        'address': {
+            'full_address': address.get('full_address'),
+            'street_address': address.get('street_address'),
+            'secondary_address': address.get('secondary_address'),
+            'zip_code': address.get('zip_code')
+        },
+        'asking_price': safe_numeric(financial_info.get('asking_price')),
+        'total_units': safe_numeric(property_info.get('total_units')),
+        'residential_units': safe_numeric(property_info.get('residential_units')),
+        'vacant_residential': safe_numeric(property_info.get('vacant_residential')),
+        'commercial_units': safe_numeric(property_info.get('commercial_units')),
+        'vacant_commercial': safe_numeric(property_info.get('vacant_commercial')),
+        'is_vacant_lot': safe_bool(property_info.get('is_vacant_lot'), False),
+        'unit_mix': property_info.get('unit_mix'),
+        'details': {
+            # Property details
+            'soft_story_required': safe_bool(property_info.get('soft_story_required')),
+            'sqft': safe_numeric(property_info.get('sqft')),
+            'parking_spaces': safe_numeric(property_info.get('parking_spaces')),
+            
+            # Financial details - income
+            'total_annual_income': safe_numeric(financial_info.get('total_annual_income')),
+            'total_rents': safe_numeric(financial_info.get('total_rents')),
+            'other_income': safe_numeric(financial_info.get('other_income')),
+            'total_monthly_income': safe_numeric(financial_info.get('total_monthly_income')),
+            'average_rent': safe_numeric(financial_info.get('average_rent')),
+            
+            # Financial details - expenses
+            'annual_expenses': safe_numeric(financial_info.get('annual_expenses')),
+            'management_amount': safe_numeric(financial_info.get('management_amount')),
+            'insurance': safe_numeric(financial_info.get('insurance')),
+            'utilities': safe_numeric(financial_info.get('utilities')),
+            'maintenance': safe_numeric(financial_info.get('maintenance')),
+            'other_expenses': safe_numeric(financial_info.get('other_expenses')),
+            
+            # Financial metrics
+            'cap_rate': safe_numeric(financial_info.get('cap_rate')),
+            'grm': safe_numeric(financial_info.get('grm')),
+            
+            # Rent roll (keep as array)
+            'rent_roll': financial_info.get('rent_roll', []),
+            
+            # Seller info
+            'seller_name': seller_info.get('seller_name'),
+            'seller_phone': seller_info.get('seller_phone'),
+            'seller_email': seller_info.get('seller_email'),
+            
+            # Source will be added later in process_email
+            'sender_phone_number': None,
+        }
+    }
+
+def parse_copa4_form_local(pdf_source, analyzer=None):
+    """
+    Parse COPA4 form from multi-page PDF.
+    Pass an open PdfFormAnalyzer to reuse its page text instead of reopening the file.
+    """
     try:
-        copa4_page_num = find_copa4_form(pdf_path)
-        if copa4_page_num is None:
-            return {}
-        
-        # Extract text from the COPA4 page
-        with pdfplumber.open(pdf_path) as pdf:
-            text = pdf.pages[copa4_page_num].extract_text()
-            cleaned_text = re.sub(r'[_*]+', '', text)
-            cleaned_text = re.sub(r'\s+', ' ', cleaned_text)
+        with nullcontext(analyzer) if analyzer else PdfFormAnalyzer(pdf_source) as analyzer:
+            copa4_page_num = analyzer.find_form('copa4')
+            if copa4_page_num is None:
+                return {}
+            
+            # Text of the COPA4 page, already extracted during detection
+            cleaned_text = clean_form_text(analyzer.page_text(copa4_page_num))
         
         # Use your existing extraction functions
         address = extract_address(cleaned_text)
@@ -443,8 +404,8 @@ def parse_copa4_form_local(pdf_path):
 
 def download_attachment(storage_path):
     """
-    Download attachment from Supabase storage to temp file.
-    Returns path to temp file.
+    Download attachment from Supabase storage.
+    Returns the file's bytes, which the parsers read directly, or None on failure.
     """
     try:
         # Path is email-attachments/{email_id}/{file}
@@ -459,17 +420,7 @@ def download_attachment(storage_path):
         response = supabase.storage.from_('email-attachments').download(storage_path)
         
         print(f"    Downloaded {len(response)} bytes")
-        
-        # Create temp file
-        temp_dir = tempfile.gettempdir()
-        temp_path = os.path.join(temp_dir, filename)
-        
-        # Write to temp file
-        with open(temp_path, 'wb') as f:
-            f.write(response)
-        
-        print(f"    ✓ Saved to {temp_path}")
-        return temp_path
+        return response
         
     except Exception as e:
         print(f"    ✗ Error downloading: {e}")
@@ -478,11 +429,313 @@ def download_attachment(storage_path):
         return None
 
 
-def process_email(email, neighborhoods):
+# Outcomes returned by process_email
+OUTCOME_CREATED = 'created'   # new listing inserted
+OUTCOME_LINKED = 'linked'     # linked to an existing listing at the same address
+OUTCOME_FLAGGED = 'flagged'   # no COPA form found; flagged placeholder listing created
+OUTCOME_SKIPPED = 'skipped'   # excluded subject, or email already had a listing
+OUTCOME_FAILED = 'failed'
+
+def make_outcome(status, listing_id=None):
+    return {'status': status, 'listing_id': listing_id}
+
+def status_update_batches(pending):
+    """
+    Group queued {email_id: listing_id} status changes into (update, email_ids)
+    pairs, one per distinct listing_id, each written with a single UPDATE.
+    """
+    by_listing = {}
+    for email_id, listing_id in pending.items():
+        by_listing.setdefault(listing_id, []).append(email_id)
+
+    processed_at = datetime.now().isoformat()
+    batches = []
+    for listing_id, email_ids in by_listing.items():
+        update = {'processed': True, 'processed_at': processed_at}
+        if listing_id is not None:
+            update['listing_id'] = listing_id
+        batches.append((update, email_ids))
+    return batches
+
+class EmailStatusBuffer:
+    """
+    Collects "mark email processed" updates and writes them in bulk.
+    Emails sharing a listing_id (or having none) go out in a single
+    UPDATE ... WHERE id IN (...) call. Safe to share between worker threads.
+
+    Updates still queued when the process is killed are lost, and those emails
+    are processed again on the next run. That is safe for COPA listings, which
+    the duplicate check links back to the listing already inserted. Flagged
+    listings aren't deduped, so process_email flushes right after inserting one.
+    """
+
+    def __init__(self, flush_every=None):
+        self.flush_every = flush_every
+        self.failed_ids = []
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def mark_processed(self, email_id, listing_id=None):
+        """Queue an email to be marked processed, optionally linked to a listing."""
+        with self._lock:
+            self._pending[email_id] = listing_id
+            should_flush = self.flush_every and len(self._pending) >= self.flush_every
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """Write all queued updates. Email ids whose update failed are added to failed_ids."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        batches = status_update_batches(pending)
+        for update, email_ids in batches:
+            try:
+                supabase.table('emails')\
+                    .update(update)\
+                    .in_('id', email_ids)\
+                    .execute()
+            except Exception as e:
+                print(f"✗ Error updating status for {len(email_ids)} emails: {e}")
+                with self._lock:
+                    self.failed_ids.extend(email_ids)
+
+        if len(pending) > 1:
+            print(f"✓ Marked {len(pending)} emails processed in {len(batches)} updates")
+
+# Attachments of one email downloaded and analyzed at once
+ATTACHMENT_WORKERS = int(os.getenv('ATTACHMENT_WORKERS', '4'))
+
+def analyze_attachment(storage_path, cache=None, attachment=None):
+    """
+    Detect and parse a COPA form in a stored attachment.
+    The content-hash cache is checked by storage path before downloading and by
+    SHA-256 of the bytes before parsing, so a file seen before costs one lookup.
+    Attachments the prescreen rules out (by the attachment row's metadata, then
+    by the downloaded bytes) are never handed to pdfplumber.
+    Returns (form_data, form_type), or None if the attachment couldn't be downloaded.
+    """
+    cache = cache or get_attachment_cache()
+    
+    verdict = prescreen.CANDIDATE
+    if attachment is not None:
+        skip, verdict = prescreen.skip_attachment(attachment)
+        if skip:
+            return {}, None
+    
+    content_hash, cached = cache.get_by_path(storage_path)
+    if cached:
+        print(f"  ✓ Using cached analysis ({content_hash[:12]})")
+        return cached['form_data'], cached['form_type']
+    
+    data = download_attachment(storage_path)
+    if data is None:
+        return None
+    
+    content_hash = sha256_bytes(data)
+    cached = cache.get(content_hash)
+    if cached:
+        print(f"  ✓ Identical file already analyzed ({content_hash[:12]}), using cached result")
+        cache.link_path(storage_path, content_hash)
+        return cached['form_data'], cached['form_type']
+    
+    page_count = None
+    if verdict == prescreen.CANDIDATE:
+        skip, verdict, page_count = prescreen.skip_pdf(data, COPA_FORM_MARKERS)
+        if skip:
+            return {}, None
+    
+    # Parsed straight from memory - no temp file to collide with or clean up
+    start = time.perf_counter()
+    form_data, form_type, page_texts = parse_copa_form_local(data)
+    prescreen.record_parse(verdict, time.perf_counter() - start, page_count, form_type)
+    cache.put(content_hash, form_type, form_data, page_texts, storage_path=storage_path)
+    return form_data, form_type
+
+def attachment_storage_path(attachment):
+    """
+    Storage path of an attachment worth analyzing, or None (saying why) for
+    inline images and attachments that were never stored.
+    """
+    print(f"\nProcessing attachment: {attachment['filename']}")
+    
+    # Skip inline attachments (usually images in email body)
+    if attachment.get('is_inline'):
+        print(f"  ⊘ Skipping inline attachment")
+        return None
+    
+    storage_path = attachment.get('storage_path')
+    if not storage_path:
+        print(f"  ⚠ No storage path found")
+    return storage_path
+
+def copa_form_from_analysis(analysis):
+    """Report the result of analyze_attachment. Returns the form data if it's a COPA form, else None."""
+    if analysis is None:
+        print(f"  ✗ Download failed, skipping")
+        return None
+    
+    copa_form_result, form_type = analysis
+    if form_type == 'copa3':
+        print(f"  ✓ Successfully parsed COPA3 form")
+    elif form_type == 'copa4':
+        print(f"  ✓ Successfully parsed COPA4 form")
+    else:
+        return None
+    return copa_form_result
+
+def analyze_email_attachment(attachment):
+    """
+    One attachment's share of process_email, run on a worker thread with its
+    output captured. Returns (form data or None, log).
+    """
+    with EmailLogRouter.capture() as log:
+        storage_path = attachment_storage_path(attachment)
+        form_data = copa_form_from_analysis(analyze_attachment(storage_path, attachment=attachment)) if storage_path else None
+    return form_data, log.getvalue()
+
+def find_copa_form(attachments, max_workers=None):
+    """
+    Download and analyze an email's attachments concurrently, returning the
+    COPA form data found, or {} if there is none.
+
+    When several attachments hold a COPA form, the earliest attachment wins.
+    Once attachment i is confirmed, later attachments are cancelled: queued ones
+    never start and running ones are ignored. Earlier ones are still awaited,
+    since they take priority. Attachment logs are printed in attachment order.
+    """
+    if not attachments:
+        return {}
+    
+    results = {}
+    best = None
+    with EmailLogRouter.installed():
+        executor = ThreadPoolExecutor(max_workers=max_workers or ATTACHMENT_WORKERS)
+        try:
+            futures = [executor.submit(analyze_email_attachment, attachment) for attachment in attachments]
+            index_of = {future: i for i, future in enumerate(futures)}
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                i = index_of[future]
+                results[i] = future.result()
+                if results[i][0] and (best is None or i < best):
+                    best = i
+                    for later in futures[i + 1:]:
+                        later.cancel()
+                # Done once nothing that could outrank the best form is outstanding
+                if best is not None and all(j in results for j in range(best)):
+                    break
+        finally:
+            # Don't wait on cancelled-but-running attachments; they only warm the cache
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    return report_attachment_results(results, best, len(attachments))
+
+def report_attachment_results(results, best, total):
+    """
+    Print attachment logs in attachment order, up to the winning attachment,
+    and return its form data ({} if no attachment held a COPA form).
+    results maps attachment index to (form data or None, log).
+    """
+    for i in sorted(results):
+        if best is None or i <= best:
+            print(results[i][1], end='')
+    if best is not None and best < total - 1:
+        print(f"\n⊘ COPA form found in attachment {best + 1}/{total}, skipping the rest")
+    return results[best][0] if best is not None else {}
+
+_listing_locks = {}
+_listing_locks_guard = threading.Lock()
+
+def listing_lock(normalized_address):
+    """The lock serializing the duplicate check and insert for one normalized address across worker threads."""
+    with _listing_locks_guard:
+        return _listing_locks.setdefault(normalized_address, threading.Lock())
+
+def build_flagged_listing(email):
+    """Placeholder listing for an email with no COPA form, addressed by its subject line."""
+    return {
+        'flagged': True,
+        'time_sent_tz': email['received_date'],
+        'address': {
+            'full_address': email.get('subject'),
+        },
+        'normalized_address': normalize_address(email.get('subject')),
+        'details': {
+            'source': {
+                'email_address': email.get('from_address')
+            }
+        }
+    }
+
+def build_listing(email, copa_form_data, location, neighborhood):
+    """Listing row for a parsed COPA form, with its 'details' still attached."""
+    details = copa_form_data.get('details', {})
+    # Add sender email to details
+    details['sender_email'] = email.get('from_address')
+
+    # Helper function to convert -1 to None
+    def safe_value(value):
+        """Return None if value is -1, otherwise return value"""
+        return None if value == -1 else value
+
+    # Add metadata from email
+    listing_data = {
+        'time_sent_tz': email['received_date'],
+        'address': copa_form_data.get('address'),
+        'normalized_address': normalize_address(copa_form_data.get('address', {}).get('full_address')),
+        'neighborhood': neighborhood,
+        'asking_price': safe_value(copa_form_data.get('asking_price')),
+        'total_units': safe_value(copa_form_data.get('total_units')),
+        'residential_units': safe_value(copa_form_data.get('residential_units')),
+        'vacant_residential': safe_value(copa_form_data.get('vacant_residential')),
+        'commercial_units': safe_value(copa_form_data.get('commercial_units')),
+        'vacant_commercial': safe_value(copa_form_data.get('vacant_commercial')),
+        'is_vacant_lot': copa_form_data.get('is_vacant_lot', False),
+        'unit_mix': copa_form_data.get('unit_mix'),
+        'details': details
+    }
+
+    if listing_data.get('neighborhood') is None:
+        listing_data['flagged'] = True
+    
+    # Add location to details if available
+    if location:
+        listing_data['location'] = {
+            'type': 'Point',
+            'coordinates': [location['lng'], location['lat']]
+        }
+    
+    # Add sender email to details.source
+    if 'source' not in listing_data['details']:
+        listing_data['details']['source'] = {}
+    listing_data['details']['source']['email_address'] = email.get('from_address')
+
+    return listing_data
+
+def listing_rpc_params(listing_data):
+    """Split details off a listing for insert_listing_with_encryption, which encrypts them separately."""
+    details = listing_data.pop('details')
+    return {
+        'listing_data': listing_data,
+        'details_to_encrypt': details
+    }
+
+def process_email(email, neighborhoods, status_buffer=None):
     """
     Process a single email: extract text from attachments, parse with AI,
     geocode location, find neighborhood, insert into copa_listings_new.
+
+    The email's processed/listing_id update is queued on status_buffer
+    (written immediately when none is given). Returns an outcome dict:
+    {'status': created|linked|flagged|skipped|failed, 'listing_id': ...}.
     """
+    if status_buffer is None:
+        status_buffer = EmailStatusBuffer(flush_every=1)
+
     email_id = email['id']
     email_subject = email.get('subject', 'No subject')
 
@@ -493,18 +746,15 @@ def process_email(email, neighborhoods):
         print(f"  Subject: {email_subject}")
         
         # Mark as processed so it doesn't get picked up again
-        supabase.table('emails')\
-            .update({'processed': True, 'processed_at': datetime.now().isoformat()})\
-            .eq('id', email_id)\
-            .execute()
+        status_buffer.mark_processed(email_id)
         
-        return True
+        return make_outcome(OUTCOME_SKIPPED)
 
     # Check if already processed with a listing
     if email.get('listing_id'):
         print(f"\n⊘ Email already has listing: {email['listing_id']}")
         print(f"  Subject: {email.get('subject')}")
-        return True
+        return make_outcome(OUTCOME_SKIPPED, email['listing_id'])
 
     print(f"\n{'='*60}")
     print(f"Processing email ID: {email_id}")
@@ -533,120 +783,36 @@ def process_email(email, neighborhoods):
         for att in attachments:
             print(f"  - {att['filename']} ({att['content_type']}, inline={att.get('is_inline')})")
 
-    copa_form_data = {}
-    # safe_attachment_texts = []
-
-    
-    for attachment in attachments:
-        att_id = attachment['id']
-        filename = attachment['filename']
-        content_type = attachment['content_type']
-        
-        print(f"\nProcessing attachment: {filename}")
-        
-        '''
-        # Check if already extracted
-        if attachment.get('extracted_text'):
-            print(f"  ✓ Using cached text ({len(attachment['extracted_text'])} chars)")
-            attachment_texts.append(attachment['extracted_text'])
-            continue
-        '''
-        
-        # Skip inline attachments (usually images in email body)
-        if attachment.get('is_inline'):
-            print(f"  ⊘ Skipping inline attachment")
-            continue
-        
-        # Download and extract text
-        storage_path = attachment.get('storage_path')
-        if not storage_path:
-            print(f"  ⚠ No storage path found")
-            continue
-        
-        # Download attachment
-        temp_path = download_attachment(storage_path)
-        if not temp_path:
-            print(f"  ✗ Download failed, skipping")
-            continue
-        
-        '''
-        # Extract text
-        print(f"  Extracting text...")
-        extracted_text = extract_text_from_file(temp_path, content_type)
-        print(f"  Extracted {len(extracted_text)} characters")
-        '''
-
-        # Check if it's a COPA3 form
-        copa_form_result = parse_copa3_form_local(temp_path)
-        if copa_form_result:
-            print(f"  ✓ Successfully parsed COPA3 form")
-            copa_form_data = copa_form_result
-        else:
-            print(f"  COPA3 not detected or failed to parse, trying COPA4")
-            copa_form_result = parse_copa4_form_local(temp_path)
-            if copa_form_result:
-                print(f"  ✓ Successfully parsed COPA4 form")
-                copa_form_data = copa_form_result
-                break
-            else:
-                print(f"  COPA4 not detected or failed to parse")
-
-        # Clean up temp file
-        try:
-            os.remove(temp_path)
-            print(f"  Cleaned up temp file")
-        except Exception as e:
-            print(f"  ⚠ Failed to clean up temp file: {e}")
+    # Download and analyze attachments concurrently, keeping the earliest COPA form
+    copa_form_data = find_copa_form(attachments)
         
     print(f"COPA form data found: {bool(copa_form_data)}")
     
     if not copa_form_data:
-    # Mark email as processed
-        supabase.table('emails')\
-            .update({'processed': True, 'processed_at': datetime.now().isoformat()})\
-            .eq('id', email_id)\
-            .execute()
-    
         try:
-            listing_data = {
-                'flagged': True,
-                'time_sent_tz': email['received_date'],
-                'address': {
-                    'full_address': email.get('subject'),
-                },
-                'details': {
-                    'source': {
-                        'email_address': email.get('from_address')
-                    }
-                }
-            }
-            
-            # Separate details for encryption
-            details = listing_data.pop('details')
-            
             # Insert the flagged listing
             listing_id = supabase.rpc(
                 'insert_listing_with_encryption',
-                {
-                    'listing_data': listing_data,
-                    'details_to_encrypt': details
-                }
+                listing_rpc_params(build_flagged_listing(email))
             ).execute().data
             
-            # Link email to the new flagged listing
-            supabase.table('emails')\
-                .update({'listing_id': listing_id})\
-                .eq('id', email_id)\
-                .execute()
+            # Mark email as processed and link it to the new flagged listing. Written now
+            # rather than buffered: flagged listings aren't deduped, so an email whose
+            # flag was lost in a crash would get a second flagged listing on the next run
+            status_buffer.mark_processed(email_id, listing_id)
+            status_buffer.flush()
                 
             print(f"✓ Created flagged listing: {listing_id}")
+            return make_outcome(OUTCOME_FLAGGED, listing_id)
             
         except Exception as e:
             print(f"✗ Error creating flagged listing: {e}")
             import traceback
             traceback.print_exc()
-        
-        return True
+            
+            # Still mark as processed so it doesn't get picked up again
+            status_buffer.mark_processed(email_id)
+            return make_outcome(OUTCOME_FAILED)
 
     # Geocode address and find neighborhood (non-blocking)
     location = None
@@ -675,49 +841,21 @@ def process_email(email, neighborhoods):
             print(f"  ⚠ Location/neighborhood lookup failed (non-blocking): {e}")
             # Continue processing - don't let this block the listing creation
     
-    details = copa_form_data.get('details', {})
-    # Add sender email to details
-    details['sender_email'] = email.get('from_address')
-
-    # Helper function to convert -1 to None
-    def safe_value(value):
-        """Return None if value is -1, otherwise return value"""
-        return None if value == -1 else value
-
-    # Add metadata from email
-    listing_data = {
-        'time_sent_tz': email['received_date'],
-        'address': copa_form_data.get('address'),
-        'neighborhood': neighborhood,
-        'asking_price': safe_value(copa_form_data.get('asking_price')),
-        'total_units': safe_value(copa_form_data.get('total_units')),
-        'residential_units': safe_value(copa_form_data.get('residential_units')),
-        'vacant_residential': safe_value(copa_form_data.get('vacant_residential')),
-        'commercial_units': safe_value(copa_form_data.get('commercial_units')),
-        'vacant_commercial': safe_value(copa_form_data.get('vacant_commercial')),
-        'is_vacant_lot': copa_form_data.get('is_vacant_lot', False),
-        'unit_mix': copa_form_data.get('unit_mix'),
-        'details': details
-    }
-
-    if listing_data.get('neighborhood') is None:
-        listing_data['flagged'] = True
-    
-    # Add location to details if available
-    if location:
-        listing_data['location'] = {
-            'type': 'Point',
-            'coordinates': [location['lng'], location['lat']]
-        }
-    
-    # Add sender email to details.source
-    if 'source' not in listing_data['details']:
-        listing_data['details']['source'] = {}
-    listing_data['details']['source']['email_address'] = email.get('from_address')
+    listing_data = build_listing(email, copa_form_data, location, neighborhood)
     
     print(f"\nListing data prepared:")
     print(json.dumps(listing_data, indent=2, default=str))
     
+    # Forwarded copies of one COPA often land in the same batch; hold the address's
+    # lock so a concurrent worker sees this listing instead of inserting its own
+    with listing_lock(listing_data['normalized_address']):
+        return insert_or_link_listing(email_id, listing_data, status_buffer)
+
+def insert_or_link_listing(email_id, listing_data, status_buffer):
+    """
+    Link the email to an existing listing at the same address, or insert the
+    listing. Callers hold listing_lock for the address. Returns an outcome dict.
+    """
     # Check for duplicate listing before inserting into copa_listings_new
     print(f"\nChecking for duplicate listings...")
     existing_listing_id = check_duplicate_listing(listing_data['address'])
@@ -729,40 +867,19 @@ def process_email(email, neighborhoods):
         print(f"  → Linking email to existing listing (not creating new)")
         
         # Link email to existing listing
-        try:
-            supabase.table('emails')\
-                .update({
-                    'processed': True,
-                    'processed_at': datetime.now().isoformat(),
-                    'listing_id': existing_listing_id
-                })\
-                .eq('id', email_id)\
-                .execute()
-            
-            print(f"✓ Email linked to existing listing")
-            return True
-            
-        except Exception as e:
-            print(f"✗ Error linking to existing listing: {e}")
-            import traceback
-            traceback.print_exc()
-            return False
+        status_buffer.mark_processed(email_id, existing_listing_id)
+        print(f"✓ Email queued to link to existing listing")
+        return make_outcome(OUTCOME_LINKED, existing_listing_id)
     
     print(f"✓ No duplicate found, creating new listing...")
 
     # Insert into copa_listings_new
     print(f"\nInserting into copa_listings_new...")
     try:
-        # Separate details from other fields
-        details = listing_data.pop('details')
-        
         # Call the database function to insert with encryption
         result = supabase.rpc(
             'insert_listing_with_encryption',
-            {
-                'listing_data': listing_data,
-                'details_to_encrypt': details
-            }
+            listing_rpc_params(listing_data)
         ).execute()
 
         '''
@@ -779,30 +896,174 @@ def process_email(email, neighborhoods):
         print(f"✓ Created listing: {listing_id}")
         
         # Mark email as processed and link to listing
-        print(f"Updating email record...")
-        supabase.table('emails')\
-            .update({
-                'processed': True,
-                'processed_at': datetime.now().isoformat(),
-                'listing_id': listing_id
-            })\
-            .eq('id', email_id)\
-            .execute()
-        
-        print(f"✓ Email marked as processed and linked to listing")
-        return True
+        status_buffer.mark_processed(email_id, listing_id)
+        print(f"✓ Email queued to be marked as processed and linked to listing")
+        return make_outcome(OUTCOME_CREATED, listing_id)
         
     except Exception as e:
         print(f"✗ Error inserting listing: {e}")
         import traceback
         traceback.print_exc()
-        return False
+        return make_outcome(OUTCOME_FAILED)
+
+class EmailLogRouter(io.TextIOBase):
+    """
+    Stand-in for sys.stdout/sys.stderr while emails run concurrently.
+    Output from a worker thread or asyncio task that is capturing goes to that
+    email's buffer so logs from concurrent emails don't interleave; everything
+    else passes through.
+    """
+    _buffer = contextvars.ContextVar('email_log_buffer', default=None)
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, s):
+        return (self._buffer.get() or self._stream).write(s)
+
+    def flush(self):
+        self._stream.flush()
+
+    @classmethod
+    @contextmanager
+    def capture(cls):
+        buffer = io.StringIO()
+        token = cls._buffer.set(buffer)
+        try:
+            yield buffer
+        finally:
+            cls._buffer.reset(token)
+
+    @classmethod
+    @contextmanager
+    def installed(cls):
+        """Route sys.stdout/sys.stderr through EmailLogRouter; yields the real stdout."""
+        if isinstance(sys.stdout, cls):
+            # Already routed by an outer run_emails_concurrently/find_copa_form
+            yield sys.stdout._stream
+            return
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = cls(stdout), cls(stderr)
+        try:
+            yield stdout
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+def run_email(i, total, email, neighborhoods, status_buffer=None):
+    """
+    Process one email, reporting and returning its outcome dict.
+    Exceptions are contained here so one bad email can't stop the batch.
+    """
+    print(f"\n{'#'*60}")
+    print(f"EMAIL {i}/{total}")
+    print(f"{'#'*60}")
+    
+    try:
+        outcome = process_email(email, neighborhoods, status_buffer)
+    except Exception as e:
+        print(f"\n✗ Email {i} failed with exception: {e}")
+        import traceback
+        traceback.print_exc()
+        return make_outcome(OUTCOME_FAILED)
+    
+    report_outcome(i, outcome)
+    return outcome
+
+def report_outcome(i, outcome):
+    if outcome['status'] == OUTCOME_FAILED:
+        print(f"\n✗ Email {i} failed")
+    elif outcome['listing_id']:
+        print(f"\n✓ Email {i} completed - {outcome['status']} listing {outcome['listing_id']}")
+    else:
+        print(f"\n⊘ Email {i} completed - no listing (non-listing classification)")
+
+def run_emails_concurrently(emails, neighborhoods, workers, status_buffer=None):
+    """
+    Run emails through a bounded thread pool. Each email's log is buffered
+    and printed in input order once it finishes. Returns outcomes in input order.
+    """
+    def _worker(i, email):
+        with EmailLogRouter.capture() as log:
+            outcome = run_email(i, len(emails), email, neighborhoods, status_buffer)
+        return outcome, log.getvalue()
+
+    outcomes = []
+    with EmailLogRouter.installed() as stdout:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_worker, i, email) for i, email in enumerate(emails, 1)]
+            for future in futures:
+                outcome, log = future.result()
+                stdout.write(log)
+                stdout.flush()
+                outcomes.append(outcome)
+    return outcomes
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Process unprocessed emails into COPA listings.")
+    parser.add_argument('limit', nargs='?', type=int,
+                        help="Historical mode: process this many of the oldest unprocessed emails")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of emails to process concurrently (default: 1)")
+    parser.add_argument('--flush-every', type=int, default=25,
+                        help="Write queued email status updates every N emails (default: 25)")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.flush_every < 1:
+        parser.error("--flush-every must be at least 1")
+    return args
+
+def unprocessed_emails_query(client, limit=None):
+    """
+    Build the query for emails to process: the `limit` oldest unprocessed
+    emails in historical mode, otherwise the 25 newest (cron mode).
+    Works with both the sync and async Supabase clients; the caller executes it.
+    """
+    if limit is not None:
+        # Historical processing
+        print(f"\n[HISTORICAL MODE] Processing {limit} oldest unprocessed emails...")
+
+        return client.table('emails')\
+            .select('*')\
+            .eq('processed', False)\
+            .order('received_date', desc=False)\
+            .limit(limit)
+    
+    # Default cron job mode - process up to 25 unprocessed emails
+    print(f"\n[CRON MODE] Processing up to 25 unprocessed emails...")
+
+    return client.table('emails')\
+        .select('*')\
+        .eq('processed', False)\
+        .order('received_date', desc=True)\
+        .limit(25)
+
+def print_summary(outcomes, failed_status_ids=()):
+    """Print per-outcome counts for a run."""
+    counts = {status: 0 for status in (OUTCOME_CREATED, OUTCOME_LINKED, OUTCOME_FLAGGED, OUTCOME_SKIPPED, OUTCOME_FAILED)}
+    for outcome in outcomes:
+        counts[outcome['status']] += 1
+    
+    print("\n" + "="*60)
+    print("PROCESSING COMPLETE")
+    print("="*60)
+    print(f"Total processed: {len(outcomes)}")
+    print(f"  ✓ Listings created: {counts[OUTCOME_CREATED]}")
+    print(f"  ✓ Linked to existing listings: {counts[OUTCOME_LINKED]}")
+    print(f"  ⚑ Flagged (no COPA form): {counts[OUTCOME_FLAGGED]}")
+    print(f"  ⊘ Skipped: {counts[OUTCOME_SKIPPED]}")
+    print(f"  ✗ Failed: {counts[OUTCOME_FAILED]}")
+    if failed_status_ids:
+        print(f"  ⚠ Status update failed for {len(failed_status_ids)} emails: {list(failed_status_ids)}")
+    print("="*60)
 
 def main():
     """
     Main function: process unprocessed emails from the last 5 minutes,
     or optionally process historical emails via command line arguments.
     """
+    args = parse_args(sys.argv[1:])
+
     print("="*60)
     print("EMAIL PARSER - Processing Pipeline")
     print(f"Started at: {datetime.now()}")
@@ -810,37 +1071,9 @@ def main():
 
     # Load neighborhoods data once at startup
     neighborhoods = load_sf_neighborhoods()
-    if not neighborhoods:
-        print("⚠ Warning: Could not load neighborhoods data. Continuing without neighborhood lookup.")
             
-    if len(sys.argv) > 1:
-        # Historical processing
-        try:
-            limit = int(sys.argv[1])
-            print(f"\n[HISTORICAL MODE] Processing {limit} oldest unprocessed emails...")
-
-            emails_response = supabase.table('emails')\
-                .select('*')\
-                .eq('processed', False)\
-                .order('received_date', desc=False)\
-                .limit(limit)\
-                .execute()
-        except ValueError:
-            print(f"✗ Invalid limit: {sys.argv[1]}")
-            return
-    else:
-        # Default cron job mode - process up to 25 unprocessed emails
-        print(f"\n[CRON MODE] Processing up to 25 unprocessed emails...")
-    
-        emails_response = supabase.table('emails')\
-            .select('*')\
-            .eq('processed', False)\
-            .order('received_date', desc=True)\
-            .limit(25)\
-            .execute()
-        
     try:
-        emails = emails_response.data
+        emails = unprocessed_emails_query(supabase, args.limit).execute().data
         print(f"Query returned {len(emails)} emails")
         
     except Exception as e:
@@ -858,46 +1091,22 @@ def main():
     for i, email in enumerate(emails, 1):
         print(f"  {i}. {email.get('subject', 'No subject')} (from {email.get('from_address')})")
     
-    # Process each email
-    success_count = 0
-    skip_count = 0
-    fail_count = 0
-    
-    for i, email in enumerate(emails, 1):
-        print(f"\n{'#'*60}")
-        print(f"EMAIL {i}/{len(emails)}")
-        print(f"{'#'*60}")
-        
-        try:
-            result = process_email(email, neighborhoods)
-            
-            if result:
-                # Check if listing was created
-                email_check = supabase.table('emails').select('listing_id').eq('id', email['id']).execute()
-                if email_check.data and email_check.data[0].get('listing_id'):
-                    success_count += 1
-                    print(f"\n✓ Email {i} completed successfully - listing created")
-                else:
-                    skip_count += 1
-                    print(f"\n⊘ Email {i} completed - no listing (non-listing classification)")
+    # Process each email, writing status updates in bulk. Output is routed for the
+    # whole run so attachment workers abandoned by find_copa_form stay captured.
+    status_buffer = EmailStatusBuffer(flush_every=args.flush_every)
+    try:
+        with EmailLogRouter.installed():
+            if args.workers > 1:
+                print(f"\nProcessing with {args.workers} workers...")
+                outcomes = run_emails_concurrently(emails, neighborhoods, args.workers, status_buffer)
             else:
-                fail_count += 1
-                print(f"\n✗ Email {i} failed")
-        except Exception as e:
-            fail_count += 1
-            print(f"\n✗ Email {i} failed with exception: {e}")
-            import traceback
-            traceback.print_exc()
-    
-    # Summary
-    print("\n" + "="*60)
-    print("PROCESSING COMPLETE")
-    print("="*60)
-    print(f"Total processed: {len(emails)}")
-    print(f"  ✓ Listings created: {success_count}")
-    print(f"  ⊘ Skipped (non-listings): {skip_count}")
-    print(f"  ✗ Failed: {fail_count}")
-    print("="*60)
+                outcomes = [run_email(i, len(emails), email, neighborhoods, status_buffer)
+                            for i, email in enumerate(emails, 1)]
+    finally:
+        status_buffer.flush()
+
+    print_summary(outcomes, status_buffer.failed_ids)
+    prescreen.get_stats().print_summary()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,462 @@
+"""
+asyncio variant of process_emails.py.
+
+Every stage of the pipeline except PDF parsing waits on the network:
+Supabase REST and storage, and Nominatim. Here many emails are in flight on
+one event loop. They share the async Supabase client and a pooled httpx
+client for Nominatim, and each service has its own concurrency cap, so
+downloads, geocoding and database writes from different emails overlap.
+pdfplumber parsing is CPU-bound and runs in a process pool.
+
+Listings, status updates, caches and per-email log output are the same as
+process_emails.py, which remains the default entry point.
+
+Usage:
+    python process_emails_async.py [limit] [--concurrency N] [--parse-workers N]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from supabase import acreate_client
+import config
+import prescreen
+from attachment_cache import get_cache as get_attachment_cache, sha256_bytes
+from geocoding import AsyncNominatimClient, get_location_from_address_async
+from neighborhoods import load_sf_neighborhoods, get_neighborhood_from_location
+from process_data import normalize_address
+from process_emails import (
+    COPA_FORM_MARKERS, EmailLogRouter, OUTCOME_CREATED, OUTCOME_FAILED, OUTCOME_FLAGGED, OUTCOME_LINKED, OUTCOME_SKIPPED,
+    attachment_storage_path, build_flagged_listing, build_listing, copa_form_from_analysis, dedupe_error, listing_rpc_params,
+    make_outcome, parse_copa_form_local, print_summary, report_attachment_results, report_outcome,
+    should_skip_email, status_update_batches, unprocessed_emails_query,
+)
+
+# Requests allowed in flight at once, per service. Nominatim is additionally held
+# to 1 request/second by the geocoder's token bucket.
+DB_CONCURRENCY = int(os.getenv('ASYNC_DB_CONCURRENCY', '8'))
+STORAGE_CONCURRENCY = int(os.getenv('ASYNC_STORAGE_CONCURRENCY', '4'))
+GEOCODE_CONCURRENCY = int(os.getenv('ASYNC_GEOCODE_CONCURRENCY', '2'))
+
+class ServiceLimits:
+    """Per-service semaphores shared by every in-flight email."""
+
+    def __init__(self, db=DB_CONCURRENCY, storage=STORAGE_CONCURRENCY, geocode=GEOCODE_CONCURRENCY):
+        self.db = asyncio.Semaphore(db)
+        self.storage = asyncio.Semaphore(storage)
+        self.geocode = asyncio.Semaphore(geocode)
+
+def parse_in_worker(pdf_source):
+    """
+    Run parse_copa_form_local in a pool process, capturing what it prints so
+    the caller can add it to the right email's log.
+    Returns (form_data, form_type, page_texts, log, seconds).
+    """
+    log = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        form_data, form_type, page_texts = parse_copa_form_local(pdf_source)
+    return form_data, form_type, page_texts, log.getvalue(), time.perf_counter() - start
+
+class AsyncEmailStatusBuffer:
+    """asyncio counterpart of EmailStatusBuffer, writing through the async client."""
+
+    def __init__(self, client, limits, flush_every=None):
+        self.client = client
+        self.limits = limits
+        self.flush_every = flush_every
+        self.failed_ids = []
+        self._pending = {}
+
+    async def mark_processed(self, email_id, listing_id=None):
+        """Queue an email to be marked processed, optionally linked to a listing."""
+        self._pending[email_id] = listing_id
+        if self.flush_every and len(self._pending) >= self.flush_every:
+            await self.flush()
+
+    async def flush(self):
+        """Write all queued updates. Email ids whose update failed are added to failed_ids."""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        batches = status_update_batches(pending)
+        await asyncio.gather(*(self._write(update, email_ids) for update, email_ids in batches))
+
+        if len(pending) > 1:
+            print(f"✓ Marked {len(pending)} emails processed in {len(batches)} updates")
+
+    async def _write(self, update, email_ids):
+        try:
+            async with self.limits.db:
+                await self.client.table('emails')\
+                    .update(update)\
+                    .in_('id', email_ids)\
+                    .execute()
+        except Exception as e:
+            print(f"✗ Error updating status for {len(email_ids)} emails: {e}")
+            self.failed_ids.extend(email_ids)
+
+class AsyncEmailPipeline:
+    """
+    Processes emails concurrently on the event loop.
+    Mirrors process_emails.process_email step for step; the listing rows,
+    status updates and outcomes it produces are identical.
+    """
+
+    def __init__(self, client, neighborhoods, geocoder, parse_pool, limits=None, cache=None, flush_every=25):
+        self.client = client
+        self.neighborhoods = neighborhoods
+        self.geocoder = geocoder
+        self.parse_pool = parse_pool
+        self.limits = limits or ServiceLimits()
+        self.cache = cache or get_attachment_cache()
+        self.status_buffer = AsyncEmailStatusBuffer(client, self.limits, flush_every)
+        self._listing_locks = {}
+
+    async def _db(self, request):
+        """Execute a Supabase request under the database concurrency limit."""
+        async with self.limits.db:
+            return await request.execute()
+
+    async def download_attachment(self, storage_path):
+        """Download an attachment from Supabase storage. Returns its bytes, or None on failure."""
+        filename = os.path.basename(storage_path)
+        print(f"    Downloading {filename}...")
+        print(f"    Storage path: {storage_path}")
+        try:
+            async with self.limits.storage:
+                data = await self.client.storage.from_('email-attachments').download(storage_path)
+        except Exception as e:
+            print(f"    ✗ Error downloading: {e}")
+            return None
+        print(f"    Downloaded {len(data)} bytes")
+        return data
+
+    async def parse_pdf(self, data):
+        """
+        Parse PDF bytes in the process pool. The bytes are sent to the worker
+        directly, without a temp file. Returns (form_data, form_type, page_texts, seconds).
+        """
+        loop = asyncio.get_running_loop()
+        form_data, form_type, page_texts, log, seconds = await loop.run_in_executor(self.parse_pool, parse_in_worker, data)
+        print(log, end='')
+        return form_data, form_type, page_texts, seconds
+
+    async def analyze_attachment(self, storage_path, attachment=None):
+        """
+        Detect and parse a COPA form in a stored attachment, consulting the
+        content-hash cache by path before downloading and by hash before parsing,
+        and skipping attachments the prescreen rules out.
+        Returns (form_data, form_type), or None if the attachment couldn't be downloaded.
+        """
+        verdict = prescreen.CANDIDATE
+        if attachment is not None:
+            skip, verdict = prescreen.skip_attachment(attachment)
+            if skip:
+                return {}, None
+
+        # SQLite lookups and hashing whole PDFs would stall every other email on the loop
+        content_hash, cached = await asyncio.to_thread(self.cache.get_by_path, storage_path)
+        if cached:
+            print(f"  ✓ Using cached analysis ({content_hash[:12]})")
+            return cached['form_data'], cached['form_type']
+
+        data = await self.download_attachment(storage_path)
+        if data is None:
+            return None
+
+        content_hash = await asyncio.to_thread(sha256_bytes, data)
+        cached = await asyncio.to_thread(self.cache.get, content_hash)
+        if cached:
+            print(f"  ✓ Identical file already analyzed ({content_hash[:12]}), using cached result")
+            await asyncio.to_thread(self.cache.link_path, storage_path, content_hash)
+            return cached['form_data'], cached['form_type']
+
+        page_count = None
+        if verdict == prescreen.CANDIDATE:
+            skip, verdict, page_count = await asyncio.to_thread(prescreen.skip_pdf, data, COPA_FORM_MARKERS)
+            if skip:
+                return {}, None
+
+        form_data, form_type, page_texts, seconds = await self.parse_pdf(data)
+        prescreen.record_parse(verdict, seconds, page_count, form_type)
+        await asyncio.to_thread(self.cache.put, content_hash, form_type, form_data, page_texts, storage_path=storage_path)
+        return form_data, form_type
+
+    async def analyze_email_attachment(self, attachment):
+        """One attachment's share of process_email, with its output captured. Returns (form data or None, log)."""
+        with EmailLogRouter.capture() as log:
+            storage_path = attachment_storage_path(attachment)
+            form_data = copa_form_from_analysis(await self.analyze_attachment(storage_path, attachment)) if storage_path else None
+        return form_data, log.getvalue()
+
+    async def find_copa_form(self, attachments):
+        """
+        Analyze an email's attachments concurrently; see process_emails.find_copa_form
+        for the priority rule. Tasks for attachments after the winning one are
+        cancelled outright (a parse already handed to the process pool still runs
+        to completion there, but nothing waits for it).
+        """
+        if not attachments:
+            return {}
+
+        tasks = [asyncio.create_task(self.analyze_email_attachment(attachment)) for attachment in attachments]
+        results = {}
+        best = None
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    i = tasks.index(task)
+                    results[i] = task.result()
+                    if results[i][0] and (best is None or i < best):
+                        best = i
+                        for later in tasks[i + 1:]:
+                            later.cancel()
+                if best is not None and all(j in results for j in range(best)):
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        return report_attachment_results(results, best, len(attachments))
+
+    async def check_duplicate_listing(self, address_obj):
+        """Return the id of an existing listing with the same normalized address, or None. Raises if the lookup fails."""
+        if not address_obj or not address_obj.get('full_address'):
+            return None
+
+        try:
+            response = await self._db(
+                self.client.table('copa_listings_new')
+                    .select('id, address')
+                    .eq('normalized_address', normalize_address(address_obj['full_address']))
+                    .limit(1)
+            )
+            if response.data:
+                listing = response.data[0]
+                existing_full_address = (listing.get('address') or {}).get('full_address', '')
+                print(f"    Match found: '{existing_full_address}' ≈ '{address_obj['full_address']}'")
+                return listing['id']
+            return None
+        except Exception as e:
+            print(f"    ✗ Error checking for duplicates: {e}")
+            raise dedupe_error(e) from e
+
+    def listing_lock(self, normalized_address):
+        """The lock serializing the duplicate check and insert for one normalized address across emails in flight."""
+        return self._listing_locks.setdefault(normalized_address, asyncio.Lock())
+
+    async def insert_listing(self, listing_data):
+        """Insert a listing through insert_listing_with_encryption and return its id."""
+        response = await self._db(self.client.rpc('insert_listing_with_encryption', listing_rpc_params(listing_data)))
+        return response.data
+
+    async def locate(self, address_obj):
+        """Geocode an address and find its neighborhood. Returns (location, neighborhood); never raises."""
+        location = None
+        neighborhood = None
+        print(f"\nGeocoding address: {address_obj}")
+        try:
+            async with self.limits.geocode:
+                location = await get_location_from_address_async(address_obj, self.geocoder)
+
+            if location and self.neighborhoods:
+                print(f"Finding neighborhood...")
+                neighborhood = get_neighborhood_from_location(location['lat'], location['lng'], self.neighborhoods)
+                if neighborhood:
+                    print(f"  ✓ Neighborhood: {neighborhood}")
+                else:
+                    print(f"  ⚠ Neighborhood not found")
+        except Exception as e:
+            print(f"  ⚠ Location/neighborhood lookup failed (non-blocking): {e}")
+        return location, neighborhood
+
+    async def process_email(self, email):
+        """Process a single email; see process_emails.process_email. Returns an outcome dict."""
+        email_id = email['id']
+        email_subject = email.get('subject', 'No subject')
+
+        if should_skip_email(email_subject):
+            print(f"\n⊘ Skipping email - excluded subject pattern")
+            print(f"  Subject: {email_subject}")
+            await self.status_buffer.mark_processed(email_id)
+            return make_outcome(OUTCOME_SKIPPED)
+
+        if email.get('listing_id'):
+            print(f"\n⊘ Email already has listing: {email['listing_id']}")
+            print(f"  Subject: {email.get('subject')}")
+            return make_outcome(OUTCOME_SKIPPED, email['listing_id'])
+
+        print(f"\n{'='*60}")
+        print(f"Processing email ID: {email_id}")
+        print(f"Subject: {email_subject}")
+        print(f"From: {email.get('from_address')}")
+        print(f"Date: {email.get('received_date')}")
+        print(f"{'='*60}")
+
+        print(f"\nQuerying attachments for email_id={email_id}...")
+        attachments = (await self._db(
+            self.client.table('email_attachments').select('*').eq('email_id', email_id)
+        )).data
+        print(f"Found {len(attachments)} attachments")
+
+        copa_form_data = await self.find_copa_form(attachments)
+
+        print(f"COPA form data found: {bool(copa_form_data)}")
+
+        if not copa_form_data:
+            try:
+                listing_id = await self.insert_listing(build_flagged_listing(email))
+                # Written now, not buffered; see process_emails.process_email
+                await self.status_buffer.mark_processed(email_id, listing_id)
+                await self.status_buffer.flush()
+                print(f"✓ Created flagged listing: {listing_id}")
+                return make_outcome(OUTCOME_FLAGGED, listing_id)
+            except Exception as e:
+                print(f"✗ Error creating flagged listing: {e}")
+                await self.status_buffer.mark_processed(email_id)
+                return make_outcome(OUTCOME_FAILED)
+
+        location, neighborhood = None, None
+        if copa_form_data.get('address'):
+            location, neighborhood = await self.locate(copa_form_data['address'])
+
+        listing_data = build_listing(email, copa_form_data, location, neighborhood)
+        print(f"\nListing data prepared:")
+        print(json.dumps(listing_data, indent=2, default=str))
+
+        # Forwarded copies of one COPA are often in flight together; see process_emails.process_email
+        async with self.listing_lock(listing_data['normalized_address']):
+            return await self.insert_or_link_listing(email_id, listing_data)
+
+    async def insert_or_link_listing(self, email_id, listing_data):
+        """Link the email to an existing listing at the same address, or insert the listing. Callers hold listing_lock."""
+        print(f"\nChecking for duplicate listings...")
+        existing_listing_id = await self.check_duplicate_listing(listing_data['address'])
+        if existing_listing_id:
+            print(f"⚠ Duplicate listing found!")
+            print(f"  Existing listing ID: {existing_listing_id}")
+            await self.status_buffer.mark_processed(email_id, existing_listing_id)
+            return make_outcome(OUTCOME_LINKED, existing_listing_id)
+
+        print(f"\nInserting into copa_listings_new...")
+        try:
+            listing_id = await self.insert_listing(listing_data)
+        except Exception as e:
+            print(f"✗ Error inserting listing: {e}")
+            return make_outcome(OUTCOME_FAILED)
+
+        print(f"✓ Created listing: {listing_id}")
+        await self.status_buffer.mark_processed(email_id, listing_id)
+        return make_outcome(OUTCOME_CREATED, listing_id)
+
+    async def run_email(self, i, total, email):
+        """Process one email with its output captured. Returns (outcome, log)."""
+        with EmailLogRouter.capture() as log:
+            print(f"\n{'#'*60}")
+            print(f"EMAIL {i}/{total}")
+            print(f"{'#'*60}")
+            try:
+                outcome = await self.process_email(email)
+            except Exception as e:
+                print(f"\n✗ Email {i} failed with exception: {e}")
+                import traceback
+                traceback.print_exc()
+                outcome = make_outcome(OUTCOME_FAILED)
+            else:
+                report_outcome(i, outcome)
+        return outcome, log.getvalue()
+
+    async def run(self, emails, concurrency):
+        """
+        Process emails with at most `concurrency` in flight, printing each
+        email's log in input order. Returns outcomes in input order.
+        """
+        gate = asyncio.Semaphore(concurrency)
+
+        async def _bounded(i, email):
+            async with gate:
+                return await self.run_email(i, len(emails), email)
+
+        outcomes = []
+        with EmailLogRouter.installed() as stdout:
+            tasks = [asyncio.create_task(_bounded(i, email)) for i, email in enumerate(emails, 1)]
+            for task in tasks:
+                outcome, log = await task
+                stdout.write(log)
+                stdout.flush()
+                outcomes.append(outcome)
+        return outcomes
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Process unprocessed emails into COPA listings (asyncio).")
+    parser.add_argument('limit', nargs='?', type=int,
+                        help="Historical mode: process this many of the oldest unprocessed emails")
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help="Number of emails in flight at once (default: 8)")
+    parser.add_argument('--parse-workers', type=int, default=os.cpu_count() or 1,
+                        help="Processes used for PDF parsing (default: CPU count)")
+    parser.add_argument('--flush-every', type=int, default=25,
+                        help="Write queued email status updates every N emails (default: 25)")
+    args = parser.parse_args(argv)
+    for name in ('concurrency', 'parse_workers', 'flush_every'):
+        if getattr(args, name) < 1:
+            parser.error(f"--{name.replace('_', '-')} must be at least 1")
+    return args
+
+async def main_async(args):
+    print("="*60)
+    print("EMAIL PARSER - Processing Pipeline (async)")
+    print(f"Started at: {datetime.now()}")
+    print("="*60)
+
+    neighborhoods = load_sf_neighborhoods()
+
+    client = await acreate_client(config.SUPABASE_URL, config.SUPABASE_KEY)
+
+    try:
+        emails = (await unprocessed_emails_query(client, args.limit).execute()).data
+        print(f"Query returned {len(emails)} emails")
+    except Exception as e:
+        print(f"✗ Error querying emails: {e}")
+        import traceback
+        traceback.print_exc()
+        return
+
+    if not emails:
+        print("No emails to process!")
+        return
+
+    print(f"\nEmails to process:")
+    for i, email in enumerate(emails, 1):
+        print(f"  {i}. {email.get('subject', 'No subject')} (from {email.get('from_address')})")
+
+    print(f"\nProcessing up to {args.concurrency} emails at once, parsing in {args.parse_workers} processes...")
+    geocoder = AsyncNominatimClient()
+    with ProcessPoolExecutor(max_workers=args.parse_workers) as parse_pool:
+        pipeline = AsyncEmailPipeline(client, neighborhoods, geocoder, parse_pool, flush_every=args.flush_every)
+        try:
+            outcomes = await pipeline.run(emails, args.concurrency)
+        finally:
+            await pipeline.status_buffer.flush()
+            await geocoder.aclose()
+
+    print_summary(outcomes, pipeline.status_buffer.failed_ids)
+    prescreen.get_stats().print_summary()
+
+def main():
+    asyncio.run(main_async(parse_args(sys.argv[1:])))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# The pipeline modules read these at import; the tests never talk to the real services
+for name in ('SUPABASE_URL', 'SUPABASE_KEY', 'GEMINI_API_KEY', 'VISION_CREDENTIALS_PATH'):
+    os.environ.setdefault(name, 'http://localhost' if name == 'SUPABASE_URL' else 'test')
@@ -0,0 +1,94 @@
+"""In-memory stand-ins for the Supabase client used by the pipeline tests."""
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.filters = []
+        self.update_values = None
+        self.row_limit = None
+
+    def select(self, columns='*'):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column, desc=False):
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def update(self, values):
+        self.update_values = values
+        return self
+
+    def execute(self):
+        with self.db.lock:
+            rows = [row for row in self.db.tables.setdefault(self.table, [])
+                    if all(match(row) for match in self.filters)]
+            if self.update_values is not None:
+                for row in rows:
+                    row.update(self.update_values)
+            if self.row_limit is not None:
+                rows = rows[:self.row_limit]
+            return SimpleNamespace(data=[dict(row) for row in rows])
+
+class FakeSupabase:
+    """
+    Tables are lists of dicts. insert_listing_with_encryption appends to
+    copa_listings_new after `insert_delay` seconds, which widens the window
+    between a duplicate check and the insert.
+    """
+
+    def __init__(self, tables=None, insert_delay=0.0):
+        self.tables = tables or {}
+        self.insert_delay = insert_delay
+        self.lock = threading.Lock()
+        self.rpc_calls = []
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params):
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=self._rpc(name, params)))
+
+    def _rpc(self, name, params):
+        time.sleep(self.insert_delay)
+        return self._insert(name, params)
+
+    def _insert(self, name, params):
+        self.rpc_calls.append(name)
+        with self.lock:
+            listings = self.tables.setdefault('copa_listings_new', [])
+            row = dict(params['listing_data'], id=len(listings) + 1)
+            listings.append(row)
+            return row['id']
+
+class FakeAsyncQuery(FakeQuery):
+    async def execute(self):
+        return FakeQuery.execute(self)
+
+class FakeAsyncSupabase(FakeSupabase):
+    """FakeSupabase with awaitable execute(), like the client from acreate_client."""
+
+    def table(self, name):
+        return FakeAsyncQuery(self, name)
+
+    def rpc(self, name, params):
+        async def execute():
+            await asyncio.sleep(self.insert_delay)
+            return SimpleNamespace(data=self._insert(name, params))
+        return SimpleNamespace(execute=execute)
@@ -0,0 +1,60 @@
+from benchmarks.benchmark_acroform import FORM_FIELDS, FORM_TEXT, make_fillable_pdf
+from process_emails import PdfFormAnalyzer, parse_copa_form_local
+
+OFFERING_MEMO_TEXT = (
+    "OFFERING MEMORANDUM 1125 Webster Street Exclusively listed by Example Realty. "
+    "Investment highlights: six units, strong rents, value-add upside. Offered at $1,295,000."
+)
+
+OFFERING_MEMO_FIELDS = [
+    ('Property_Address', '1125 Webster Street, San Francisco, CA 94115'),
+    ('Asking_price', '$1,295,000'),
+    ('Total_#_of_units', '6'),
+    ('#_of_residential_units', '6'),
+    ('#_of_commercial_(office/retail)_units', '0'),
+    ('Annual_expenses', '40,000.00'),
+]
+
+def field(name):
+    return next(value for key, value in FORM_FIELDS if key.endswith(f'.{name}[0]'))
+
+def test_fillable_copa3_matches_flattened_form():
+    fillable, form_type, _ = parse_copa_form_local(make_fillable_pdf(FORM_TEXT, FORM_FIELDS))
+    flattened, _, _ = parse_copa_form_local(make_fillable_pdf(FORM_TEXT, []))
+    assert form_type == 'copa3'
+    assert fillable == flattened
+
+def test_fillable_offering_memo_is_not_a_copa3_form():
+    form_data, form_type, _ = parse_copa_form_local(make_fillable_pdf(OFFERING_MEMO_TEXT, OFFERING_MEMO_FIELDS))
+    assert form_type is None
+    assert form_data == {}
+
+def test_complete_form_is_read_without_page_text(monkeypatch):
+    extracted = []
+    monkeypatch.setattr(PdfFormAnalyzer, 'page_text', lambda self, page_num: extracted.append(page_num))
+    form_data, form_type, page_texts = parse_copa_form_local(make_fillable_pdf(FORM_TEXT, FORM_FIELDS))
+    assert form_type == 'copa3'
+    assert form_data['asking_price'] == 1295000.0
+    assert extracted == [] and page_texts == {}
+
+def test_page_text_fills_values_a_partly_filled_form_leaves_out():
+    left_out = ('Asking_price', 'Insurance', 'Soft_Story')
+    fields = [(name, value) for name, value in FORM_FIELDS if not any(part in name for part in left_out)]
+    form_data, form_type, _ = parse_copa_form_local(make_fillable_pdf(FORM_TEXT, fields))
+    assert form_type == 'copa3'
+    assert form_data['asking_price'] == 1295000.0
+    assert form_data['details']['insurance'] == 2400.0
+    assert form_data['details']['soft_story_required'] is True
+
+def test_field_values_win_over_blank_printed_labels():
+    labels_only = FORM_TEXT.replace('$1,295,000', '').replace('The Edwin M. Campbell Trust', '')
+    form_data, form_type, _ = parse_copa_form_local(make_fillable_pdf(labels_only, FORM_FIELDS))
+    assert form_type == 'copa3'
+    assert form_data['asking_price'] == 1295000.0
+    assert form_data['details']['seller_name'] == field('Seller')
+
+def test_field_set_naming_the_form_is_enough_without_page_markers():
+    fields = OFFERING_MEMO_FIELDS + [('Form_Title', 'COPA3 Notice of Intent to Sell')]
+    form_data, form_type, _ = parse_copa_form_local(make_fillable_pdf("Scanned page", fields))
+    assert form_type == 'copa3'
+    assert form_data['address']['zip_code'] == '94115'
@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+import process_emails_async
+from fakes import FakeAsyncSupabase
+
+ADDRESS = {'full_address': '1125 Webster Street, San Francisco, CA 94115'}
+
+def make_pipeline(client, cache=None):
+    return process_emails_async.AsyncEmailPipeline(client, None, geocoder=None, parse_pool=None, cache=cache or RecordingCache())
+
+class RecordingCache:
+    """Attachment cache that records which thread each call runs on."""
+
+    def __init__(self, cached=None):
+        self.cached = cached
+        self.threads = []
+
+    def get_by_path(self, storage_path):
+        self.threads.append(threading.current_thread())
+        return None, None
+
+    def get(self, content_hash):
+        self.threads.append(threading.current_thread())
+        return self.cached
+
+    def link_path(self, storage_path, content_hash):
+        self.threads.append(threading.current_thread())
+
+def test_concurrent_copies_of_one_form_create_one_listing():
+    client = FakeAsyncSupabase(insert_delay=0.05)
+    pipeline = make_pipeline(client)
+
+    async def find_copa_form(attachments):
+        return {'address': dict(ADDRESS), 'details': {}}
+
+    async def locate(address_obj):
+        return None, None
+
+    pipeline.find_copa_form = find_copa_form
+    pipeline.locate = locate
+    emails = [{'id': i, 'subject': 'COPA 1125 Webster', 'received_date': '2026-10-01T00:00:00'} for i in range(6)]
+
+    async def run():
+        return await asyncio.gather(*(pipeline.process_email(email) for email in emails))
+
+    outcomes = asyncio.run(run())
+    assert len(client.tables['copa_listings_new']) == 1
+    assert sorted(outcome['status'] for outcome in outcomes) == ['created'] + ['linked'] * 5
+
+def test_attachment_cache_runs_off_the_event_loop():
+    cache = RecordingCache(cached={'form_data': {'address': ADDRESS}, 'form_type': 'copa3'})
+    pipeline = make_pipeline(FakeAsyncSupabase(), cache)
+
+    async def download_attachment(storage_path):
+        return b'%PDF-1.4 test'
+
+    pipeline.download_attachment = download_attachment
+    loop_thread = []
+
+    async def run():
+        loop_thread.append(threading.current_thread())
+        return await pipeline.analyze_attachment('1/form.pdf')
+
+    assert asyncio.run(run()) == ({'address': ADDRESS}, 'copa3')
+    assert len(cache.threads) == 3
+    assert loop_thread[0] not in cache.threads
@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+import process_emails
+from fakes import FakeSupabase
+
+class FakeQuery:
+    """Stands in for a PostgREST request builder; execute() returns `rows` or raises `error`."""
+
+    def __init__(self, rows=(), error=None):
+        self.rows = list(rows)
+        self.error = error
+        self.filters = []
+
+    def __getattr__(self, name):
+        def chain(*args, **kwargs):
+            self.filters.append((name, args))
+            return self
+        return chain
+
+    def execute(self):
+        if self.error:
+            raise self.error
+        return SimpleNamespace(data=self.rows)
+
+class UndefinedColumn(Exception):
+    code = '42703'
+
+def use_query(monkeypatch, query):
+    monkeypatch.setattr(process_emails, 'supabase', SimpleNamespace(table=lambda name: query))
+
+ADDRESS = {'full_address': '1125 Webster Street, San Francisco, CA 94115'}
+
+def test_duplicate_found_by_normalized_address(monkeypatch):
+    query = FakeQuery(rows=[{'id': 7, 'address': ADDRESS}])
+    use_query(monkeypatch, query)
+    assert process_emails.check_duplicate_listing(ADDRESS) == 7
+    assert ('eq', ('normalized_address', process_emails.normalize_address(ADDRESS['full_address']))) in query.filters
+
+def test_no_duplicate(monkeypatch):
+    use_query(monkeypatch, FakeQuery())
+    assert process_emails.check_duplicate_listing(ADDRESS) is None
+
+def test_missing_column_fails_loudly(monkeypatch):
+    use_query(monkeypatch, FakeQuery(error=UndefinedColumn('column copa_listings_new.normalized_address does not exist')))
+    with pytest.raises(RuntimeError, match='001_copa_listings_normalized_address.sql'):
+        process_emails.check_duplicate_listing(ADDRESS)
+
+def test_lookup_error_is_not_treated_as_no_duplicate(monkeypatch):
+    use_query(monkeypatch, FakeQuery(error=ConnectionError('timed out')))
+    with pytest.raises(RuntimeError):
+        process_emails.check_duplicate_listing(ADDRESS)
+
+def test_concurrent_copies_of_one_form_create_one_listing(monkeypatch):
+    db = FakeSupabase(insert_delay=0.05)
+    monkeypatch.setattr(process_emails, 'supabase', db)
+    monkeypatch.setattr(process_emails, 'find_copa_form', lambda attachments: {'address': dict(ADDRESS), 'details': {}})
+    monkeypatch.setattr(process_emails, 'get_location_from_address', lambda address: None)
+    emails = [{'id': i, 'subject': 'COPA 1125 Webster', 'received_date': '2026-10-01T00:00:00'} for i in range(6)]
+    status_buffer = process_emails.EmailStatusBuffer()
+
+    with ThreadPoolExecutor(max_workers=len(emails)) as pool:
+        outcomes = list(pool.map(lambda email: process_emails.process_email(email, None, status_buffer), emails))
+
+    assert len(db.tables['copa_listings_new']) == 1
+    assert sorted(outcome['status'] for outcome in outcomes) == ['created'] + ['linked'] * 5
+    assert {outcome['listing_id'] for outcome in outcomes} == {1}
+
+def test_flagged_listing_link_is_written_immediately(monkeypatch):
+    db = FakeSupabase({'emails': [{'id': 1, 'processed': False}]})
+    monkeypatch.setattr(process_emails, 'supabase', db)
+    monkeypatch.setattr(process_emails, 'find_copa_form', lambda attachments: {})
+    email = {'id': 1, 'subject': 'Price reduced', 'received_date': '2026-10-01T00:00:00'}
+
+    outcome = process_emails.process_email(email, None, process_emails.EmailStatusBuffer(flush_every=25))
+
+    assert outcome['status'] == 'flagged'
+    assert db.tables['emails'][0]['processed'] is True
+    assert db.tables['emails'][0]['listing_id'] == outcome['listing_id']
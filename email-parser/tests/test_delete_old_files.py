@@ -0,0 +1,99 @@
+import json
+from types import SimpleNamespace
+
+import delete_old_files
+from fakes import FakeSupabase
+
+PAGES = [[1, 2], [3, 4]]
+FILES = {email_id: [f"{email_id}/a.pdf", f"{email_id}/b.pdf"] for page in PAGES for email_id in page}
+
+class FakeBucket:
+    def __init__(self, fail_paths=()):
+        self.stored = {path for paths in FILES.values() for path in paths}
+        self.fail_paths = set(fail_paths)
+
+    def remove(self, paths):
+        if self.fail_paths & set(paths):
+            raise RuntimeError('storage unavailable')
+        removed = [path for path in paths if path in self.stored]
+        self.stored -= set(removed)
+        return [{'name': path, 'metadata': {'size': 10}} for path in removed]
+
+class FakeClient:
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.rpc_calls = []
+        self.storage = SimpleNamespace(from_=lambda name: bucket)
+
+    def rpc(self, name, params=None):
+        self.rpc_calls.append((name, params))
+        return SimpleNamespace(execute=lambda: None)
+
+def fake_pages(cutoff, last_id=None, limit=None):
+    for page in PAGES:
+        if last_id is None or page[0] > last_id:
+            yield page
+
+def run(monkeypatch, bucket, state_path):
+    client = FakeClient(bucket)
+    monkeypatch.setattr(delete_old_files, 'supabase', client)
+    monkeypatch.setattr(delete_old_files, 'expired_email_ids', fake_pages)
+    monkeypatch.setattr(delete_old_files, 'attachment_paths',
+                        lambda ids: [path for email_id in ids for path in FILES[email_id]])
+    monkeypatch.setattr(delete_old_files, 'REMOVE_BATCH_SIZE', 1)
+    return delete_old_files.delete_old_files(state_path=state_path), client
+
+def test_failed_page_is_counted_once_when_retried(tmp_path, monkeypatch):
+    state_path = str(tmp_path / 'retention_state.json')
+    bucket = FakeBucket(fail_paths={'4/b.pdf'})
+
+    finished, client = run(monkeypatch, bucket, state_path)
+    assert not finished
+    assert not client.rpc_calls
+    with open(state_path) as f:
+        state = json.load(f)
+    # Page two removed three of its files before the failure; none of them are in the state yet
+    assert (state['last_email_id'], state['emails'], state['files'], state['bytes']) == (2, 2, 4, 40)
+
+    bucket.fail_paths = set()
+    finished, client = run(monkeypatch, bucket, state_path)
+    assert finished
+    assert not bucket.stored
+    # The retry only finds the one file left on page two
+    assert client.rpc_calls == [('delete_old_emails', {'cutoff': state['cutoff']})]
+
+class ListingBucket:
+    """Bucket that lists folders by offset, in name order, like Supabase storage."""
+
+    def __init__(self, paths):
+        self.stored = set(paths)
+
+    def list(self, folder, options):
+        prefix = f"{folder}/" if folder else ''
+        children = {}
+        for path in self.stored:
+            if path.startswith(prefix):
+                name, _, rest = path[len(prefix):].partition('/')
+                children[name] = None if rest else 'file'
+        names = sorted(children)[options['offset']:options['offset'] + options['limit']]
+        return [{'name': name, 'id': children[name], 'created_at': '2020-01-01T00:00:00Z',
+                 'metadata': {'size': 10}} for name in names]
+
+    def remove(self, paths):
+        removed = [path for path in paths if path in self.stored]
+        self.stored -= set(removed)
+        return [{'name': path, 'metadata': {'size': 10}} for path in removed]
+
+def test_reconcile_removes_every_orphan_across_list_pages(monkeypatch):
+    orphans = [f"old/{n}.pdf" for n in range(7)] + [f"old/nested/{n}.pdf" for n in range(3)]
+    kept = ['new/a.pdf', 'old/kept.pdf']
+    bucket = ListingBucket(orphans + kept)
+    client = FakeSupabase({'email_attachments': [{'storage_path': path} for path in kept]})
+    client.storage = SimpleNamespace(from_=lambda name: bucket)
+    monkeypatch.setattr(delete_old_files, 'supabase', client)
+    monkeypatch.setattr(delete_old_files, 'LIST_PAGE_SIZE', 2)
+    # Each orphan is deleted as soon as it is found, while its folder is still being paged
+    monkeypatch.setattr(delete_old_files, 'REMOVE_BATCH_SIZE', 1)
+
+    assert delete_old_files.reconcile_orphans() == len(orphans)
+    assert bucket.stored == set(kept)
@@ -0,0 +1,76 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import generate_json
+from benchmarks.benchmark_acroform import FORM_TEXT, make_fillable_pdf
+
+STREETS = ['1125 Webster Street', '500 Pine Street']
+
+class FlakyGeocoder:
+    """get_location_from_address stand-in that raises or misses for the streets in `failing` until they're cleared."""
+
+    def __init__(self, failing):
+        self.failing = dict(failing)
+        self.calls = []
+
+    def __call__(self, address):
+        street = address['street_address']
+        self.calls.append(street)
+        failure = self.failing.get(street)
+        if failure == 'raise':
+            raise ConnectionError('Nominatim unavailable')
+        if failure == 'miss':
+            return {}
+        return {'lat': 37.78, 'lng': -122.43}
+
+@pytest.fixture
+def folder(tmp_path):
+    data = tmp_path / 'data'
+    data.mkdir()
+    for i, street in enumerate(STREETS):
+        (data / f"form{i}.pdf").write_bytes(make_fillable_pdf(FORM_TEXT.replace(STREETS[0], street), []))
+    return data
+
+def run(folder, monkeypatch, geocoder, neighborhoods=('Western Addition',)):
+    monkeypatch.setattr(generate_json, 'get_location_from_address', geocoder)
+    monkeypatch.setattr(generate_json, 'load_sf_neighborhoods', lambda: list(neighborhoods))
+    monkeypatch.setattr(generate_json, 'get_neighborhood_from_location',
+                        lambda lat, lng, loaded: loaded[0] if loaded else 'Unknown neighborhood')
+    output = folder.parent / 'property-data.json'
+    generate_json.process_all_forms(str(folder), str(output), workers=1)
+    with open(output) as f:
+        return {listing['details']['address_breakdown']['street_address']: listing
+                for listing in json.load(f)['listings']}
+
+def test_failed_lookups_are_written_and_retried_next_run(folder, monkeypatch):
+    geocoder = FlakyGeocoder({STREETS[0]: 'raise', STREETS[1]: 'miss'})
+    listings = run(folder, monkeypatch, geocoder)
+
+    # One geocode error doesn't stop the run; both listings are written without a location
+    assert sorted(listings) == sorted(STREETS)
+    assert all(listing['neighborhood'] == 'Unknown' and not listing.get('location') for listing in listings.values())
+
+    geocoder = FlakyGeocoder({})
+    listings = run(folder, monkeypatch, geocoder)
+    assert sorted(geocoder.calls) == sorted(STREETS)
+    assert all(listing['neighborhood'] == 'Western Addition' for listing in listings.values())
+    assert all('_address' not in listing for listing in listings.values())
+
+    # Located listings are final
+    geocoder = FlakyGeocoder({})
+    assert run(folder, monkeypatch, geocoder) == listings
+    assert geocoder.calls == []
+
+def test_missing_neighborhood_data_is_retried(folder, monkeypatch):
+    listings = run(folder, monkeypatch, FlakyGeocoder({}), neighborhoods=())
+    assert all(listing['neighborhood'] == 'Unknown neighborhood' for listing in listings.values())
+
+    geocoder = FlakyGeocoder({})
+    listings = run(folder, monkeypatch, geocoder)
+    assert sorted(geocoder.calls) == sorted(STREETS)
+    assert all(listing['neighborhood'] == 'Western Addition' for listing in listings.values())
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import geocoding
+from geocoding import AsyncNominatimClient, GeocodeCache, NominatimClient, TokenBucket
+
+FOUND = '1125 Webster Street, San Francisco, CA, 94115'
+NOT_FOUND = '1 Nowhere Lane, San Francisco, CA'
+DOWN = '500 Failing Street, San Francisco, CA'
+RATE = 20.0
+
+class StubNominatim:
+    """Local HTTP stand-in for Nominatim search that records when each query arrived."""
+
+    def __init__(self):
+        self.requests = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)['q'][0]
+                with stub._lock:
+                    stub.requests.append((query, time.monotonic()))
+                if query == DOWN:
+                    status, reply = 503, {'error': 'unavailable'}
+                elif query == NOT_FOUND:
+                    status, reply = 200, []
+                else:
+                    status, reply = 200, [{'lat': '37.7813', 'lon': '-122.4316'}]
+                data = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/search"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def queries(self):
+        return [query for query, _ in self.requests]
+
+    def span(self):
+        """Seconds from the first request to the last; single gaps jitter with thread scheduling."""
+        times = [arrived for _, arrived in self.requests]
+        return max(times) - min(times)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def stub():
+    server = StubNominatim()
+    yield server
+    server.close()
+
+def test_client_caches_hits_and_misses_but_not_failures(stub):
+    client = NominatimClient(stub.url, cache=GeocodeCache(':memory:'), limiter=TokenBucket(rate=RATE))
+
+    for _ in range(2):
+        assert client.geocode(FOUND) == {'lat': 37.7813, 'lng': -122.4316}
+        assert client.geocode(NOT_FOUND) is None
+        assert client.geocode(DOWN) is None
+
+    # Only the transient failure is asked again
+    assert stub.queries() == [FOUND, NOT_FOUND, DOWN, DOWN]
+
+def test_cache_persists_across_clients(stub, tmp_path):
+    path = str(tmp_path / 'geocode.sqlite3')
+    NominatimClient(stub.url, cache=GeocodeCache(path), limiter=TokenBucket(rate=RATE)).geocode(FOUND)
+    result = NominatimClient(stub.url, cache=GeocodeCache(path), limiter=TokenBucket(rate=RATE)).geocode(FOUND)
+    assert result == {'lat': 37.7813, 'lng': -122.4316}
+    assert stub.queries() == [FOUND]
+
+def test_cache_expires_hits_and_misses_separately(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(geocoding.time, 'time', lambda: now[0])
+    cache = GeocodeCache(':memory:', ttl=100, negative_ttl=10)
+    cache.set('found', {'lat': 1.0, 'lng': 2.0})
+    cache.set('missing', None)
+
+    now[0] += 10
+    assert cache.get('found') == (True, {'lat': 1.0, 'lng': 2.0})
+    assert cache.get('missing') == (True, None)
+
+    now[0] += 1
+    assert cache.get('found') == (True, {'lat': 1.0, 'lng': 2.0})
+    assert cache.get('missing') == (False, None)
+
+    now[0] += 90
+    assert cache.get('found') == (False, None)
+    assert cache.get('unknown') == (False, None)
+
+def test_token_bucket_paces_threads():
+    bucket = TokenBucket(rate=RATE, capacity=1)
+    taken = []
+    lock = threading.Lock()
+
+    def take():
+        bucket.acquire()
+        with lock:
+            taken.append(time.monotonic())
+
+    threads = [threading.Thread(target=take) for _ in range(6)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The first token is there already; the other five wait one interval each
+    assert time.monotonic() - start >= 5 / RATE * 0.95
+    assert max(taken) - min(taken) >= 5 / RATE * 0.9
+
+def test_threaded_lookups_reach_the_server_within_the_rate(stub):
+    client = NominatimClient(stub.url, cache=GeocodeCache(':memory:'), limiter=TokenBucket(rate=RATE))
+    addresses = [f"{number} Webster Street, San Francisco, CA" for number in range(1, 7)]
+    threads = [threading.Thread(target=client.geocode, args=(address,)) for address in addresses]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(stub.queries()) == sorted(addresses)
+    assert stub.span() >= (len(addresses) - 1) / RATE * 0.9
+
+def test_async_client_paces_and_caches(stub):
+    async def run():
+        client = AsyncNominatimClient(stub.url, cache=GeocodeCache(':memory:'), limiter=TokenBucket(rate=RATE))
+        try:
+            addresses = [f"{number} Webster Street, San Francisco, CA" for number in range(1, 6)]
+            first = await asyncio.gather(*(client.geocode(address) for address in addresses))
+            second = await asyncio.gather(*(client.geocode(address) for address in addresses))
+            missing = await client.geocode(NOT_FOUND)
+            failed = await client.geocode(DOWN)
+        finally:
+            await client.aclose()
+        return addresses, first, second, missing, failed
+
+    addresses, first, second, missing, failed = asyncio.run(run())
+
+    assert first == second == [{'lat': 37.7813, 'lng': -122.4316}] * len(addresses)
+    assert missing is None and failed is None
+    # The second round came from the cache
+    assert sorted(stub.queries()) == sorted(addresses + [NOT_FOUND, DOWN])
+    assert stub.span() >= (len(addresses) + 1) / RATE * 0.9
+
+def test_async_lookup_tries_the_corner_address(stub):
+    async def run():
+        client = AsyncNominatimClient(stub.url, cache=GeocodeCache(':memory:'), limiter=TokenBucket(rate=RATE))
+        try:
+            return await geocoding.get_location_from_address_async(
+                {'street_address': '1 Nowhere Lane', 'secondary_address': '1125 Webster Street'}, client)
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == {'lat': 37.7813, 'lng': -122.4316}
+    assert stub.queries() == [NOT_FOUND, '1125 Webster Street, San Francisco, CA']
+
+class ThreadRecordingCache(GeocodeCache):
+    """GeocodeCache that records which thread each get and set ran on."""
+
+    def __init__(self):
+        super().__init__(':memory:')
+        self.threads = []
+
+    def get(self, key):
+        self.threads.append(threading.get_ident())
+        return super().get(key)
+
+    def set(self, key, result):
+        self.threads.append(threading.get_ident())
+        super().set(key, result)
+
+def test_async_client_keeps_cache_calls_off_the_event_loop(stub):
+    cache = ThreadRecordingCache()
+
+    async def run():
+        client = AsyncNominatimClient(stub.url, cache=cache, limiter=TokenBucket(rate=RATE))
+        try:
+            await client.geocode(FOUND)
+            await client.geocode(FOUND)
+        finally:
+            await client.aclose()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    # get, set, then the cached get
+    assert len(cache.threads) == 3
+    assert loop_thread not in cache.threads
@@ -0,0 +1,17 @@
+import json
+
+import pytest
+
+from benchmarks.benchmark_extraction import GOLDEN_DIR, extract_all
+
+# The expected outputs were written by the extractor before its patterns were precompiled
+GOLDEN = sorted(path.stem for path in GOLDEN_DIR.glob('*.txt'))
+
+def test_corpus_is_present():
+    assert 'copa3_standard' in GOLDEN and 'copa4_standard' in GOLDEN
+
+@pytest.mark.parametrize('name', GOLDEN)
+def test_extraction_matches_golden_output(name):
+    result = extract_all((GOLDEN_DIR / f'{name}.txt').read_text())
+    # Round-trip through JSON so the comparison matches what's stored on disk
+    assert json.loads(json.dumps(result)) == json.loads((GOLDEN_DIR / f'{name}.json').read_text())
@@ -0,0 +1,114 @@
+import os
+
+import pytest
+
+import import_historical_emails
+from benchmarks.benchmark_historical_import import EMAILS_PER_PAGE, StubImportFunction
+from fakes import FakeSupabase
+from import_historical_emails import AdaptivePacer, PipelineFeeder, run_import
+from process_emails import OUTCOME_CREATED
+
+PAGES = 8
+
+class RecordingPacer(AdaptivePacer):
+    """AdaptivePacer that records the delays it would wait instead of sleeping."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.waits = []
+
+    def wait(self):
+        self.waits.append(self.delay)
+
+@pytest.fixture
+def state_path(tmp_path):
+    return str(tmp_path / 'import_state.json')
+
+def test_interrupted_import_resumes_from_the_saved_page(state_path, monkeypatch):
+    monkeypatch.setattr(import_historical_emails, 'MAX_CONSECUTIVE_ERRORS', 3)
+    stub = StubImportFunction(PAGES, 0, fail_after=PAGES // 2)
+    try:
+        first = run_import(stub.url, 'test', state_path, RecordingPacer(delay=0, step=0.01, max_delay=0.05))
+        assert not first['complete']
+        assert os.path.exists(state_path)
+
+        stub.fail_after = None
+        second = run_import(stub.url, 'test', state_path, RecordingPacer(delay=0, step=0.01, max_delay=0.05))
+    finally:
+        stub.close()
+
+    assert second['complete']
+    assert stub.served == list(range(PAGES))
+    assert second['imported'] == PAGES * EMAILS_PER_PAGE
+    assert not os.path.exists(state_path)
+
+def test_restart_ignores_the_saved_page(state_path, monkeypatch):
+    monkeypatch.setattr(import_historical_emails, 'MAX_CONSECUTIVE_ERRORS', 1)
+    stub = StubImportFunction(PAGES, 0, fail_after=2)
+    try:
+        run_import(stub.url, 'test', state_path, RecordingPacer(delay=0))
+        stub.fail_after = None
+        totals = run_import(stub.url, 'test', state_path, RecordingPacer(delay=0), restart=True)
+    finally:
+        stub.close()
+
+    assert stub.served == [0, 1] + list(range(PAGES))
+    assert totals['imported'] == PAGES * EMAILS_PER_PAGE
+
+def test_errors_back_off_and_healthy_pages_speed_up(state_path):
+    stub = StubImportFunction(PAGES, 0, error_every=3)
+    pacer = RecordingPacer(delay=1.0, step=0.25, max_delay=8.0)
+    try:
+        totals = run_import(stub.url, 'test', state_path, pacer)
+    finally:
+        stub.close()
+
+    assert totals['complete']
+    assert sorted(set(stub.served)) == list(range(PAGES))
+    # Calls 1 and 2 succeed, call 3 fails and doubles the delay, calls 4 and 5 succeed...
+    assert pacer.waits[:5] == [0.75, 0.5, 1.0, 0.75, 0.5]
+
+def test_pacer_limits():
+    pacer = AdaptivePacer(delay=4.0, min_delay=1.0, max_delay=10.0, step=2.0, slow_seconds=5.0)
+    pacer.record(0.1)
+    pacer.record(0.1)
+    assert pacer.delay == 1.0
+
+    pacer.record(6.0)
+    assert pacer.delay == 2.0
+    pacer.record(0.1, ok=False)
+    pacer.record(0.1, ok=False)
+    pacer.record(0.1, ok=False)
+    assert pacer.delay == 10.0
+
+    pacer = AdaptivePacer(delay=0, step=1.0, max_delay=60.0)
+    pacer.record(0.1, ok=False, retry_after=30)
+    assert pacer.delay == 30
+
+def test_feeder_carries_on_after_a_failing_batch(monkeypatch):
+    client = FakeSupabase({'emails': [{'id': n, 'processed': False} for n in range(1, 8)]})
+    monkeypatch.setattr(import_historical_emails, 'supabase', client)
+    monkeypatch.setattr(import_historical_emails, 'load_sf_neighborhoods', lambda: [])
+    batches = []
+
+    def run_emails_concurrently(emails, neighborhoods, workers, status_buffer):
+        batches.append([email['id'] for email in emails])
+        if len(batches) == 1:
+            raise RuntimeError('storage unavailable')
+        for email in emails:
+            client.table('emails').update({'processed': True}).eq('id', email['id']).execute()
+        return [{'status': OUTCOME_CREATED, 'listing_id': email['id']} for email in emails]
+
+    monkeypatch.setattr(import_historical_emails, 'run_emails_concurrently', run_emails_concurrently)
+
+    feeder = PipelineFeeder(batch_size=3)
+    feeder.start()
+    feeder.notify()
+    feeder.finish()
+    feeder.join(timeout=5)
+
+    assert not feeder.is_alive()
+    assert batches == [[1, 2, 3], [4, 5, 6], [7]]
+    assert feeder.errors == [([1, 2, 3], 'RuntimeError: storage unavailable')]
+    assert len(feeder.outcomes) == 4
+    assert [row['id'] for row in client.tables['emails'] if not row['processed']] == [1, 2, 3]
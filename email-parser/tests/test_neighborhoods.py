@@ -0,0 +1,42 @@
+import json
+
+import pytest
+from shapely.geometry import box
+
+import neighborhoods
+
+def test_missing_snapshot_fails_without_fetching(monkeypatch, tmp_path):
+    missing = str(tmp_path / 'missing.geojson')
+    real_load_snapshot = neighborhoods.load_snapshot
+    monkeypatch.setattr(neighborhoods, 'load_snapshot', lambda: real_load_snapshot(missing))
+    monkeypatch.setattr(neighborhoods, '_NEIGHBORHOODS_CACHE', None)
+
+    def fetch():
+        raise AssertionError("DataSF must not be contacted at startup")
+
+    monkeypatch.setattr(neighborhoods, 'fetch_sf_neighborhoods', fetch)
+    with pytest.raises(neighborhoods.SnapshotMissingError, match='neighborhoods.py refresh'):
+        neighborhoods.load_sf_neighborhoods()
+    assert neighborhoods._NEIGHBORHOODS_CACHE is None
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / 'sf_neighborhoods.geojson')
+    neighborhoods.save_snapshot([
+        {'name': 'Western Addition', 'geometry': box(-122.44, 37.77, -122.42, 37.79)},
+        {'name': 'Mission', 'geometry': box(-122.43, 37.75, -122.40, 37.77)},
+    ], path)
+    loaded, fetched_at = neighborhoods.load_snapshot(path)
+    assert [n['name'] for n in loaded] == ['Western Addition', 'Mission']
+    assert not neighborhoods.snapshot_is_stale(fetched_at)
+    assert neighborhoods.NeighborhoodIndex(loaded).lookup(37.78, -122.43) == 'Western Addition'
+
+    # Plain GeoJSON, one neighborhood per line
+    with open(path) as f:
+        text = f.read()
+    assert json.loads(text)['type'] == 'FeatureCollection'
+    assert sum('"Feature"' in line for line in text.splitlines()) == 2
+
+def test_old_snapshot_version_is_ignored(tmp_path):
+    path = tmp_path / 'sf_neighborhoods.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'version': 1, 'features': []}))
+    assert neighborhoods.load_snapshot(str(path)) == (None, None)
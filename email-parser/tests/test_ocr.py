@@ -0,0 +1,97 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from extract_text import ocr_png_batch, ocr_png_stream
+
+def page(number):
+    return f"page-{number}".encode()
+
+def text_response(text):
+    return SimpleNamespace(error=SimpleNamespace(message=''),
+                           text_annotations=[SimpleNamespace(description=text)])
+
+class StubVisionClient:
+    """
+    Vision client that echoes each page's bytes back as its text. Records every
+    call, fails the batch calls containing a page in fail_pages, and holds each
+    batch until `gate` is set.
+    """
+
+    def __init__(self, fail_pages=(), gate=None):
+        self.fail_pages = set(fail_pages)
+        self.gate = gate
+        self.batches = []
+        self.single_pages = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def batch_annotate_images(self, requests):
+        contents = [request.image.content for request in requests]
+        with self._lock:
+            self.batches.append(contents)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.gate:
+                self.gate.wait()
+            # Later pages finish first, so results arrive out of order
+            time.sleep(0.02 / int(contents[0].split(b'-')[1]))
+            if self.fail_pages & set(contents):
+                raise RuntimeError('request payload too large')
+            return SimpleNamespace(responses=[text_response(content.decode()) for content in contents])
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def text_detection(self, image):
+        with self._lock:
+            self.single_pages.append(image.content)
+        return text_response(image.content.decode())
+
+def test_stream_keeps_page_order_and_falls_back_for_a_failed_batch():
+    client = StubVisionClient(fail_pages={page(6)})
+    texts = ocr_png_stream((page(n) for n in range(1, 12)), client=client, concurrency=3, batch_size=3)
+
+    assert texts == [f"page-{n}" for n in range(1, 12)]
+    assert sorted(client.batches) == sorted([[page(1), page(2), page(3)], [page(4), page(5), page(6)],
+                                             [page(7), page(8), page(9)], [page(10), page(11)]])
+    # Only the failed batch is retried, one page per request
+    assert client.single_pages == [page(4), page(5), page(6)]
+    assert client.max_in_flight <= 3
+
+def test_stream_reads_one_batch_ahead_of_the_free_slots():
+    gate = threading.Event()
+    client = StubVisionClient(gate=gate)
+    pulled = []
+
+    def pages():
+        for n in range(1, 41):
+            pulled.append(n)
+            yield page(n)
+
+    result = []
+    worker = threading.Thread(target=lambda: result.extend(
+        ocr_png_stream(pages(), client=client, concurrency=2, batch_size=4)))
+    worker.start()
+    time.sleep(0.2)
+    # Two batches in flight plus the one waiting for a slot
+    assert len(pulled) == 12
+    assert len(client.batches) == 2
+
+    gate.set()
+    worker.join()
+    assert result == [f"page-{n}" for n in range(1, 41)]
+    assert client.max_in_flight <= 2
+
+def test_batch_reports_page_errors_without_failing_the_batch():
+    class PartlyFailingClient(StubVisionClient):
+        def batch_annotate_images(self, requests):
+            response = super().batch_annotate_images(requests)
+            response.responses[1] = SimpleNamespace(error=SimpleNamespace(message='bad image'), text_annotations=[])
+            return response
+
+    client = PartlyFailingClient()
+    assert ocr_png_batch([page(1), page(2), page(3)], client) == ['page-1', '', 'page-3']
+    assert client.single_pages == []
@@ -0,0 +1,101 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+import parse_with_ai
+from parse_with_ai import GeminiClient, ResponseCache, parse_emails_batch
+
+class FakeModel:
+    """Stand-in for the Gemini model: replies with a listing for the address in the email body."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents):
+        with self._lock:
+            self.calls.append(contents)
+            if self.errors:
+                raise self.errors.pop(0)
+        body = contents.split('EMAIL BODY:\n', 1)[1].split('\n', 1)[0]
+        return SimpleNamespace(text=json.dumps({
+            'classification': 'listing',
+            'confidence': 'high',
+            'address': {'full_address': body, 'street_address': body.split(',')[0],
+                        'secondary_address': None, 'zip_code': None},
+        }))
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    delays = []
+    monkeypatch.setattr(parse_with_ai.time, 'sleep', delays.append)
+    return delays
+
+def make_client(model, **kwargs):
+    return GeminiClient(model=model, cache=ResponseCache(':memory:'), **kwargs)
+
+def test_cache_hit_skips_the_model():
+    model = FakeModel()
+    client = make_client(model)
+
+    first, cached_first = client.request('COPA', '1125 Webster Street, San Francisco', [])
+    second, cached_second = client.request('COPA', '1125 Webster Street, San Francisco', [])
+
+    assert (cached_first, cached_second) == (False, True)
+    assert first == second
+    assert first['address']['street_address'] == '1125 Webster Street'
+    assert len(model.calls) == 1
+
+    # Different input is a miss
+    client.request('COPA', '500 Pine Street, San Francisco', [])
+    assert len(model.calls) == 2
+
+def test_transient_errors_are_retried_with_backoff(no_backoff):
+    model = FakeModel(errors=[google_exceptions.TooManyRequests('slow down'),
+                              google_exceptions.ServiceUnavailable('overloaded')])
+    client = make_client(model, max_retries=3)
+
+    parsed, cached = client.request('COPA', '1125 Webster Street, San Francisco', [])
+
+    assert not cached
+    assert parsed['classification'] == 'listing'
+    assert len(model.calls) == 3
+    assert len(no_backoff) == 2
+    assert 0 < no_backoff[0] < no_backoff[1]
+
+def test_retries_give_up_and_other_errors_are_not_retried():
+    model = FakeModel(errors=[google_exceptions.InternalServerError('boom')] * 3)
+    with pytest.raises(google_exceptions.InternalServerError):
+        make_client(model, max_retries=2).request('COPA', '1125 Webster Street', [])
+    assert len(model.calls) == 3
+
+    model = FakeModel(errors=[google_exceptions.InvalidArgument('bad request')])
+    with pytest.raises(google_exceptions.InvalidArgument):
+        make_client(model, max_retries=2).request('COPA', '1125 Webster Street', [])
+    assert len(model.calls) == 1
+
+def test_resumed_batch_skips_checkpointed_emails(tmp_path):
+    checkpoint_path = str(tmp_path / 'parsed.jsonl')
+    emails = [{'id': n, 'subject': 'COPA', 'body': f"{n} Webster Street, San Francisco"} for n in range(1, 7)]
+    with open(checkpoint_path, 'w') as f:
+        f.write(json.dumps({'id': 1, 'status': 'ok', 'result': {'from': 'checkpoint'}, 'error': None}) + '\n')
+        f.write(json.dumps({'id': 2, 'status': 'failed', 'result': None, 'error': 'ServerError'}) + '\n')
+        # Cut short when the last run was interrupted
+        f.write('{"id": 3, "status": "o')
+
+    model = FakeModel()
+    results = parse_emails_batch(emails, checkpoint_path, concurrency=2, client=make_client(model))
+
+    parsed_bodies = sorted(call.split('EMAIL BODY:\n', 1)[1].split(' ', 1)[0] for call in model.calls)
+    assert parsed_bodies == ['2', '3', '4', '5', '6']
+    assert results['1'] == {'from': 'checkpoint'}
+    assert sorted(results) == ['1', '2', '3', '4', '5', '6']
+
+    # A second resume has nothing left to do
+    model = FakeModel()
+    parse_emails_batch(emails, checkpoint_path, concurrency=2, client=make_client(model))
+    assert model.calls == []
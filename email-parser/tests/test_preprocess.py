@@ -0,0 +1,75 @@
+import preprocess
+from preprocess import OMITTED, clean_email_body, estimate_tokens, prepare_ai_input, split_windows
+
+OUTLOOK_FORWARD = """Hi team, see below.
+
+________________________________
+From: Jane Broker <jane@example.com>
+Sent: Monday, October 12, 2026 9:14 AM
+To: Listings <listings@example.com>
+Subject: COPA - 123 Main Street
+
+Property Address: 123 Main Street, San Francisco, CA 94110
+Asking price $2,500,000, 6 units
+
+--
+Jane Broker
+Call 415-555-1212
+Example Realty
+"""
+
+def test_outlook_forward_separator_is_not_a_signature():
+    cleaned = clean_email_body(OUTLOOK_FORWARD)
+    assert 'Property Address: 123 Main Street, San Francisco, CA 94110' in cleaned
+    assert 'Asking price $2,500,000, 6 units' in cleaned
+    # The real signature after "--" is still dropped, except its phone line
+    assert 'Call 415-555-1212' in cleaned
+    assert 'Example Realty' not in cleaned
+
+GMAIL_FORWARD = """FYI
+
+--
+Sam Agent
+Example Realty
+
+---------- Forwarded message ---------
+From: Jane Broker <jane@example.com>
+Date: Mon, Oct 12, 2026 at 9:14 AM
+Subject: COPA - 123 Main Street
+
+Property Address: 123 Main Street, San Francisco, CA 94110
+Asking price $2,500,000, 6 units
+"""
+
+def test_forwarded_message_ends_the_signature_above_it():
+    cleaned = clean_email_body(GMAIL_FORWARD)
+    assert cleaned.startswith('FYI')
+    assert 'Property Address: 123 Main Street, San Francisco, CA 94110' in cleaned
+    assert 'Asking price $2,500,000, 6 units' in cleaned
+    assert 'Example Realty' not in cleaned
+
+def test_quoted_lines_are_kept_without_markers():
+    cleaned = clean_email_body("Price improvement!\n> 123 Main St, 6 units\n>> Asking price $2,500,000")
+    assert cleaned == "Price improvement!\n123 Main St, 6 units\nAsking price $2,500,000"
+
+def test_single_line_longer_than_a_window_is_split():
+    line = 'rent ' * 5000
+    windows = split_windows(line)
+    limit = preprocess.WINDOW_TOKENS * preprocess.CHARS_PER_TOKEN
+    assert len(windows) > 1
+    assert all(len(window) <= limit for window in windows)
+
+def test_oversized_single_line_attachment_is_kept_within_budget():
+    attachment = 'Total # of units 6 Asking price $2,500,000 ' * 2500
+    assert estimate_tokens(attachment) > 12000
+
+    email_text, attachment_texts, (before, after) = prepare_ai_input('See attached.', [attachment], budget=12000)
+
+    assert attachment_texts[0]
+    assert 0.8 * 12000 < after <= 12000
+
+def test_window_larger_than_the_remaining_budget_is_truncated_not_dropped():
+    page = 'Property Address: 1 Main Street, San Francisco, CA 94110\n' + 'x ' * 4000
+    selected = preprocess.select_windows([page], budget=100)
+    assert selected[0].startswith('Property Address: 1 Main Street')
+    assert selected[0].endswith(OMITTED)
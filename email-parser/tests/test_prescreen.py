@@ -0,0 +1,84 @@
+import pytest
+
+import prescreen
+import process_emails
+from benchmarks.benchmark_acroform import FORM_FIELDS, FORM_TEXT, make_fillable_pdf
+from process_emails import COPA_FORM_MARKERS
+
+OTHER_TEXT = "Quarterly newsletter: market update, new listings and open houses this weekend."
+COMPOSITE_FONT = '<< /Type /Font /Subtype /Type0 /BaseFont /NotoSans /Encoding /Identity-H >>'
+# The form's name only appears in the field names, as a form designer might export them
+MARKED_FIELDS = [(name.replace('form1[0]', 'COPA3[0]'), value) for name, value in FORM_FIELDS]
+
+def screen(data):
+    return prescreen.screen_pdf(data, COPA_FORM_MARKERS)[0]
+
+@pytest.mark.parametrize('attachment, verdict', [
+    ({'content_type': 'application/pdf', 'filename': 'copa.pdf'}, prescreen.CANDIDATE),
+    ({'content_type': 'application/octet-stream', 'filename': 'scan'}, prescreen.CANDIDATE),
+    ({'content_type': 'image/png', 'filename': 'COPA3.PDF'}, prescreen.CANDIDATE),
+    ({'content_type': 'application/pdf; name="x"', 'filename': None}, prescreen.CANDIDATE),
+    ({'content_type': 'image/jpeg', 'filename': 'photo.jpg'}, prescreen.NOT_PDF),
+    ({'content_type': 'text/html', 'filename': 'listing.html'}, prescreen.NOT_PDF),
+])
+def test_metadata(attachment, verdict):
+    assert prescreen.screen_attachment(attachment) == verdict
+
+def test_header():
+    assert prescreen.screen_pdf(b'', COPA_FORM_MARKERS) == (prescreen.EMPTY, None)
+    assert prescreen.screen_pdf(b'PK\x03\x04 a zip file', COPA_FORM_MARKERS) == (prescreen.NOT_PDF, None)
+    # Unreadable after the header: fail open
+    assert screen(b'%PDF-1.4\ngarbage') == prescreen.CANDIDATE
+
+def test_no_fonts_means_no_text_layer():
+    assert prescreen.screen_pdf(make_fillable_pdf(FORM_TEXT, [], font=None), COPA_FORM_MARKERS) == \
+        (prescreen.NO_TEXT_LAYER, 1)
+
+def test_marker_scan():
+    assert screen(make_fillable_pdf(FORM_TEXT, [])) == prescreen.CANDIDATE
+    assert screen(make_fillable_pdf(OTHER_TEXT, [])) == prescreen.NO_MARKERS
+    # One marker isn't enough
+    assert screen(make_fillable_pdf(OTHER_TEXT + " Property Address: 1 Main St", [])) == prescreen.NO_MARKERS
+
+def test_unreadable_font_makes_the_scan_inconclusive():
+    assert screen(make_fillable_pdf(OTHER_TEXT, [], font=COMPOSITE_FONT)) == prescreen.CANDIDATE
+
+@pytest.mark.parametrize('data', [
+    make_fillable_pdf(OTHER_TEXT, MARKED_FIELDS),
+    make_fillable_pdf(FORM_TEXT, MARKED_FIELDS, font=None),
+], ids=['markers-in-field-names', 'scanned-with-fields'])
+def test_fillable_forms_are_candidates(data):
+    assert screen(data) == prescreen.CANDIDATE
+
+class EmptyCache:
+    def get_by_path(self, storage_path):
+        return None, None
+
+    def get(self, content_hash):
+        return None
+
+    def put(self, *args, **kwargs):
+        pass
+
+def analyze(monkeypatch, mode, data):
+    monkeypatch.setattr(prescreen, 'PRESCREEN_MODE', mode)
+    monkeypatch.setattr(process_emails, 'download_attachment', lambda storage_path: data)
+    attachment = {'content_type': 'application/pdf', 'filename': 'copa.pdf'}
+    return process_emails.analyze_attachment('email/copa.pdf', EmptyCache(), attachment)
+
+@pytest.mark.parametrize('mode', ['enforce', 'audit', 'off'])
+@pytest.mark.parametrize('data', [
+    make_fillable_pdf(OTHER_TEXT, MARKED_FIELDS),
+    make_fillable_pdf(FORM_TEXT, MARKED_FIELDS, font=None),
+], ids=['markers-in-field-names', 'scanned-with-fields'])
+def test_fillable_forms_are_parsed_in_every_mode(monkeypatch, mode, data):
+    form_data, form_type = analyze(monkeypatch, mode, data)
+    assert form_type == 'copa3'
+    assert form_data['address']['zip_code'] == '94115'
+
+@pytest.mark.parametrize('mode, parsed', [('enforce', False), ('audit', True), ('off', True)])
+def test_rejected_files_are_only_skipped_when_enforcing(monkeypatch, mode, parsed):
+    calls = []
+    monkeypatch.setattr(process_emails, 'parse_copa_form_local', lambda data: calls.append(data) or ({}, None, {}))
+    assert analyze(monkeypatch, mode, make_fillable_pdf(OTHER_TEXT, [])) == ({}, None)
+    assert bool(calls) == parsed
@@ -1,10 +1,48 @@
+"""
+Generate property-data.json from the COPA3 PDFs in a folder.
+
+PDFs are parsed in a process pool. Finished listings are handed straight to a
+geocoding stage: a couple of threads sharing the cached client in geocoding.py,
+whose rate limit keeps Nominatim at 1 request/second however many cores parse.
+Each located listing is appended to a JSONL file as soon as it's ready, in
+folder order, and property-data.json ({"listings": [...]}) is written from that
+file at the end.
+
+Runs are incremental. A manifest (property-data.manifest.json) records each
+PDF's mtime, size, SHA-256 and generated listing. Only new or changed PDFs are
+parsed and geocoded, and removed PDFs drop out of the output. A listing whose
+address couldn't be located (a geocoding miss or error, or no neighborhood
+data) is still written, but the manifest keeps it unlocated, and the next run
+geocodes it again without reparsing the PDF. The manifest and
+property-data.json are replaced atomically, so a reader never sees a half-written
+file. --full ignores the manifest.
+
+Usage:
+    python generate_json.py [FOLDER] [--output property-data.json] [--jsonl PATH]
+        [--manifest PATH] [--full] [--workers N] [--geocode-workers N]
+"""
+import argparse
 import json
 import os
 import random
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'email-parser'))
+
+from attachment_cache import sha256_file
 from process_data import parse_copa3_form, extract_address, get_location_from_address, extract_basic_property_info, extract_seller_info, extract_financial_info, load_sf_neighborhoods, get_neighborhood_from_location
 
+GEOCODE_WORKERS = 2
+# Bump when listing generation changes, so the next run reparses every PDF
+MANIFEST_VERSION = 2
+
 def random_datetime_last_10_days():
     """Generate a random datetime within the last 10 days."""
     now = datetime.now()
@@ -21,6 +59,10 @@ def random_datetime_last_10_days():
     return random_datetime.isoformat()
 
 def process_searchable_COPA3_form(pdf_path):
+  """
+  Parse one COPA3 PDF into a listing, without location or neighborhood.
+  Runs in a pool process. The parsed address is kept under '_address' for the geocoding stage.
+  """
   try:
     cleaned_text = parse_copa3_form(pdf_path)
 
@@ -29,7 +71,6 @@ def process_searchable_COPA3_form(pdf_path):
     seller_info = extract_seller_info(cleaned_text)
     financial_info = extract_financial_info(cleaned_text)
     time_sent_tz = random_datetime_last_10_days()
-    print("generate_json.py: time_sent_tz: ", time_sent_tz)
 
     listing = {
       "time_sent_tz": time_sent_tz,
@@ -74,7 +115,7 @@ def process_searchable_COPA3_form(pdf_path):
   }
 
     if address: 
-      listing["location"] = get_location_from_address(address)
+      listing["_address"] = address
       listing["full_address"] = address.get('full_address', '')
       listing["details"]["address_breakdown"]["street_address"] = address.get('street_address', '')
       listing["details"]["address_breakdown"]["secondary_address"] = address.get('secondary_address', '')
@@ -96,9 +137,6 @@ def process_searchable_COPA3_form(pdf_path):
       listing["asking_price"] = financial_info.get('asking_price', -1)
       listing["details"]["financial_data"] = financial_info
 
-    print("DEBUG - asking_price in listing:", listing.get("asking_price"))  # Add this
-    print("DEBUG - full listing keys:", listing.keys())  # Add this
-
 
   except Exception as e:
     print(f"Error processing {pdf_path}: {e}")
@@ -106,42 +144,198 @@ def process_searchable_COPA3_form(pdf_path):
 
   return listing
 
-# Data folder is local, change to your own path
-def process_all_forms(folder_path="data"):
+def locate_listing(listing, neighborhoods):
+  """
+  Geocoding stage: return (a copy of the parsed listing with location and
+  neighborhood added, located). located is False if the address couldn't be
+  geocoded or placed in a neighborhood, so it's worth trying again next run.
+  """
+  listing = dict(listing)
+  address = listing.pop('_address', None)
+  try:
+    if address:
+      listing["location"] = get_location_from_address(address)
+
+    if listing.get('location') and 'lat' in listing['location']:
+      listing['neighborhood'] = get_neighborhood_from_location(
+        listing['location']['lat'], listing['location']['lng'], neighborhoods
+      )
+      return listing, bool(neighborhoods)
+  except Exception as e:
+    print(f"Error locating {listing['details']['source']['pdf_path']}: {e}")
+    listing.pop('location', None)
+
+  print(f"Skipping neighborhood lookup - invalid location data")
+  listing['neighborhood'] = 'Unknown'
+  # Without an address there is nothing to look up again
+  return listing, not address
 
-  neighborhoods = load_sf_neighborhoods()
-  
-  listings = []
+def find_pdfs(folder_path):
+  return sorted(os.path.join(folder_path, name) for name in os.listdir(folder_path) if name.endswith(".pdf"))
 
+def write_atomically(path, write):
+  """Call write(f) on a temp file next to path, then rename it over path, so readers never see a partial file."""
+  directory = os.path.dirname(os.path.abspath(path))
+  fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
   try:
-    for pdf_file in os.listdir(folder_path):
-      if pdf_file.endswith(".pdf"):
-        full_path = os.path.join(folder_path, pdf_file)
-        print(f"Processing {full_path}...")
-        listing = process_searchable_COPA3_form(full_path)
-
-        if listing and listing.get('location') and 'lat' in listing['location']:
-          listing['neighborhood'] = get_neighborhood_from_location(listing['location']['lat'], listing['location']['lng'], neighborhoods)
-          listings.append(listing)
-        else:
-          if listing:
-            print(f"Skipping neighborhood lookup - invalid location data")
-            listing['neighborhood'] = 'Unknown'
-            listings.append(listing)
+    with os.fdopen(fd, "w") as f:
+      write(f)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+  except BaseException:
+    os.unlink(tmp_path)
+    raise
 
+def write_listings_json(jsonl_path, output_path):
+  """Atomically write {"listings": [...]} from the JSONL file, one listing at a time."""
+  count = 0
+  def write(f):
+    nonlocal count
+    with open(jsonl_path) as lines:
+      f.write('{"listings": [')
+      for line in lines:
+        if line.strip():
+          f.write((",\n" if count else "\n") + line.strip())
+          count += 1
+      f.write("\n]}\n")
+  write_atomically(output_path, write)
+  return count
+
+def load_manifest(manifest_path):
+  """Return the manifest's {pdf path: entry}, or {} if there isn't a usable one."""
+  try:
+    with open(manifest_path) as f:
+      manifest = json.load(f)
+  except (FileNotFoundError, ValueError):
+    return {}
+  if manifest.get("version") != MANIFEST_VERSION:
+    print(f"Manifest {manifest_path} is from another version, regenerating everything")
+    return {}
+  return manifest.get("files", {})
+
+def save_manifest(manifest_path, files):
+  write_atomically(manifest_path, lambda f: json.dump({"version": MANIFEST_VERSION, "files": files}, f))
+
+def plan_files(pdf_paths, manifest):
+  """
+  Match each PDF against the manifest. Unchanged files keep their entry; a file
+  whose mtime or size moved is hashed, and only reparsed if its content changed.
+  Returns (entries, to_parse) where entries maps every current path to its
+  manifest entry (listing None until parsed) and to_parse lists the paths to parse.
+  An entry with located False holds the parsed listing, address included, still to be geocoded.
+  """
+  entries, to_parse = {}, []
+  for pdf_path in pdf_paths:
+    stat = os.stat(pdf_path)
+    signature = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    entry = manifest.get(pdf_path)
+    if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+      entries[pdf_path] = entry
+      continue
+
+    digest = sha256_file(pdf_path)
+    if entry and entry["sha256"] == digest:
+      # Touched or copied, same content
+      entries[pdf_path] = {**entry, **signature}
+      continue
+
+    entries[pdf_path] = {**signature, "sha256": digest, "listing": None, "located": False}
+    to_parse.append(pdf_path)
+  return entries, to_parse
+
+# Data folder is local, change to your own path
+def process_all_forms(folder_path="data", output_path="property-data.json", jsonl_path=None,
+                      workers=None, geocode_workers=GEOCODE_WORKERS, manifest_path=None, full=False):
+  """
+  Regenerate output_path from the PDFs in folder_path. Only PDFs that are new
+  or changed since the manifest was written are parsed (in a process pool) and
+  geocoded (on a separate rate-limited stage), along with listings the last run
+  couldn't locate; pass full=True to redo them all.
+  Every listing is streamed to jsonl_path in folder order. Returns the number of listings written.
+  """
+  jsonl_path = jsonl_path or os.path.splitext(output_path)[0] + ".jsonl"
+  manifest_path = manifest_path or os.path.splitext(output_path)[0] + ".manifest.json"
+
+  try:
+    pdf_paths = find_pdfs(folder_path)
   except FileNotFoundError:
-      print(f"The folder {folder_path} does not exist.")
-  except Exception as e:  
-      print(f"An error occurred accessing the folder: {e}")
+    print(f"The folder {folder_path} does not exist.")
+    return 0
+
+  start = time.perf_counter()
+  manifest = {} if full else load_manifest(manifest_path)
+  entries, to_parse = plan_files(pdf_paths, manifest)
+  reparse = set(to_parse)
+  relocate = {pdf_path for pdf_path in pdf_paths
+              if pdf_path not in reparse and entries[pdf_path]["listing"] and not entries[pdf_path]["located"]}
+  removed = len(set(manifest) - set(entries))
+  print(f"{len(pdf_paths)} PDFs: {len(to_parse)} new or changed, "
+        f"{len(pdf_paths) - len(to_parse)} unchanged ({len(relocate)} to locate again), {removed} removed")
 
-  output = {"listings": listings}
+  written = 0
+  with open(jsonl_path, "w") as out, ExitStack() as stack:
+    if to_parse or relocate:
+      neighborhoods = load_sf_neighborhoods()
+      geocode_pool = stack.enter_context(ThreadPoolExecutor(max_workers=geocode_workers))
+    if to_parse:
+      parse_pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+      parsed = zip(to_parse, parse_pool.map(process_searchable_COPA3_form, to_parse))
 
-  with open("property-data.json", "w") as f:
-    json.dump(output, f, indent=4)
+    def write_ready(pending, block=False):
+      nonlocal written
+      # Written in folder order; a slow geocode only holds back the listings after it
+      while pending and (block or not isinstance(pending[0][1], Future) or pending[0][1].done()):
+        pdf_path, listing, unlocated = pending.popleft()
+        if isinstance(listing, Future):
+          listing, located = listing.result()
+          # Keep the parsed listing, address and all, so the next run can try again
+          entries[pdf_path]["listing"] = listing if located else unlocated
+          entries[pdf_path]["located"] = located
+        if listing:
+          out.write(json.dumps(listing) + "\n")
+          out.flush()
+          written += 1
 
-  return output
+    pending = deque()
+    for pdf_path in pdf_paths:
+      entry = entries[pdf_path]
+      if pdf_path in reparse:
+        parsed_path, listing = next(parsed)
+        print(f"Processed {parsed_path}")
+        # A PDF that doesn't parse stays in the manifest with no listing until it changes
+        pending.append((pdf_path, geocode_pool.submit(locate_listing, listing, neighborhoods) if listing else None,
+                        listing))
+      elif pdf_path in relocate:
+        pending.append((pdf_path, geocode_pool.submit(locate_listing, entry["listing"], neighborhoods),
+                        entry["listing"]))
+      else:
+        pending.append((pdf_path, entry["listing"], None))
+      write_ready(pending)
+    write_ready(pending, block=True)
 
-result = process_all_forms() # Uses default "data" folder
+  write_listings_json(jsonl_path, output_path)
+  save_manifest(manifest_path, entries)
+  print(f"✓ Wrote {written} listings from {len(pdf_paths)} PDFs to {output_path} "
+        f"in {time.perf_counter() - start:.2f}s")
+  return written
+
+def parse_args(argv):
+  parser = argparse.ArgumentParser(description="Generate property-data.json from a folder of COPA3 PDFs")
+  parser.add_argument("folder", nargs="?", default="data", help="Folder of COPA3 PDFs (default: data)")
+  parser.add_argument("--output", default="property-data.json", help="Output JSON file (default: property-data.json)")
+  parser.add_argument("--jsonl", help="Streaming JSONL output (default: the output path with .jsonl)")
+  parser.add_argument("--manifest", help="Manifest of processed PDFs (default: the output path with .manifest.json)")
+  parser.add_argument("--full", action="store_true", help="Reparse every PDF, ignoring the manifest")
+  parser.add_argument("--workers", type=int, default=None, help="PDF parsing processes (default: CPU count)")
+  parser.add_argument("--geocode-workers", type=int, default=GEOCODE_WORKERS,
+                      help=f"Geocoding threads; requests stay rate-limited (default: {GEOCODE_WORKERS})")
+  return parser.parse_args(argv)
+
+def main():
+  args = parse_args(sys.argv[1:])
+  process_all_forms(args.folder, args.output, args.jsonl, args.workers, args.geocode_workers,
+                    args.manifest, args.full)
 
 '''
 listings = [
@@ -204,4 +398,6 @@ listings = [
   }
 ]
 
-'''
\ No newline at end of file
+'''
+if __name__ == "__main__":
+  main()